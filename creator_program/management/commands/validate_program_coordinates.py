@@ -0,0 +1,84 @@
+import csv
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from creator_program.models import Program
+from creator_project.geo_utils import get_province_index, is_point_in_province, NUMPY_AVAILABLE
+
+
+class Command(BaseCommand):
+    help = 'Check every program location against its declared province and report mismatches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--province', help='Only check programs in this province')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Number of provinces checked in parallel')
+        parser.add_argument('--output', help='Write the mismatch report to this CSV file')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        programs = Program.objects.filter(longitude__isnull=False, latitude__isnull=False)
+        if options['province']:
+            programs = programs.filter(province=options['province'])
+
+        # Group locations by declared province so each polygon is tested once per batch
+        groups = {}
+        for row in programs.values_list('id', 'program_id', 'title', 'province', 'longitude', 'latitude'):
+            groups.setdefault(row[3], []).append(row)
+
+        if not groups:
+            self.stdout.write(self.style.WARNING('No programs with coordinates found'))
+            return
+
+        index = get_province_index()
+        if not index.provinces:
+            self.stdout.write(self.style.WARNING(
+                'No province polygons loaded; falling back to distance-based checks'))
+
+        workers = max(1, options['workers'])
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(lambda item: self._check_group(index, *item), groups.items()))
+
+        mismatches = [row for group in results for row in group]
+
+        # Detect the actual province for all mismatched points in one pass
+        detected = index.find_provinces(
+            [float(row[4]) for row in mismatches],
+            [float(row[5]) for row in mismatches],
+        ) if mismatches else []
+
+        report = []
+        for row, detected_province in zip(mismatches, detected):
+            pk, program_id, title, province, longitude, latitude = row
+            report.append([program_id, title, province, detected_province or '-', longitude, latitude])
+            self.stdout.write(self.style.ERROR(
+                f'Program "{title}" (ID: {program_id}) declared in {province} '
+                f'but located in {detected_province or "unknown"} ({longitude}, {latitude})'
+            ))
+
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8-sig') as f:
+                writer = csv.writer(f)
+                writer.writerow(['program_id', 'title', 'declared_province', 'detected_province',
+                                 'longitude', 'latitude'])
+                writer.writerows(report)
+            self.stdout.write(f'Mismatch report written to {options["output"]}')
+
+        checked = sum(len(rows) for rows in groups.values())
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} programs in {elapsed:.2f}s. Found {len(report)} mismatches.'
+        ))
+
+    def _check_group(self, index, province, rows):
+        """Return the rows whose coordinates fall outside their declared province."""
+        if NUMPY_AVAILABLE and province in index:
+            inside = index.provinces[province].contains_many(
+                [float(row[4]) for row in rows],
+                [float(row[5]) for row in rows],
+            )
+            return [row for row, ok in zip(rows, inside) if not ok]
+
+        return [row for row in rows if not is_point_in_province(row[4], row[5], province)[0]]
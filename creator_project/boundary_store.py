@@ -0,0 +1,135 @@
+"""
+Compact binary storage for province boundaries.
+
+File layout (little endian):
+    magic       4 bytes  b'PRVB'
+    version     uint32
+    index_size  uint32   length of the JSON index in bytes
+    index       JSON     {"provinces": [[name, [[offset, count], ...]], ...]}
+    padding     up to a 4 byte boundary
+    data        float32  interleaved lon, lat pairs for every ring
+
+Ring offsets and counts are in points. The data block is memory-mapped,
+so opening the file is cheap and only the rings that are used get read.
+ring_arrays() hands out the rings as views of the mapped data (NumPy
+arrays when NumPy is installed), so no Python float objects are created.
+"""
+import os
+import json
+import mmap
+import struct
+import sys
+from array import array
+from django.conf import settings
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+MAGIC = b'PRVB'
+VERSION = 1
+HEADER = struct.Struct('<4sII')
+
+BINARY_PATH = os.path.join(settings.BASE_DIR, 'static', 'mapfiles', 'province_boundaries.bin')
+
+
+def write_boundaries(boundaries, path=BINARY_PATH):
+    """
+    Write {province: [ring, ...]} to the binary format.
+    Returns the number of bytes written.
+    """
+    coordinates = array('f')
+    provinces = []
+    offset = 0
+    for name, rings in boundaries.items():
+        ring_index = []
+        for ring in rings:
+            for lon, lat in ring:
+                coordinates.append(lon)
+                coordinates.append(lat)
+            ring_index.append([offset, len(ring)])
+            offset += len(ring)
+        provinces.append([name, ring_index])
+
+    if coordinates.itemsize != 4:
+        raise ValueError("float32 arrays are not supported on this platform.")
+    if sys.byteorder == 'big':
+        coordinates.byteswap()
+
+    index = json.dumps({'provinces': provinces}, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    padding = (-(HEADER.size + len(index))) % 4
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(index)))
+        f.write(index)
+        f.write(b'\0' * padding)
+        coordinates.tofile(f)
+    os.replace(tmp_path, path)
+    return HEADER.size + len(index) + padding + len(coordinates) * 4
+
+
+class BoundaryFile:
+    """Read-only, memory-mapped view of a boundary file."""
+
+    def __init__(self, path=BINARY_PATH):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, index_size = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a version {VERSION} province boundary file.")
+
+        index_end = HEADER.size + index_size
+        index = json.loads(self._mmap[HEADER.size:index_end].decode('utf-8'))
+        self.ring_index = {name: rings for name, rings in index['provinces']}
+
+        self._data_start = index_end + (-index_end) % 4
+        self._floats = memoryview(self._mmap)[self._data_start:].cast('f')
+
+    def __len__(self):
+        return len(self.ring_index)
+
+    def names(self):
+        return list(self.ring_index)
+
+    def rings(self, name):
+        """Return the rings of a province as lists of [lon, lat] pairs."""
+        rings = []
+        for offset, count in self.ring_index.get(name, []):
+            flat = array('f', self._floats[offset * 2:(offset + count) * 2])
+            if sys.byteorder == 'big':
+                flat.byteswap()
+            rings.append([[flat[i], flat[i + 1]] for i in range(0, len(flat), 2)])
+        return rings
+
+    def ring_arrays(self, name):
+        """
+        Return the rings of a province without copying them: (n, 2) float32
+        arrays of lon, lat when NumPy is available, otherwise flat
+        lon, lat, lon, lat ... sequences.
+        """
+        rings = []
+        for offset, count in self.ring_index.get(name, []):
+            if NUMPY_AVAILABLE:
+                rings.append(np.frombuffer(self._mmap, dtype='<f4', count=count * 2,
+                                           offset=self._data_start + offset * 8).reshape(-1, 2))
+            elif sys.byteorder == 'big':
+                flat = array('f', self._floats[offset * 2:(offset + count) * 2])
+                flat.byteswap()
+                rings.append(flat)
+            else:
+                rings.append(self._floats[offset * 2:(offset + count) * 2])
+        return rings
+
+    def as_dict(self):
+        """{province: rings as [lon, lat] lists}, e.g. for writing JSON."""
+        return {name: self.rings(name) for name in self.ring_index}
+
+    def as_arrays(self):
+        """{province: rings from ring_arrays()}, for building a ProvinceIndex."""
+        return {name: self.ring_arrays(name) for name in self.ring_index}
@@ -1,22 +1,18 @@
 import os
-import json
+import logging
+import threading
+from array import array
 from math import radians, cos, sin, asin, sqrt
-from django.conf import settings
-from .read_shapefile import extract_province_boundaries
+from .boundary_store import BoundaryFile, BINARY_PATH
 
-# Try to load province boundaries from the JSON file
-PROVINCE_BOUNDARIES = {}
-json_path = os.path.join(settings.BASE_DIR, 'static', 'mapfiles', 'province_boundaries.json')
 try:
-    if os.path.exists(json_path):
-        with open(json_path, 'r', encoding='utf-8') as f:
-            PROVINCE_BOUNDARIES = json.load(f)
-            print(f"Loaded boundaries for {len(PROVINCE_BOUNDARIES)} provinces.")
-    else:
-        # If the JSON file doesn't exist, extract boundaries from shapefile
-        PROVINCE_BOUNDARIES = extract_province_boundaries()
-except Exception as e:
-    print(f"Error loading province boundaries: {str(e)}")
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
 
 # Province centers for distance-based validation (fallback)
 PROVINCE_CENTERS = {
@@ -53,6 +49,11 @@ PROVINCE_CENTERS = {
     'کیش': [54.01, 26.52],
 }
 
+# Provinces without their own polygon in the shapefile that lie inside another one
+PROVINCE_PARENTS = {
+    'کیش': 'هرمزگان',
+}
+
 # Function to calculate distance between two points using Haversine formula
 def haversine(lon1, lat1, lon2, lat2):
     # Convert decimal degrees to radians
@@ -89,6 +90,277 @@ def is_point_in_polygon(point, polygon):
     
     return inside
 
+class ProvincePolygon:
+    """
+    Preprocessed polygon for a single province.
+
+    Every ring (outer parts, islands and holes) contributes its edges to a
+    set of horizontal bands over the province bounding box. A lookup only
+    ray casts against the edges of the band containing the point, and the
+    even-odd rule over all rings handles multi-part shapes and holes.
+    """
+
+    EDGES_PER_BAND = 8
+
+    def __init__(self, name, rings):
+        self.name = name
+        self.ring_bboxes = []
+        self._bands = None
+        self._edge_arrays = None
+        # Rings come as NumPy arrays or flat sequences straight from the
+        # boundary file, or as [lon, lat] lists from the shapefile
+        edges = self._edges_from_arrays(rings) if NUMPY_AVAILABLE else self._edges_from_sequences(rings)
+
+        if not self.ring_bboxes:
+            self.bbox = None
+            self.band_count = 0
+            return
+
+        self.bbox = (
+            min(b[0] for b in self.ring_bboxes),
+            min(b[1] for b in self.ring_bboxes),
+            max(b[2] for b in self.ring_bboxes),
+            max(b[3] for b in self.ring_bboxes),
+        )
+        self.edge_count = len(edges)
+
+        # Bucket edges into uniform horizontal bands
+        self.band_count = max(1, self.edge_count // self.EDGES_PER_BAND)
+        self.min_y = self.bbox[1]
+        self.band_height = ((self.bbox[3] - self.bbox[1]) / self.band_count) or 1.0
+        if NUMPY_AVAILABLE:
+            self._edge_arrays = self._bucket_arrays(edges)
+        else:
+            self._bands = [[] for _ in range(self.band_count)]
+            for edge in edges:
+                low = self._band_for(min(edge[1], edge[3]))
+                high = self._band_for(max(edge[1], edge[3]))
+                for band in range(low, high + 1):
+                    self._bands[band].append(edge)
+
+    def _edges_from_arrays(self, rings):
+        """Edges of all rings as one (n, 4) array of x1, y1, x2, y2, skipping horizontal ones."""
+        blocks = []
+        for ring in rings:
+            coords = np.asarray(ring, dtype=np.float64).reshape(-1, 2)
+            if len(coords) < 3:
+                continue
+            x1, y1 = coords[:, 0], coords[:, 1]
+            self.ring_bboxes.append((float(x1.min()), float(y1.min()), float(x1.max()), float(y1.max())))
+            x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+            keep = y1 != y2
+            blocks.append(np.column_stack((x1[keep], y1[keep], x2[keep], y2[keep])))
+        return np.concatenate(blocks) if blocks else np.empty((0, 4))
+
+    def _edges_from_sequences(self, rings):
+        """Edges of all rings as (x1, y1, x2, y2) tuples, skipping horizontal ones."""
+        edges = []
+        for ring in rings:
+            if isinstance(ring, (memoryview, array)):
+                xs, ys = list(ring[0::2]), list(ring[1::2])
+            else:
+                xs, ys = [p[0] for p in ring], [p[1] for p in ring]
+            n = len(xs)
+            if n < 3:
+                continue
+            self.ring_bboxes.append((min(xs), min(ys), max(xs), max(ys)))
+            for i in range(n):
+                x1, y1 = xs[i], ys[i]
+                x2, y2 = xs[(i + 1) % n], ys[(i + 1) % n]
+                if y1 != y2:
+                    edges.append((x1, y1, x2, y2))
+        return edges
+
+    def _bucket_arrays(self, edges):
+        """Split the edge array into one (4, k) array per band; an edge is in every band it spans."""
+        low = self._bands_for(np.minimum(edges[:, 1], edges[:, 3]))
+        high = self._bands_for(np.maximum(edges[:, 1], edges[:, 3]))
+        spans = high - low + 1
+        rows = np.repeat(np.arange(len(edges)), spans)
+        bands = np.repeat(low, spans) + np.arange(rows.size) - np.repeat(np.cumsum(spans) - spans, spans)
+        order = np.argsort(bands, kind='stable')
+        rows, bands = rows[order], bands[order]
+        splits = np.searchsorted(bands, np.arange(1, self.band_count))
+        return [block.T for block in np.split(edges[rows], splits)]
+
+    @property
+    def bands(self):
+        """Edges of each band as [x1, y1, x2, y2] rows, for single point lookups."""
+        if self._bands is None:
+            self._bands = [block.T.tolist() for block in self._edge_arrays] if self.bbox else []
+        return self._bands
+
+    def _band_for(self, y):
+        band = int((y - self.min_y) / self.band_height)
+        return min(max(band, 0), self.band_count - 1)
+
+    def _bands_for(self, ys):
+        bands = ((ys - self.min_y) / self.band_height).astype(np.int64)
+        return np.clip(bands, 0, self.band_count - 1)
+
+    def contains(self, longitude, latitude):
+        """Return True if the point lies inside the province."""
+        if self.bbox is None:
+            return False
+        min_x, min_y, max_x, max_y = self.bbox
+        if not (min_x <= longitude <= max_x and min_y <= latitude <= max_y):
+            return False
+        if not any(b[0] <= longitude <= b[2] and b[1] <= latitude <= b[3]
+                   for b in self.ring_bboxes):
+            return False
+
+        inside = False
+        for x1, y1, x2, y2 in self.bands[self._band_for(latitude)]:
+            if (y1 > latitude) != (y2 > latitude):
+                xinters = x1 + (latitude - y1) * (x2 - x1) / (y2 - y1)
+                if longitude < xinters:
+                    inside = not inside
+        return inside
+
+    def contains_many(self, longitudes, latitudes):
+        """
+        Vectorized point-in-polygon test over NumPy arrays.
+        Points are grouped by band so each group is only tested against
+        the edges of its own band. Returns one boolean per point.
+        """
+        xs = np.asarray(longitudes, dtype=np.float64)
+        ys = np.asarray(latitudes, dtype=np.float64)
+        result = np.zeros(xs.shape, dtype=bool)
+        if self.bbox is None or xs.size == 0:
+            return result
+
+        min_x, min_y, max_x, max_y = self.bbox
+        candidates = np.nonzero((xs >= min_x) & (xs <= max_x) & (ys >= min_y) & (ys <= max_y))[0]
+        if candidates.size == 0:
+            return result
+
+        if self._edge_arrays is None:
+            self._edge_arrays = [
+                np.array(band, dtype=np.float64).reshape(-1, 4).T for band in self.bands
+            ]
+
+        band_ids = self._bands_for(ys[candidates])
+        order = np.argsort(band_ids, kind='stable')
+        candidates = candidates[order]
+        band_ids = band_ids[order]
+        bands, starts = np.unique(band_ids, return_index=True)
+        ends = np.append(starts[1:], band_ids.size)
+
+        for band, start, end in zip(bands, starts, ends):
+            x1, y1, x2, y2 = self._edge_arrays[band]
+            if x1.size == 0:
+                continue
+            block = candidates[start:end]
+            px = xs[block][:, None]
+            py = ys[block][:, None]
+            crosses = (y1 > py) != (y2 > py)
+            crosses &= px < x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+            result[block] = (np.count_nonzero(crosses, axis=1) % 2) == 1
+        return result
+
+
+class ProvinceIndex:
+    """
+    Spatial index over all province polygons.
+
+    A coarse uniform grid maps each cell to the provinces whose bounding
+    box overlaps it, so reverse lookups ("which province contains this
+    point") only test a couple of candidate polygons.
+    """
+
+    CELL_SIZE = 0.5  # degrees
+
+    def __init__(self, boundaries):
+        self.provinces = {}
+        self.grid = {}
+        for name, rings in boundaries.items():
+            polygon = ProvincePolygon(name, rings)
+            if polygon.bbox is None:
+                continue
+            self.provinces[name] = polygon
+            min_x, min_y, max_x, max_y = polygon.bbox
+            for cx in range(self._cell(min_x), self._cell(max_x) + 1):
+                for cy in range(self._cell(min_y), self._cell(max_y) + 1):
+                    self.grid.setdefault((cx, cy), []).append(polygon)
+
+    def _cell(self, value):
+        return int(value // self.CELL_SIZE)
+
+    def __contains__(self, province_name):
+        return province_name in self.provinces
+
+    def contains(self, province_name, longitude, latitude):
+        """Return True if the point lies inside the named province."""
+        polygon = self.provinces.get(province_name)
+        return polygon is not None and polygon.contains(longitude, latitude)
+
+    def find_province(self, longitude, latitude):
+        """Return the name of the province containing the point, or None."""
+        candidates = self.grid.get((self._cell(longitude), self._cell(latitude)), [])
+        for polygon in candidates:
+            if polygon.contains(longitude, latitude):
+                return polygon.name
+        return None
+
+    def find_provinces(self, longitudes, latitudes):
+        """
+        Reverse lookup for many points at once.
+        Returns a list with the containing province name (or None) per point.
+        """
+        if not NUMPY_AVAILABLE:
+            return [self.find_province(float(x), float(y)) for x, y in zip(longitudes, latitudes)]
+
+        xs = np.asarray(longitudes, dtype=np.float64)
+        ys = np.asarray(latitudes, dtype=np.float64)
+        found = [None] * xs.size
+        pending = np.ones(xs.shape, dtype=bool)
+        for name, polygon in self.provinces.items():
+            if not pending.any():
+                break
+            indices = np.nonzero(pending)[0]
+            inside = polygon.contains_many(xs[indices], ys[indices])
+            for i in indices[inside]:
+                found[i] = name
+            pending[indices[inside]] = False
+        return found
+
+
+_province_index = None
+_province_index_lock = threading.Lock()
+
+def load_province_boundaries():
+    """
+    Load province rings from the precompiled binary file.
+    Falls back to parsing the shapefile when the file has not been built
+    yet (see the build_province_boundaries command).
+    """
+    try:
+        if os.path.exists(BINARY_PATH):
+            return BoundaryFile(BINARY_PATH).as_arrays()
+        logger.warning("%s not found, reading province boundaries from the shapefile. "
+                       "Run 'manage.py build_province_boundaries' to speed this up.", BINARY_PATH)
+        from .read_shapefile import read_province_rings
+        return read_province_rings()
+    except Exception as e:
+        logger.error("Error loading province boundaries: %s", e)
+        return {}
+
+def get_province_index():
+    """Build the province index on first use and reuse it afterwards."""
+    global _province_index
+    if _province_index is None:
+        with _province_index_lock:
+            if _province_index is None:
+                _province_index = ProvinceIndex(load_province_boundaries())
+    return _province_index
+
+def detect_province(longitude, latitude):
+    """Return the province containing the given coordinates, or None."""
+    try:
+        return get_province_index().find_province(float(longitude), float(latitude))
+    except (TypeError, ValueError):
+        return None
+
 # Check if coordinates are in the specified province
 def is_point_in_province(longitude, latitude, province_name):
     try:
@@ -110,14 +382,19 @@ def is_point_in_province(longitude, latitude, province_name):
         province_key = province_name
         
         # Check if we have the polygon data for this province
-        if province_key in PROVINCE_BOUNDARIES:
-            polygon = PROVINCE_BOUNDARIES[province_key]
-            if is_point_in_polygon((longitude, latitude), polygon):
+        province_index = get_province_index()
+        if province_key in province_index:
+            if province_index.contains(province_key, longitude, latitude):
                 return True, "مختصات در محدوده استان تأیید شد."
             else:
                 return False, "مختصات وارد شده در محدوده استان انتخاب شده قرار ندارد."
         
-        # Fallback to distance-based validation if we don't have polygon data
+        # No polygon for this province, see which province the point falls in
+        detected = province_index.find_province(longitude, latitude)
+        if detected is not None and detected != PROVINCE_PARENTS.get(province_name):
+            return False, f"مختصات وارد شده در محدوده استان {detected} قرار دارد."
+        
+        # Fallback to distance-based validation for provinces missing from the shapefile
         if province_name in PROVINCE_CENTERS:
             # Calculate distance to province center
             center_lon, center_lat = PROVINCE_CENTERS[province_name]
@@ -0,0 +1,35 @@
+import os
+import time
+from django.core.management.base import BaseCommand, CommandError
+from creator_project.boundary_store import BoundaryFile, BINARY_PATH
+from creator_project.map_boundaries import DEFAULT_LEVELS, OUTPUT_DIR, build_boundary_levels
+from creator_project.read_shapefile import read_province_rings
+
+
+class Command(BaseCommand):
+    help = 'Build simplified, quantized province outlines for the map at several levels of detail'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output-dir', default=OUTPUT_DIR, help='Directory for the generated files')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if os.path.exists(BINARY_PATH):
+            boundaries = BoundaryFile(BINARY_PATH).as_dict()
+        else:
+            boundaries = read_province_rings()
+        if not boundaries:
+            raise CommandError('No province boundaries available')
+
+        source_points = sum(len(ring) for rings in boundaries.values() for ring in rings)
+        manifest = build_boundary_levels(boundaries, DEFAULT_LEVELS, options['output_dir'])
+
+        for level in manifest['levels']:
+            self.stdout.write(
+                f"{level['name']}: tolerance {level['tolerance']}, zoom >= {level['min_zoom']}, "
+                f"{level['size'] / 1024:.1f} KB -> {level['file']}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Built {len(manifest["levels"])} levels from {source_points} points '
+            f'in {time.monotonic() - started:.2f}s. Run collectstatic to publish them.'
+        ))
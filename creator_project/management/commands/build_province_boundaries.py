@@ -0,0 +1,38 @@
+import os
+import time
+from django.core.management.base import BaseCommand, CommandError
+from creator_project.boundary_store import BoundaryFile, BINARY_PATH, write_boundaries
+from creator_project.read_shapefile import SHAPEFILE_PATH, read_province_rings
+
+
+class Command(BaseCommand):
+    help = 'Compile province boundaries from the shapefile into the compact binary format used by geo_utils'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=SHAPEFILE_PATH, help='Path to province.shp')
+        parser.add_argument('--output', default=BINARY_PATH, help='Path of the binary file to write')
+
+    def handle(self, *args, **options):
+        source = options['source']
+        output = options['output']
+        if not os.path.exists(source):
+            raise CommandError(f'Shapefile not found: {source}')
+
+        started = time.monotonic()
+        boundaries = read_province_rings(source)
+        if not boundaries:
+            raise CommandError('No province polygons found in the shapefile')
+
+        size = write_boundaries(boundaries, output)
+
+        # Read the file back to make sure it is usable
+        stored = BoundaryFile(output)
+        if sorted(stored.names()) != sorted(boundaries):
+            raise CommandError('Written boundary file does not match the shapefile')
+
+        ring_count = sum(len(rings) for rings in boundaries.values())
+        point_count = sum(len(ring) for rings in boundaries.values() for ring in rings)
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {len(boundaries)} provinces, {ring_count} rings, {point_count} points '
+            f'({size / 1024:.1f} KB) to {output} in {time.monotonic() - started:.2f}s'
+        ))
@@ -0,0 +1,209 @@
+"""
+Simplified, quantized province outlines for the map frontend.
+
+Each level of detail is a TopoJSON topology whose arcs are simplified with
+Douglas-Peucker and delta-encoded on an integer grid. Files are written as
+static assets named after their content hash, and a small manifest maps
+levels to files and zoom ranges.
+"""
+import os
+import json
+import hashlib
+from django.conf import settings
+from django.templatetags.static import static
+
+OUTPUT_DIR = os.path.join(settings.BASE_DIR, 'static', 'mapfiles', 'boundaries')
+MANIFEST_PATH = os.path.join(OUTPUT_DIR, 'manifest.json')
+
+# (name, tolerance in degrees, quantization grid size, lowest zoom it is used at)
+DEFAULT_LEVELS = [
+    ('low', 0.02, 10000, 0),
+    ('medium', 0.005, 50000, 7),
+    ('high', 0.001, 200000, 9),
+]
+
+
+def douglas_peucker(points, tolerance):
+    """Simplify a polyline with the Douglas-Peucker algorithm (iterative)."""
+    if len(points) < 3:
+        return list(points)
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    tolerance_sq = tolerance * tolerance
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        ax, ay = points[start]
+        bx, by = points[end]
+        dx, dy = bx - ax, by - ay
+        length_sq = dx * dx + dy * dy
+
+        max_dist, index = -1.0, None
+        for i in range(start + 1, end):
+            px, py = points[i]
+            if length_sq == 0:
+                dist = (px - ax) ** 2 + (py - ay) ** 2
+            else:
+                cross = dx * (py - ay) - dy * (px - ax)
+                dist = cross * cross / length_sq
+            if dist > max_dist:
+                max_dist, index = dist, i
+
+        if index is not None and max_dist > tolerance_sq:
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+
+    return [p for p, k in zip(points, keep) if k]
+
+
+def simplify_ring(ring, tolerance):
+    """
+    Simplify a closed ring. The ring is split at its farthest point from the
+    start so both halves keep a stable anchor. Returns None when the ring
+    collapses below a triangle.
+    """
+    points = list(ring)
+    if points[0] == points[-1]:
+        points = points[:-1]
+    if len(points) < 3:
+        return None
+
+    x0, y0 = points[0]
+    split = max(range(len(points)), key=lambda i: (points[i][0] - x0) ** 2 + (points[i][1] - y0) ** 2)
+    first = douglas_peucker(points[:split + 1], tolerance)
+    second = douglas_peucker(points[split:] + [points[0]], tolerance)
+    simplified = first[:-1] + second
+    if len(simplified) < 4:
+        return None
+    return simplified
+
+
+def signed_area(ring):
+    """Shoelace area; negative for clockwise rings."""
+    area = 0.0
+    for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+        area += x1 * y2 - x2 * y1
+    return area / 2
+
+
+def build_topology(boundaries, tolerance, quantization):
+    """
+    Build a TopoJSON topology with one arc per simplified ring.
+    Shapefile outer rings are clockwise and holes counter-clockwise, so each
+    clockwise ring starts a new polygon and the others are added as holes.
+    """
+    simplified = {}
+    for name, rings in boundaries.items():
+        kept = [r for r in (simplify_ring(ring, tolerance) for ring in rings) if r]
+        if kept:
+            simplified[name] = kept
+
+    all_points = [p for rings in simplified.values() for ring in rings for p in ring]
+    min_x = min(p[0] for p in all_points)
+    min_y = min(p[1] for p in all_points)
+    max_x = max(p[0] for p in all_points)
+    max_y = max(p[1] for p in all_points)
+    scale_x = (max_x - min_x) / (quantization - 1) or 1.0
+    scale_y = (max_y - min_y) / (quantization - 1) or 1.0
+
+    arcs = []
+    geometries = []
+    for name, rings in simplified.items():
+        polygons = []
+        for ring in rings:
+            quantized = []
+            for x, y in ring:
+                q = (round((x - min_x) / scale_x), round((y - min_y) / scale_y))
+                if not quantized or quantized[-1] != q:
+                    quantized.append(q)
+            if len(quantized) < 4:
+                continue
+
+            # Delta-encode the arc relative to the previous point
+            arc = [list(quantized[0])]
+            for (px, py), (x, y) in zip(quantized, quantized[1:]):
+                arc.append([x - px, y - py])
+            arcs.append(arc)
+            arc_ref = [len(arcs) - 1]
+
+            if signed_area(ring) < 0 or not polygons:
+                polygons.append([arc_ref])
+            else:
+                polygons[-1].append(arc_ref)
+
+        if polygons:
+            geometries.append({
+                'type': 'MultiPolygon',
+                'arcs': polygons,
+                'properties': {'name': name},
+            })
+
+    return {
+        'type': 'Topology',
+        'transform': {'scale': [scale_x, scale_y], 'translate': [min_x, min_y]},
+        'objects': {'provinces': {'type': 'GeometryCollection', 'geometries': geometries}},
+        'arcs': arcs,
+    }
+
+
+def build_boundary_levels(boundaries, levels=DEFAULT_LEVELS, output_dir=OUTPUT_DIR):
+    """
+    Write one content-hashed TopoJSON file per level and the manifest.
+    Files from previous builds are removed. Returns the manifest.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = {'levels': []}
+    written = set()
+    for name, tolerance, quantization, min_zoom in levels:
+        topology = build_topology(boundaries, tolerance, quantization)
+        content = json.dumps(topology, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        digest = hashlib.sha256(content).hexdigest()[:12]
+        filename = f'province-{name}.{digest}.json'
+        with open(os.path.join(output_dir, filename), 'wb') as f:
+            f.write(content)
+        written.add(filename)
+        manifest['levels'].append({
+            'name': name,
+            'tolerance': tolerance,
+            'min_zoom': min_zoom,
+            'file': filename,
+            'size': len(content),
+        })
+
+    for filename in os.listdir(output_dir):
+        if filename.startswith('province-') and filename.endswith('.json') and filename not in written:
+            os.remove(os.path.join(output_dir, filename))
+
+    with open(os.path.join(output_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+_manifest_cache = {'mtime': None, 'levels': []}
+
+def get_boundary_levels():
+    """
+    Return the levels of detail for templates as
+    [{'name', 'min_zoom', 'url'}], lowest zoom first.
+    The manifest is re-read only when it changes on disk.
+    """
+    try:
+        mtime = os.path.getmtime(MANIFEST_PATH)
+    except OSError:
+        return []
+
+    if _manifest_cache['mtime'] != mtime:
+        with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        _manifest_cache['levels'] = sorted([
+            {
+                'name': level['name'],
+                'min_zoom': level['min_zoom'],
+                'url': static(f"mapfiles/boundaries/{level['file']}"),
+            }
+            for level in manifest.get('levels', [])
+        ], key=lambda level: level['min_zoom'])
+        _manifest_cache['mtime'] = mtime
+    return _manifest_cache['levels']
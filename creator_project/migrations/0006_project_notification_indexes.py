@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("creator_project", "0005_project_site_area_project_wall_length"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="project",
+            index=models.Index(fields=["is_submitted", "updated_at"], name="project_submitted_upd_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="project",
+            index=models.Index(
+                fields=["is_submitted", "is_expert_approved", "created_at"], name="project_review_wait_idx"
+            ),
+        ),
+    ]
@@ -128,7 +128,12 @@ class Project(models.Model):
         verbose_name = "پروژه"
         verbose_name_plural = "پروژه‌ها"
         ordering = ['-created_at']
-    
+        indexes = [
+            # Candidate selection of the automated SMS rules
+            models.Index(fields=['is_submitted', 'updated_at'], name='project_submitted_upd_idx'),
+            models.Index(fields=['is_submitted', 'is_expert_approved', 'created_at'], name='project_review_wait_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.project_id})"
     
@@ -941,7 +946,9 @@ def send_sms_on_project_rejection_comment(sender, instance, created, **kwargs):
             logger = logging.getLogger(__name__)
             
             from notifications_sms.models import SMSSettings
-            from notifications_sms.utils import IPPanelSMSSender, get_default_template
+            from notifications_sms.outbox import enqueue_sms
+            from notifications_sms.utils import get_default_template
+            from notifications_sms.templating import render as render_template
             from django.db import transaction
             
             logger.info(f"Project rejection comment created for project: {instance.project.name}")
@@ -961,7 +968,7 @@ def send_sms_on_project_rejection_comment(sender, instance, created, **kwargs):
                 logger.warning(f"Creator has no phone number for project: {project.name}")
                 return
             
-            logger.info(f"Sending rejection SMS to {creator.phone_number} for project: {project.name}")
+            logger.info(f"Queueing rejection SMS to {creator.phone_number} for project: {project.name}")
             
             # Get the PROJECT_REJECTED template
             template = get_default_template('PROJECT_REJECTED')
@@ -985,51 +992,41 @@ def send_sms_on_project_rejection_comment(sender, instance, created, **kwargs):
                         'project_id': project.project_id or str(project.id)
                     }
                     
-                    # Replace variables in template content
-                    for var, value in context_vars.items():
-                        message = message.replace(f'{{{var}}}', str(value))
+                    # Fill the placeholders with the compiled template
+                    message = render_template(template, context_vars)
             else:
                 # Fallback message
                 logger.warning("No PROJECT_REJECTED template found, using fallback message")
                 message = f"با سلام وعرض ادب خدمت همکار گرامی به دلیل زیر پروژه نیازمند اصلاح است: {instance.comment}"
             
-            logger.info(f"SMS message to send: {message}")
-            
-            # Send SMS using transaction to ensure atomicity
+            # Queued with the comment; the sms_dispatcher command sends it once it is committed
             with transaction.atomic():
-                result = IPPanelSMSSender.send_sms(
-                    recipient_number=creator.phone_number,
-                    message=message,
+                log = enqueue_sms(
+                    creator.phone_number,
+                    message,
                     sender_user=instance.expert,
                     recipient_user=creator,
                     template=template
                 )
                 
-                logger.info(f"SMS send result: {result}")
-                
                 # Also create entry in old SMS log system for compatibility with "گزارش پیامک‌ها" dashboard
                 from notifications.models import SMSLog as OldSMSLog
                 try:
-                    old_log_status = 'sent' if result.get('status') == 'OK' else 'failed'
-                    old_sms_log = OldSMSLog.objects.create(
-                        recipient=creator,
-                        message=message,
-                        project_name=project.name,
-                        project_id=project.project_id or str(project.id),
-                        province=project.province,
-                        status=old_log_status,
-                        message_id=result.get('message_id', ''),
-                        error_message=result.get('message', '') if result.get('status') != 'OK' else ''
-                    )
+                    with transaction.atomic():
+                        old_sms_log = OldSMSLog.objects.create(
+                            recipient=creator,
+                            message=message,
+                            project_name=project.name,
+                            project_id=project.project_id or str(project.id),
+                            province=project.province,
+                            status='pending',
+                        )
                     logger.info(f"Created old SMS log entry: {old_sms_log.id}")
                 except Exception as old_log_error:
                     # Don't let old log creation fail the main process
                     logger.warning(f"Failed to create old SMS log: {old_log_error}")
-                
-                if result.get('status') == 'OK':
-                    logger.info(f"SMS sent successfully to {creator.phone_number} for project rejection")
-                else:
-                    logger.error(f"Failed to send SMS: {result.get('message', 'Unknown error')}")
+            
+            logger.info(f"Rejection SMS queued for {creator.phone_number} (log {log.id})")
             
         except Exception as e:
             # Log the error but don't raise it to avoid breaking the rejection process
@@ -1180,16 +1177,13 @@ class FundingRequest(models.Model):
         
         # Send SMS notification to project creator
         try:
-            from notifications_sms.utils import IPPanelSMSSender
+            from notifications_sms.outbox import enqueue_sms
             from notifications_sms.models import SMSTemplate
+            from notifications_sms.templating import get_default_template, render as render_template
             from django.utils import timezone as tz
-            from django.db import transaction
             
             # Get the default template for funding request approval
-            template = SMSTemplate.objects.filter(
-                type=SMSTemplate.FUNDING_REQUEST_APPROVED,
-                is_default=True
-            ).first()
+            template = get_default_template(SMSTemplate.FUNDING_REQUEST_APPROVED)
             
             if template and self.created_by.phone_number:
                 # Prepare context variables for the template
@@ -1207,26 +1201,23 @@ class FundingRequest(models.Model):
                     'expert_name': self.expert_user.get_full_name() if self.expert_user else '',
                 }
                 
-                # Replace variables in template content
-                message_content = template.content
-                for var, value in context_vars.items():
-                    message_content = message_content.replace(f'{{{var}}}', str(value))
+                # Fill the placeholders with the compiled template
+                message_content = render_template(template, context_vars)
                 
-                # Send SMS using transaction to ensure atomicity
-                with transaction.atomic():
-                    IPPanelSMSSender.send_sms(
-                        recipient_number=self.created_by.phone_number,
-                        message=message_content,
-                        sender_user=self.chief_user,
-                        recipient_user=self.created_by,
-                        template=template
-                    )
+                # Queued with the approval; the sms_dispatcher command sends it
+                enqueue_sms(
+                    recipient_number=self.created_by.phone_number,
+                    message=message_content,
+                    sender_user=self.chief_user,
+                    recipient_user=self.created_by,
+                    template=template
+                )
                     
         except Exception as e:
             # Log the error but don't prevent the approval from completing
             import logging
             logger = logging.getLogger(__name__)
-            logger.error(f"Failed to send SMS notification for funding approval: {str(e)}")
+            logger.error(f"Failed to queue SMS notification for funding approval: {str(e)}")
         
         return True
     
@@ -1,58 +1,179 @@
 import os
-import json
+import re
+from math import atan, atan2, log, pi, sin, cos, tan, sqrt, radians, degrees
 import shapefile
 from django.conf import settings
 
-def extract_province_boundaries():
-    """
-    Extract province boundaries from shapefile.
-    Returns a dictionary mapping province names to their boundary points.
-    """
-    try:
-        shapefile_path = os.path.join(settings.BASE_DIR, 'static', 'mapfiles', 'province.shp')
-        reader = shapefile.Reader(shapefile_path, encoding='latin1')
-        
-        province_boundaries = {}
-        
-        # Get the field index for province name
-        field_names = [field[0] for field in reader.fields[1:]]  # Skip the first field (DeletionFlag)
-        name_field_index = field_names.index('NAME') if 'NAME' in field_names else 0
-        
-        for sr in reader.shapeRecords():
-            # Get province name
-            province_name = sr.record[name_field_index]
-            if isinstance(province_name, bytes):
-                try:
-                    province_name = province_name.decode('utf-8')
-                except UnicodeDecodeError:
-                    try:
-                        province_name = province_name.decode('latin1')
-                    except UnicodeDecodeError:
-                        province_name = str(province_name)
-            
-            # Get shape points
-            points = []
-            for point in sr.shape.points:
-                # Extract longitude and latitude
-                lon, lat = point
-                points.append([lon, lat])
-            
-            # Store in dictionary
-            province_boundaries[province_name] = points
-        
-        # Save to a JSON file for later use
-        output_path = os.path.join(settings.BASE_DIR, 'static', 'mapfiles', 'province_boundaries.json')
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(province_boundaries, f, ensure_ascii=False, indent=2)
-        
-        print(f"Successfully extracted boundaries for {len(province_boundaries)} provinces.")
-        return province_boundaries
-    
-    except Exception as e:
-        print(f"Error extracting province boundaries: {str(e)}")
-        return {}
+SHAPEFILE_PATH = os.path.join(settings.BASE_DIR, 'static', 'mapfiles', 'province.shp')
+
+# Records whose province comes from the source theme instead of ostn_name:
+# island records ('جزایر') and Hamadan/Lorestan, whose labels are swapped
+SOURCE_PROVINCES = {
+    'Phormo': 'هرمزگان',
+    'Pbushe': 'بوشهر',
+    'Plor': 'لرستان',
+    'Phameda': 'همدان',
+}
+
+# Spelling mistakes in the shapefile that character normalization cannot fix
+PROVINCE_NAME_TYPOS = {
+    'آذزبایجانشرقی': 'آذربایجانشرقی',
+}
+
+def normalize_province_name(name):
+    """
+    Normalize a province name for comparison.
+    Unifies Arabic/Persian letter variants and drops spaces and ZWNJ.
+    The shapefile's cp1256 text turns both ک and گ into ے, so all three compare equal.
+    """
+    name = (name or '').strip()
+    for src, dst in (('ي', 'ی'), ('ى', 'ی'), ('ك', 'ک'), ('ے', 'ک'), ('گ', 'ک'), ('ة', 'ه')):
+        name = name.replace(src, dst)
+    name = re.sub(r'[\s‌]+', '', name)
+    return PROVINCE_NAME_TYPOS.get(name, name)
+
+def _province_choices():
+    """Map normalized province names to the names used by Program.province."""
+    from creator_program.models import Program
+    return {normalize_province_name(value): value for value, _ in Program.PROVINCE_CHOICES}
+
+def lambert_conformal_conic_inverse(params, semi_major=6378137.0, inverse_flattening=298.257223563):
+    """
+    Build an inverse Lambert Conformal Conic (2SP) projection on an ellipsoid.
+    Returns a function mapping projected (x, y) meters to (lon, lat) degrees.
+    """
+    a = semi_major
+    f = 1.0 / inverse_flattening
+    e = sqrt(2 * f - f * f)
+    lon0 = radians(params.get('central_meridian', 0.0))
+    lat0 = radians(params.get('latitude_of_origin', 0.0))
+    phi1 = radians(params.get('standard_parallel_1', 0.0))
+    phi2 = radians(params.get('standard_parallel_2', params.get('standard_parallel_1', 0.0)))
+    false_easting = params.get('false_easting', 0.0)
+    false_northing = params.get('false_northing', 0.0)
+    scale = params.get('scale_factor', 1.0)
+
+    def m(phi):
+        return cos(phi) / sqrt(1 - (e * sin(phi)) ** 2)
+
+    def t(phi):
+        return tan(pi / 4 - phi / 2) / ((1 - e * sin(phi)) / (1 + e * sin(phi))) ** (e / 2)
+
+    if abs(phi1 - phi2) > 1e-12:
+        n = (log(m(phi1)) - log(m(phi2))) / (log(t(phi1)) - log(t(phi2)))
+    else:
+        n = sin(phi1)
+    big_f = m(phi1) / (n * t(phi1) ** n)
+    rho0 = a * big_f * scale * t(lat0) ** n
+
+    def inverse(x, y):
+        x -= false_easting
+        y = rho0 - (y - false_northing)
+        rho = sqrt(x * x + y * y)
+        if n < 0:
+            rho, x, y = -rho, -x, -y
+        theta = atan2(x, y)
+        t_prime = (rho / (a * big_f * scale)) ** (1 / n)
+        phi = pi / 2 - 2 * atan(t_prime)
+        for _ in range(15):
+            es = e * sin(phi)
+            next_phi = pi / 2 - 2 * atan(t_prime * ((1 - es) / (1 + es)) ** (e / 2))
+            if abs(next_phi - phi) < 1e-12:
+                phi = next_phi
+                break
+            phi = next_phi
+        return degrees(theta / n + lon0), degrees(phi)
+
+    return inverse
+
+def read_projection(shapefile_path):
+    """
+    Read the .prj next to a shapefile.
+    Returns a function converting projected coordinates to (lon, lat),
+    or None when the data is already geographic.
+    """
+    prj_path = os.path.splitext(shapefile_path)[0] + '.prj'
+    if not os.path.exists(prj_path):
+        return None
+    with open(prj_path, 'r', encoding='utf-8', errors='ignore') as f:
+        wkt = f.read()
+    if not wkt.startswith('PROJCS'):
+        return None
+    if 'Lambert_Conformal_Conic' not in wkt:
+        raise ValueError("Unsupported shapefile projection; only Lambert_Conformal_Conic is handled.")
+
+    params = {
+        name.lower(): float(value)
+        for name, value in re.findall(r'PARAMETER\["([^"]+)",\s*([-0-9.eE]+)\]', wkt)
+    }
+    spheroid = re.search(r'SPHEROID\["[^"]*",\s*([-0-9.eE]+),\s*([-0-9.eE]+)\]', wkt)
+    if spheroid:
+        return lambert_conformal_conic_inverse(params, float(spheroid.group(1)), float(spheroid.group(2)))
+    return lambert_conformal_conic_inverse(params)
+
+def split_shape_rings(shape, transform=None):
+    """
+    Split a shapefile polygon into its rings using shape.parts.
+    Multi-part provinces (islands) and holes each become a separate ring,
+    so no bogus edges are drawn between the end of one part and the next.
+    """
+    points = shape.points
+    parts = list(shape.parts) + [len(points)]
+    rings = []
+    for start, end in zip(parts[:-1], parts[1:]):
+        if transform:
+            ring = [list(transform(x, y)) for x, y in points[start:end]]
+        else:
+            ring = [[lon, lat] for lon, lat in points[start:end]]
+        if len(ring) >= 3:
+            rings.append(ring)
+    return rings
+
+def read_province_rings(shapefile_path=SHAPEFILE_PATH):
+    """
+    Read province polygons from the shapefile.
+    Returns a dictionary mapping Program province names to a list of rings
+    in WGS84 [lon, lat]. Records whose name cannot be matched are kept
+    under their normalized shapefile name.
+    """
+    reader = shapefile.Reader(shapefile_path, encoding='cp1256', encodingErrors='replace')
+    transform = read_projection(shapefile_path)
+    choices = _province_choices()
+
+    field_names = [field[0] for field in reader.fields[1:]]  # Skip the first field (DeletionFlag)
+    lowered = [name.lower() for name in field_names]
+    name_field_index = lowered.index('ostn_name') if 'ostn_name' in lowered else (
+        lowered.index('name') if 'name' in lowered else 0)
+    source_field_index = lowered.index('sourcethm') if 'sourcethm' in lowered else None
+
+    province_rings = {}
+    for sr in reader.shapeRecords():
+        if not sr.shape.points:
+            continue
+        normalized = normalize_province_name(str(sr.record[name_field_index]))
+        province_name = None
+        if source_field_index is not None:
+            province_name = SOURCE_PROVINCES.get(str(sr.record[source_field_index]).strip())
+        if province_name is None:
+            province_name = choices.get(normalized, normalized)
+
+        province_rings.setdefault(province_name, []).extend(split_shape_rings(sr.shape, transform))
+    return province_rings
+
+def extract_province_boundaries(output_path=None):
+    """
+    Extract province boundaries from shapefile and save them in the
+    compact binary format read by geo_utils.
+    Returns a dictionary mapping province names to a list of rings,
+    where each ring is a list of [lon, lat] points.
+    """
+    from .boundary_store import write_boundaries, BINARY_PATH
+
+    province_boundaries = read_province_rings()
+    write_boundaries(province_boundaries, output_path or BINARY_PATH)
+    return province_boundaries
 
 if __name__ == "__main__":
     # This allows running the script directly
     from django.conf import settings
-    extract_province_boundaries() 
\ No newline at end of file
+    extract_province_boundaries()
@@ -55,4 +55,5 @@ urlpatterns = [
     
     # AJAX views
     path('get-program-details/', views.get_program_details, name='get_program_details'),
+    path('validate-coordinates/', views.validate_coordinates, name='validate_coordinates'),
 ] 
\ No newline at end of file
@@ -8,7 +8,7 @@ from creator_program.models import Program
 import jdatetime
 from datetime import datetime
 import json
-from .geo_utils import is_point_in_province
+from .geo_utils import is_point_in_province, detect_province
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, FormView, TemplateView, View
 from django.views.generic.detail import SingleObjectMixin
@@ -616,12 +616,25 @@ def project_add_allocation(request, pk):
         'project': project
     })
 
+@login_required
 def validate_coordinates(request):
     """AJAX view to validate coordinates for a province."""
-    # REMOVED: Coordinate validation function
+    params = request.POST if request.method == 'POST' else request.GET
+    longitude = params.get('longitude')
+    latitude = params.get('latitude')
+    province = params.get('province', '')
+
+    if not longitude or not latitude:
+        return JsonResponse({
+            'valid': False,
+            'message': 'طول و عرض جغرافیایی الزامی است.'
+        }, status=400)
+
+    valid, message = is_point_in_province(longitude, latitude, province)
     return JsonResponse({
-        'valid': True,
-        'message': 'مختصات پذیرفته شد.'
+        'valid': valid,
+        'message': message,
+        'detected_province': detect_province(longitude, latitude)
     })
 
 @login_required
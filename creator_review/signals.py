@@ -3,7 +3,8 @@ from django.dispatch import receiver
 from django.conf import settings
 
 from .models import ProjectReview
-from notifications_sms.utils import IPPanelSMSSender, format_project_rejected_message
+from notifications_sms.outbox import enqueue_sms
+from notifications_sms.utils import format_project_rejected_message
 
 @receiver(post_save, sender=ProjectReview)
 def send_sms_on_project_rejection(sender, instance, created, **kwargs):
@@ -25,8 +26,8 @@ def send_sms_on_project_rejection(sender, instance, created, **kwargs):
         # Format the message with the rejection reason
         message = format_project_rejected_message(instance.rejection_reason)
         
-        # Send SMS
-        IPPanelSMSSender.send_sms(
+        # Queue the SMS; it is sent by the sms_dispatcher command once the review is saved
+        enqueue_sms(
             creator.phone_number,
             message,
             sender_user=instance.expert,
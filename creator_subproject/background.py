@@ -0,0 +1,32 @@
+"""
+In-process background work for the subproject app.
+
+Jobs are handed to a small thread pool once the current transaction
+commits, so they see the rows the request created and the request does
+not wait for them. Failures are logged; each job type has a management
+command that picks up whatever was missed.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=getattr(settings, 'SUBPROJECT_BACKGROUND_WORKERS', 2),
+                               thread_name_prefix='subproject-background')
+
+
+def _run(func, args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception("Background job %s%r failed", func.__name__, args)
+    finally:
+        # Worker threads keep their own connection; do not leave it open
+        connection.close()
+
+
+def run_after_commit(func, *args):
+    """Run func(*args) on the background pool after the current transaction commits."""
+    transaction.on_commit(lambda: _executor.submit(_run, func, args))
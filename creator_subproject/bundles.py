@@ -0,0 +1,129 @@
+"""
+Streamed ZIP bundles of stored files.
+
+The archive is produced by a generator: each file is copied from the
+content store into the ZIP in chunks and the compressed bytes are yielded
+as soon as they are written, so neither the files nor the archive are
+ever held in memory. Formats that are already compressed are stored as is,
+everything else is deflated.
+"""
+import io
+import csv
+import zipfile
+import hashlib
+from .storage import CHUNK_SIZE
+
+# MIME types whose content is already compressed; deflating them wastes CPU
+STORED_MIME_PREFIXES = ('image/', 'video/', 'audio/')
+STORED_MIME_TYPES = {
+    'application/pdf',
+    'application/zip',
+    'application/x-zip-compressed',
+    'application/x-rar-compressed',
+    'application/x-7z-compressed',
+    'application/gzip',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+}
+
+
+class _StreamBuffer(io.RawIOBase):
+    """Write-only stream that keeps what was written until it is drained."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class BundleEntry:
+    """A file to put in the bundle. open() must return a binary file object."""
+
+    def __init__(self, path, open, mime_type, modified=None, metadata=None):
+        self.path = path
+        self.open = open
+        self.mime_type = mime_type or 'application/octet-stream'
+        self.modified = modified
+        self.metadata = metadata or {}
+
+
+def compression_for(mime_type):
+    if mime_type.startswith(STORED_MIME_PREFIXES) or mime_type in STORED_MIME_TYPES:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def unique_path(path, used):
+    """Return path, or path with a ' (n)' suffix if it is already in used."""
+    candidate = path
+    counter = 1
+    while candidate in used:
+        stem, dot, extension = path.rpartition('.')
+        if not dot or '/' in extension:
+            stem, extension = path, ''
+        counter += 1
+        candidate = f"{stem} ({counter}){dot if extension else ''}{extension}"
+    used.add(candidate)
+    return candidate
+
+
+def iter_zip(entries, manifest_name='manifest.csv', manifest_fields=()):
+    """
+    Yield the bytes of a ZIP archive with every entry plus a CSV manifest.
+    The manifest lists path, size and SHA-256 of each file followed by the
+    entries' metadata columns (manifest_fields).
+    """
+    buffer = _StreamBuffer()
+    manifest_rows = []
+    used_paths = {manifest_name}
+    with zipfile.ZipFile(buffer, mode='w', allowZip64=True) as archive:
+        for entry in entries:
+            path = unique_path(entry.path, used_paths)
+            info = zipfile.ZipInfo(path, date_time=_zip_timestamp(entry.modified))
+            info.compress_type = compression_for(entry.mime_type)
+
+            sha256 = hashlib.sha256()
+            size = 0
+            with entry.open() as source, archive.open(info, mode='w', force_zip64=True) as target:
+                for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                    target.write(chunk)
+                    sha256.update(chunk)
+                    size += len(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            yield buffer.drain()
+
+            manifest_rows.append([path, size, sha256.hexdigest()] +
+                                 [entry.metadata.get(field, '') for field in manifest_fields])
+
+        manifest = io.StringIO()
+        writer = csv.writer(manifest)
+        writer.writerow(['path', 'size', 'sha256'] + list(manifest_fields))
+        writer.writerows(manifest_rows)
+        # BOM so Excel opens the Persian text correctly
+        archive.writestr(manifest_name, ('\ufeff' + manifest.getvalue()).encode('utf-8'),
+                         compress_type=zipfile.ZIP_DEFLATED)
+    yield buffer.drain()
+
+
+def _zip_timestamp(value):
+    if value is None or value.year < 1980:
+        return (1980, 1, 1, 0, 0, 0)
+    return value.timetuple()[:6]
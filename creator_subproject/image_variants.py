@@ -0,0 +1,115 @@
+"""
+Resized variants of gallery images.
+
+Each upload gets thumb/medium/large versions, stored in the content store
+next to the original. Variants are rotated according to the EXIF
+orientation and saved without EXIF data (which can carry GPS positions
+and camera details). A WebP copy is added when Pillow supports it.
+
+Generation runs in the background after the upload is committed (see
+background.py). The generate_gallery_variants command fills in anything
+that was missed.
+"""
+import io
+import os
+from django.conf import settings
+from django.db import transaction
+from . import storage
+from .background import run_after_commit
+
+try:
+    from PIL import Image, ImageOps, features
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+# (name, longest side in pixels), smallest first
+VARIANT_SIZES = (
+    ('thumb', 320),
+    ('medium', 800),
+    ('large', 1600),
+)
+
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+WEBP_ENABLED = PIL_AVAILABLE and getattr(settings, 'GALLERY_WEBP_VARIANTS', True) and features.check('webp')
+
+
+def _store_image(image, format, **params):
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **params)
+    return storage.store_bytes(buffer.getvalue())[0]
+
+
+def build_variants(source):
+    """
+    Build the variants of the image in the file object source and store
+    them. Returns {name: {'width', 'height', 'hash', 'mime_type'[, 'webp']}}.
+    Sizes larger than the original are skipped, the original serves them.
+    """
+    image = Image.open(source)
+    largest = VARIANT_SIZES[-1][1]
+    if image.format == 'JPEG':
+        # Let the decoder downscale while reading, much faster for large photos
+        image.draft('RGB', (largest, largest))
+    image = ImageOps.exif_transpose(image)
+
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    icc_profile = image.info.get('icc_profile')
+
+    variants = {}
+    for name, size in VARIANT_SIZES:
+        if max(image.size) <= size:
+            break
+        resized = image.copy()
+        resized.thumbnail((size, size), Image.LANCZOS)
+
+        # Nothing but the pixels (and color profile) is kept, which drops EXIF
+        if has_alpha:
+            digest = _store_image(resized, 'PNG', optimize=True)
+            mime_type = 'image/png'
+        else:
+            digest = _store_image(resized, 'JPEG', quality=JPEG_QUALITY, optimize=True,
+                                  progressive=True, icc_profile=icc_profile)
+            mime_type = 'image/jpeg'
+
+        variant = {'width': resized.width, 'height': resized.height, 'hash': digest, 'mime_type': mime_type}
+        if WEBP_ENABLED:
+            variant['webp'] = _store_image(resized, 'WEBP', quality=WEBP_QUALITY, method=4)
+        variants[name] = variant
+
+    return variants
+
+
+def generate_variants(image_id):
+    """Generate and save the variants of one gallery image. Returns the variants."""
+    from .models import SubProjectGalleryImage, StoredBlob, variant_digests
+
+    gallery_image = SubProjectGalleryImage.objects.defer('image').get(pk=image_id)
+    with gallery_image.open_image() as source:
+        variants = build_variants(source)
+    sizes = {digest: os.path.getsize(storage.blob_path(digest)) for digest in variant_digests(variants)}
+
+    with transaction.atomic():
+        current = SubProjectGalleryImage.objects.select_for_update().filter(pk=image_id).only('variants').first()
+        if current is None:
+            # Deleted meanwhile; gc_blobs removes the unreferenced files
+            return None
+        collected = [digest for digest, size in sizes.items() if not StoredBlob.acquire(digest, size)]
+        if collected:
+            # gc_blobs removed some of the files before the references were taken: write them again
+            with gallery_image.open_image() as source:
+                rebuilt = build_variants(source)
+            if not set(collected) <= set(variant_digests(rebuilt)):
+                raise RuntimeError(f"Variants of gallery image {image_id} were collected while being stored")
+        StoredBlob.release(*variant_digests(current.variants))
+        SubProjectGalleryImage.objects.filter(pk=image_id).update(variants=variants)
+    return variants
+
+
+def schedule_variants(image_id):
+    """Queue variant generation for when the current transaction commits."""
+    if not PIL_AVAILABLE:
+        return
+    run_after_commit(generate_variants, image_id)
@@ -0,0 +1,45 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from creator_subproject.models import DocumentFile, DocumentText
+from creator_subproject.text_index import PYPDF2_AVAILABLE, index_document_file
+
+
+class Command(BaseCommand):
+    help = 'Extract and index the text of PDF document files that have not been indexed yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help='Stop after this many files')
+        parser.add_argument('--retry-failed', action='store_true', help='Also retry files whose extraction failed')
+        parser.add_argument('--all', action='store_true', help='Re-index every PDF')
+
+    def handle(self, *args, **options):
+        if not PYPDF2_AVAILABLE:
+            raise CommandError('PyPDF2 is not installed')
+
+        started = time.monotonic()
+        files = DocumentFile.objects.filter(
+            Q(file_mime_type='application/pdf') | Q(filename__iendswith='.pdf'))
+        if not options['all']:
+            pending = Q(text_index__isnull=True)
+            if options['retry_failed']:
+                pending |= Q(text_index__status=DocumentText.STATUS_FAILED)
+            files = files.filter(pending)
+
+        # Only ids are loaded up front; each file is indexed (and committed) on its own,
+        # so an interrupted run simply continues where it stopped next time
+        ids = files.order_by('id').values_list('id', flat=True)
+        if options['limit']:
+            ids = ids[:options['limit']]
+
+        counts = {DocumentText.STATUS_DONE: 0, DocumentText.STATUS_EMPTY: 0, DocumentText.STATUS_FAILED: 0}
+        for document_file_id in list(ids):
+            document_text = index_document_file(document_file_id)
+            counts[document_text.status] += 1
+            if document_text.status == DocumentText.STATUS_FAILED:
+                self.stdout.write(self.style.ERROR(f"File {document_file_id}: {document_text.error}"))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {counts[DocumentText.STATUS_DONE]} files, {counts[DocumentText.STATUS_EMPTY]} without text, "
+            f"{counts[DocumentText.STATUS_FAILED]} failed in {time.monotonic() - started:.2f}s"
+        ))
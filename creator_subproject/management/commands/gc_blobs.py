@@ -0,0 +1,126 @@
+import os
+import time
+import datetime
+from collections import Counter
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+from creator_subproject.models import SubProjectGalleryImage, DocumentFile, StoredBlob
+from creator_subproject import storage
+
+
+def format_size(size):
+    return f"{size / 1024 / 1024:.1f} MB"
+
+
+class Command(BaseCommand):
+    help = 'Remove unreferenced blobs from the content store and report the space saved by deduplication'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=24,
+                            help='Only remove blobs that have been unreferenced for this long')
+        parser.add_argument('--recount', action='store_true',
+                            help='Rebuild reference counts from the gallery and document tables first')
+        parser.add_argument('--dry-run', action='store_true', help='Show what would be removed')
+        parser.add_argument('--report-only', action='store_true', help='Only print the storage report')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if not options['report_only']:
+            if options['recount']:
+                self.recount(options['dry_run'])
+            cutoff = timezone.now() - datetime.timedelta(hours=options['grace_hours'])
+            self.collect(cutoff, options['dry_run'])
+            self.remove_untracked_files(cutoff, options['dry_run'])
+        self.report()
+        self.stdout.write(f"Finished in {time.monotonic() - started:.2f}s")
+
+    def recount(self, dry_run):
+        """Recompute every reference count from the rows that point at blobs."""
+        counts = Counter()
+        for digest, variants in SubProjectGalleryImage.objects.exclude(content_hash='').values_list(
+                'content_hash', 'variants').iterator():
+            counts[digest] += 1
+            for variant in (variants or {}).values():
+                for key in ('hash', 'webp'):
+                    if variant.get(key):
+                        counts[variant[key]] += 1
+        counts.update(DocumentFile.objects.exclude(content_hash='').values_list('content_hash', flat=True).iterator())
+
+        fixed = 0
+        with transaction.atomic():
+            for blob in StoredBlob.objects.select_for_update().iterator():
+                actual = counts.pop(blob.digest, 0)
+                if blob.ref_count != actual:
+                    fixed += 1
+                    self.stdout.write(f"  {blob.digest}: {blob.ref_count} -> {actual}")
+                    if not dry_run:
+                        StoredBlob.objects.filter(pk=blob.digest).update(ref_count=actual, updated_at=timezone.now())
+            missing = [
+                StoredBlob(digest=digest, size=os.path.getsize(storage.blob_path(digest)), ref_count=count)
+                for digest, count in counts.items() if storage.blob_exists(digest)
+            ]
+            if missing and not dry_run:
+                StoredBlob.objects.bulk_create(missing, batch_size=500)
+        self.stdout.write(f"Recount: {fixed} counts corrected, {len(missing)} blobs registered")
+
+    def collect(self, cutoff, dry_run):
+        """Remove blobs whose reference count reached zero before cutoff."""
+        removed = 0
+        freed = 0
+        candidates = StoredBlob.objects.filter(ref_count__lte=0, updated_at__lt=cutoff).values_list('digest', flat=True)
+        for digest in list(candidates):
+            with transaction.atomic():
+                # Lock the row so a concurrent upload of the same content cannot take a reference meanwhile
+                blob = StoredBlob.objects.select_for_update().filter(
+                    pk=digest, ref_count__lte=0, updated_at__lt=cutoff).first()
+                if blob is None:
+                    continue
+                removed += 1
+                freed += blob.size
+                if not dry_run:
+                    storage.delete_blob(digest)
+                    blob.delete()
+        self.stdout.write(f"{'Would remove' if dry_run else 'Removed'} {removed} unreferenced blobs "
+                          f"({format_size(freed)})")
+
+    def remove_untracked_files(self, cutoff, dry_run):
+        """Remove files in the store that no StoredBlob row knows about (e.g. interrupted uploads)."""
+        if not os.path.isdir(storage.STORE_ROOT):
+            return
+        cutoff_timestamp = cutoff.timestamp()
+        on_disk = {}
+        for directory, _, filenames in os.walk(storage.STORE_ROOT):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                if os.path.getmtime(path) < cutoff_timestamp:
+                    on_disk[filename] = path
+
+        known = set()
+        names = list(on_disk)
+        for i in range(0, len(names), 1000):
+            known.update(StoredBlob.objects.filter(digest__in=names[i:i + 1000]).values_list('digest', flat=True))
+
+        untracked = [path for name, path in on_disk.items() if name not in known]
+        if not dry_run:
+            for path in untracked:
+                os.remove(path)
+        self.stdout.write(f"{'Would remove' if dry_run else 'Removed'} {len(untracked)} untracked files")
+
+    def report(self):
+        """Print how much space deduplication saves."""
+        stats = StoredBlob.objects.filter(ref_count__gt=0).aggregate(
+            blobs=Count('digest'),
+            physical=Sum('size'),
+            logical=Sum(F('size') * F('ref_count')),
+        )
+        shared = StoredBlob.objects.filter(ref_count__gt=1).count()
+        physical = stats['physical'] or 0
+        logical = stats['logical'] or 0
+        saved = logical - physical
+        self.stdout.write(self.style.SUCCESS(
+            f"Content store: {stats['blobs']} blobs, {format_size(physical)} on disk for "
+            f"{format_size(logical)} of files; {shared} blobs are shared, "
+            f"saving {format_size(saved)} ({saved / logical * 100 if logical else 0:.1f}%)"
+        ))
@@ -0,0 +1,41 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from creator_subproject.models import SubProjectGalleryImage
+from creator_subproject.image_variants import PIL_AVAILABLE, generate_variants
+
+
+class Command(BaseCommand):
+    help = 'Generate thumbnail/medium/large variants for gallery images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Regenerate variants that already exist')
+        parser.add_argument('--image', type=int, help='Only process this gallery image')
+
+    def handle(self, *args, **options):
+        if not PIL_AVAILABLE:
+            raise CommandError('Pillow is not installed')
+
+        started = time.monotonic()
+        images = SubProjectGalleryImage.objects.order_by('id')
+        if options['image']:
+            images = images.filter(id=options['image'])
+        elif not options['all']:
+            images = images.filter(variants={})
+
+        processed = 0
+        failed = 0
+        for image_id in images.values_list('id', flat=True).iterator():
+            try:
+                variants = generate_variants(image_id)
+                if variants is None:
+                    self.stdout.write(f"Image {image_id}: deleted meanwhile, skipped")
+                    continue
+                processed += 1
+                self.stdout.write(f"Image {image_id}: {', '.join(variants) or 'no variants needed'}")
+            except Exception as e:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f"Image {image_id}: {e}"))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {processed} images ({failed} failed) in {time.monotonic() - started:.2f}s"
+        ))
@@ -0,0 +1,71 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from creator_subproject.models import SubProjectGalleryImage, DocumentFile, StoredBlob
+from creator_subproject import storage
+
+# name -> (model, field holding the legacy bytes)
+SOURCES = {
+    'gallery': (SubProjectGalleryImage, 'image'),
+    'documents': (DocumentFile, 'file'),
+}
+
+
+class Command(BaseCommand):
+    help = 'Move gallery images and document files stored in the database into the content-addressed file store'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=sorted(SOURCES), action='append',
+                            help='Only move this kind of file (can be repeated)')
+        parser.add_argument('--batch-size', type=int, default=20,
+                            help='Number of rows loaded per query (keep small, rows hold whole files)')
+        parser.add_argument('--sleep', type=float, default=0,
+                            help='Seconds to pause between batches to reduce database load')
+        parser.add_argument('--keep-database-copy', action='store_true',
+                            help='Do not clear the database blob after it has been stored')
+
+    def handle(self, *args, **options):
+        for name in options['model'] or sorted(SOURCES):
+            model, field = SOURCES[name]
+            self.move(name, model, field, options)
+
+    def move(self, name, model, field, options):
+        started = time.monotonic()
+        batch_size = max(1, options['batch_size'])
+        pending = model.objects.filter(content_hash='', **{f'{field}__isnull': False})
+        self.stdout.write(f"Found {pending.count()} {name} rows to move")
+
+        moved = 0
+        moved_bytes = 0
+        last_id = 0
+        while True:
+            # Walk the primary key so every query is a short indexed range read
+            ids = list(pending.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            last_id = ids[-1]
+
+            for pk, data in model.objects.filter(id__in=ids).values_list('id', field):
+                if not data:
+                    continue
+                digest, size = storage.store_bytes(data)
+
+                # One short transaction per row, so no long-running lock is held
+                fields = {'content_hash': digest, 'file_size': size}
+                if not options['keep_database_copy']:
+                    fields[field] = None
+                with transaction.atomic():
+                    if model.objects.filter(id=pk, content_hash='').update(**fields):
+                        if not StoredBlob.acquire(digest, size):
+                            storage.store_bytes(data)
+                moved += 1
+                moved_bytes += size
+
+            self.stdout.write(f"  moved {moved} {name} rows ({moved_bytes / 1024 / 1024:.1f} MB)")
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {moved} {name} rows ({moved_bytes / 1024 / 1024:.1f} MB) "
+            f"in {time.monotonic() - started:.2f}s"
+        ))
@@ -1,52 +1,76 @@
+import time
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from creator_project.models import Project
 from creator_subproject.models import SubProject
+from creator_subproject.scheduling import saved_task_for_subproject, schedule
 
 
 class Command(BaseCommand):
     help = 'Updates all subproject relationships and recalculates dates'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--project', type=int, help='Only update subprojects of this project')
+        parser.add_argument('--dry-run', action='store_true', help='Show the changes without saving them')
+
     def handle(self, *args, **options):
-        # Get all subprojects that have relationship information
-        subprojects = SubProject.objects.filter(related_subproject__isnull=False)
-        
-        self.stdout.write(f"Found {subprojects.count()} subprojects with relationships to update")
-        
-        # First pass: recalculate dates for all related subprojects
+        started = time.monotonic()
+
+        # Load the whole relationship graph with one query
+        subprojects = SubProject.objects.only(
+            'id', 'name', 'project', 'start_date', 'end_date', 'relationship_type', 'related_subproject',
+            'relationship_delay', 'imagenary_duration', 'contract_start_date', 'contract_end_date',
+        )
+        if options['project']:
+            subprojects = subprojects.filter(project_id=options['project'])
+        subprojects = list(subprojects)
+        loaded = time.monotonic()
+
+        related_count = sum(1 for sp in subprojects if sp.related_subproject_id)
+        self.stdout.write(f"Found {related_count} subprojects with relationships to update")
+
+        # Compute every date in one topological pass, with the same rules as save()
+        result = schedule([saved_task_for_subproject(sp) for sp in subprojects], keep_dates=True)
+        for cycle in result.cycles:
+            self.stdout.write(self.style.WARNING(
+                f"Circular relationship between subprojects {' -> '.join(map(str, cycle))}; dates kept"))
+
+        changed = []
+        now = timezone.now()
         for subproject in subprojects:
-            try:
-                original_start = subproject.start_date
-                original_end = subproject.end_date
-                
-                # Recalculate dates based on relationship
-                subproject.calculate_dates()
-                subproject.save(update_fields=['start_date', 'end_date'])
-                
-                # Report changes
-                self.stdout.write(f"Updated subproject {subproject.id} ({subproject.name})")
-                self.stdout.write(f"  Relationship: {subproject.relationship_type} with {subproject.related_subproject.name}")
-                self.stdout.write(f"  Start date changed: {original_start} -> {subproject.start_date}")
-                self.stdout.write(f"  End date changed: {original_end} -> {subproject.end_date}")
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f"Error updating subproject {subproject.id}: {str(e)}"))
-        
-        # Second pass: update dependent subprojects
-        for subproject in SubProject.objects.filter(related_subproject__isnull=False):
-            try:
-                # Find all dependent subprojects
-                dependent_projects = SubProject.objects.filter(related_subproject=subproject)
-                for dep in dependent_projects:
-                    original_start = dep.start_date
-                    original_end = dep.end_date
-                    
-                    # Recalculate dates based on relationship
-                    dep.calculate_dates()
-                    dep.save(update_fields=['start_date', 'end_date'])
-                    
-                    # Report changes
-                    self.stdout.write(f"Updated dependent subproject {dep.id} ({dep.name})")
-                    self.stdout.write(f"  Start date changed: {original_start} -> {dep.start_date}")
-                    self.stdout.write(f"  End date changed: {original_end} -> {dep.end_date}")
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f"Error updating dependent subprojects for {subproject.id}: {str(e)}"))
-                
-        self.stdout.write(self.style.SUCCESS("Successfully updated all subproject relationships")) 
\ No newline at end of file
+            if not subproject.related_subproject_id:
+                continue
+            new_start, new_end = result.dates[subproject.id]
+            if (new_start, new_end) == (subproject.start_date, subproject.end_date):
+                continue
+
+            self.stdout.write(f"{'Would update' if options['dry_run'] else 'Updated'} subproject "
+                              f"{subproject.id} ({subproject.name})")
+            self.stdout.write(f"  Start date: {subproject.start_date} -> {new_start}")
+            self.stdout.write(f"  End date: {subproject.end_date} -> {new_end}")
+            subproject.start_date, subproject.end_date = new_start, new_end
+            subproject.updated_at = now
+            changed.append(subproject)
+        computed = time.monotonic()
+
+        if changed and not options['dry_run']:
+            with transaction.atomic():
+                SubProject.objects.bulk_update(changed, ['start_date', 'end_date', 'updated_at'], batch_size=500)
+
+                # Recompute each affected parent project once
+                for project in Project.objects.filter(pk__in={sp.project_id for sp in changed}):
+                    project.physical_progress = project.calculate_physical_progress()
+                    project.overall_status = project.calculate_overall_status()
+                    project.save(update_fields=['physical_progress', 'overall_status'])
+        finished = time.monotonic()
+
+        self.stdout.write(
+            f"Timing: load {loaded - started:.2f}s, schedule {computed - loaded:.2f}s, "
+            f"write {finished - computed:.2f}s, total {finished - started:.2f}s"
+        )
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"Dry run: {len(changed)} subprojects would be updated"))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Successfully updated all subproject relationships ({len(changed)} subprojects changed)"))
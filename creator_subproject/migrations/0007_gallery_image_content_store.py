@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("creator_subproject", "0006_merge_20250805_1122"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="subprojectgalleryimage",
+            name="image",
+            field=models.BinaryField(blank=True, null=True, verbose_name="تصویر"),
+        ),
+        migrations.AddField(
+            model_name="subprojectgalleryimage",
+            name="content_hash",
+            field=models.CharField(blank=True, db_index=True, default="", max_length=64),
+        ),
+        migrations.AddField(
+            model_name="subprojectgalleryimage",
+            name="file_size",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
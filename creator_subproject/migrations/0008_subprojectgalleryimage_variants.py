@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("creator_subproject", "0007_gallery_image_content_store"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="subprojectgalleryimage",
+            name="variants",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
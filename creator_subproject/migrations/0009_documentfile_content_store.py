@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("creator_subproject", "0008_subprojectgalleryimage_variants"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="documentfile",
+            name="file",
+            field=models.BinaryField(blank=True, null=True, verbose_name="فایل"),
+        ),
+        migrations.AddField(
+            model_name="documentfile",
+            name="content_hash",
+            field=models.CharField(blank=True, db_index=True, default="", max_length=64),
+        ),
+        migrations.AddField(
+            model_name="documentfile",
+            name="file_size",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,65 @@
+import os
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def count_references(apps, schema_editor):
+    """Create reference counts for files already in the content store."""
+    SubProjectGalleryImage = apps.get_model("creator_subproject", "SubProjectGalleryImage")
+    DocumentFile = apps.get_model("creator_subproject", "DocumentFile")
+    StoredBlob = apps.get_model("creator_subproject", "StoredBlob")
+
+    counts = Counter()
+    sizes = {}
+    for digest, size, variants in SubProjectGalleryImage.objects.exclude(content_hash="").values_list(
+            "content_hash", "file_size", "variants").iterator():
+        counts[digest] += 1
+        sizes[digest] = size
+        for variant in (variants or {}).values():
+            for key in ("hash", "webp"):
+                if variant.get(key):
+                    counts[variant[key]] += 1
+    for digest, size in DocumentFile.objects.exclude(content_hash="").values_list(
+            "content_hash", "file_size").iterator():
+        counts[digest] += 1
+        sizes[digest] = size
+
+    from creator_subproject.storage import blob_path
+
+    def size_of(digest):
+        if digest in sizes:
+            return sizes[digest]
+        try:
+            return os.path.getsize(blob_path(digest))
+        except OSError:
+            return 0
+
+    StoredBlob.objects.bulk_create(
+        [StoredBlob(digest=digest, size=size_of(digest), ref_count=count) for digest, count in counts.items()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("creator_subproject", "0009_documentfile_content_store"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StoredBlob",
+            fields=[
+                ("digest", models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ("size", models.PositiveBigIntegerField(default=0)),
+                ("ref_count", models.IntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "indexes": [models.Index(fields=["ref_count", "updated_at"], name="storedblob_gc_idx")],
+            },
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
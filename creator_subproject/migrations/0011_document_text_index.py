@@ -0,0 +1,64 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("creator_subproject", "0010_storedblob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DocumentText",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("text", models.TextField(blank=True)),
+                ("page_count", models.PositiveIntegerField(default=0)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("done", "استخراج شده"), ("empty", "بدون متن"), ("failed", "ناموفق")],
+                        default="done",
+                        max_length=10,
+                    ),
+                ),
+                ("error", models.TextField(blank=True)),
+                ("extracted_at", models.DateTimeField(auto_now=True)),
+                (
+                    "document",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="texts",
+                        to="creator_subproject.financialdocument",
+                    ),
+                ),
+                (
+                    "document_file",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="text_index",
+                        to="creator_subproject.documentfile",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="DocumentTextToken",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("token", models.CharField(max_length=64)),
+                (
+                    "document_text",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="tokens",
+                        to="creator_subproject.documenttext",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("token", "document_text")},
+            },
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from django.conf import settings
 from django.utils import timezone
 # Remove direct import of Project
@@ -8,7 +8,10 @@ from django.db.models.signals import post_save, pre_save, post_delete
 from django.dispatch import receiver
 import json
 from .utils import gregorian_to_jalali
-from django.db.models import Q
+from .scheduling import relationship_dates
+from . import storage
+from .image_variants import VARIANT_SIZES
+from django.db.models import Q, F
 from decimal import Decimal
 import datetime
 from django.contrib.auth import get_user_model
@@ -376,40 +379,28 @@ class SubProject(models.Model):
 
         # 2. If there's a related subproject with relationship type, calculate dates based on that
         if self.related_subproject and self.relationship_type:
-            # Get the related subproject's dates
-            related_start = self.related_subproject.start_date
-            related_end = self.related_subproject.end_date
-            
-            # Ensure the related subproject has valid dates before proceeding
-            if not related_start or not related_end:
-                return
-            
-            # Calculate delay days (default to 0 if not specified)
-            delay_days = self.relationship_delay or 0
-            
-            # Calculate duration days from completion_percent
-            duration_days = self.imagenary_duration or 30  # Default to 30 days if not set
-            
-            # Calculate dates based on relationship type
-            if self.relationship_type == 'بعد از':  # After
-                # Start AFTER the related project ENDS (+ delay)
-                self.start_date = related_end + datetime.timedelta(days=delay_days)
-                self.end_date = self.start_date + datetime.timedelta(days=duration_days)
-                
-            elif self.relationship_type == 'قبل از':  # Before
-                # End BEFORE the related project STARTS (- delay)
-                self.end_date = related_start - datetime.timedelta(days=delay_days)
-                self.start_date = self.end_date - datetime.timedelta(days=duration_days)
-                
-            elif self.relationship_type == 'شروع با':  # Start With
-                # Start WITH the related project START (+ delay)
-                self.start_date = related_start + datetime.timedelta(days=delay_days)
-                self.end_date = self.start_date + datetime.timedelta(days=duration_days)
-                
-            elif self.relationship_type == 'پایان با':  # End With
-                # End WITH the related project END (+ delay)
-                self.end_date = related_end + datetime.timedelta(days=delay_days)
-                self.start_date = self.end_date - datetime.timedelta(days=duration_days)
+            dates = self.dates_from_related(self.related_subproject.start_date, self.related_subproject.end_date)
+            if dates:
+                self.start_date, self.end_date = dates
+    
+    def dates_from_related(self, related_start, related_end):
+        """
+        Return the (start_date, end_date) this subproject should have when its
+        related subproject runs from related_start to related_end, or None if
+        the current dates should be kept.
+        """
+        if self.contract_start_date and self.contract_end_date:
+            return self.contract_start_date, self.contract_end_date
+        
+        # Ensure the related subproject has valid dates before proceeding
+        if not self.relationship_type or not related_start or not related_end:
+            return None
+        
+        # Duration defaults to 30 days if not set
+        return relationship_dates(
+            self.relationship_type, related_start, related_end,
+            self.relationship_delay or 0, self.imagenary_duration or 30
+        )
     
     @property
     def latest_situation_report(self):
@@ -1039,24 +1030,167 @@ def update_all_subproject_values():
             update_fields.append('subproject_debt')
         subproject.save(update_fields=update_fields)
 
+def propagate_dependent_dates(root, user=None):
+    """
+    Recalculate the dates of every subproject that depends, directly or
+    through a chain, on root.
+    
+    The dependency tree is loaded one level per query, dates are computed in
+    memory and only the changed rows are written with a single bulk_update,
+    so no SubProject signals fire for the dependents. History entries are
+    bulk-inserted when a user is given, and each affected parent project is
+    recomputed once. Returns the list of updated subprojects.
+    """
+    from django.db import transaction
+    
+    # Load the dependency tree breadth-first so parents come before children
+    seen = {root.pk}
+    frontier = [root.pk]
+    dependents = []
+    while frontier:
+        children = SubProject.objects.filter(related_subproject_id__in=frontier).exclude(pk__in=seen)
+        frontier = []
+        for child in children:
+            if child.pk in seen:
+                continue
+            seen.add(child.pk)
+            frontier.append(child.pk)
+            dependents.append(child)
+    
+    if not dependents:
+        return []
+    
+    dates = {root.pk: (root.start_date, root.end_date)}
+    changed = []
+    history = []
+    now = timezone.now()
+    for subproject in dependents:
+        old_dates = (subproject.start_date, subproject.end_date)
+        new_dates = subproject.dates_from_related(*dates[subproject.related_subproject_id]) or old_dates
+        dates[subproject.pk] = new_dates
+        if new_dates == old_dates:
+            continue
+        
+        if user is not None:
+            for field_name, old_value, new_value in zip(('start_date', 'end_date'), old_dates, new_dates):
+                if old_value != new_value:
+                    history.append(SubProjectUpdateHistory(
+                        subproject=subproject,
+                        updated_by=user,
+                        field_name=field_name,
+                        old_value=str(old_value) if old_value is not None else '',
+                        new_value=str(new_value) if new_value is not None else ''
+                    ))
+        subproject.start_date, subproject.end_date = new_dates
+        subproject.updated_at = now
+        changed.append(subproject)
+    
+    if not changed:
+        return []
+    
+    with transaction.atomic():
+        SubProject.objects.bulk_update(changed, ['start_date', 'end_date', 'updated_at'])
+        if history:
+            SubProjectUpdateHistory.objects.bulk_create(history)
+        
+        # Recompute each affected parent project once
+        for project in Project.objects.filter(pk__in={sp.project_id for sp in changed}):
+            project.physical_progress = project.calculate_physical_progress()
+            project.overall_status = project.calculate_overall_status()
+            project.save(update_fields=['physical_progress', 'overall_status'])
+    
+    return changed
+
+
 @receiver(post_save, sender=SubProject)
 def update_dependent_subprojects(sender, instance, created, **kwargs):
     """Update related/dependent subprojects when a subproject is saved."""
-    # Find all subprojects that have this one as related
-    related_subprojects = SubProject.objects.filter(related_subproject=instance)
+    # A new subproject cannot have dependents yet
+    if created:
+        return
     
-    # Update their dates based on relationship
-    for related in related_subprojects:
-        # This will trigger calculate_dates() in save()
-        related.save(update_fields=['updated_at'])
+    # Nothing to propagate if the dates did not change
+    updates = getattr(instance, '_updates', None)
+    if updates is not None and not any(u['field_name'] in ('start_date', 'end_date') for u in updates):
+        return
+    
+    propagate_dependent_dates(instance, getattr(instance, '_current_user', None))
+
+
+class StoredBlob(models.Model):
+    """
+    Reference count of a file in the content store (see storage.py).
+    
+    Identical uploads share one blob. Every row that points at a blob holds
+    one reference; blobs whose count dropped to zero are removed by the
+    gc_blobs command after a grace period.
+    """
+    digest = models.CharField(max_length=64, primary_key=True)
+    size = models.PositiveBigIntegerField(default=0)
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [models.Index(fields=['ref_count', 'updated_at'], name='storedblob_gc_idx')]
+    
+    def __str__(self):
+        return f"{self.digest} ({self.ref_count})"
+    
+    @classmethod
+    def acquire(cls, digest, size):
+        """
+        Add a reference to a stored blob. Returns False if the file is no
+        longer in the store (gc_blobs removed it after the caller stored or
+        found it); the reference is held, and the caller must store the
+        bytes again.
+        """
+        with transaction.atomic():
+            # The update locks the row, waiting for a gc_blobs that is removing it
+            updated = cls.objects.filter(pk=digest).update(ref_count=F('ref_count') + 1, updated_at=timezone.now())
+            if not updated:
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(digest=digest, size=size, ref_count=1)
+                except IntegrityError:
+                    # Created by a concurrent upload of the same content
+                    cls.objects.filter(pk=digest).update(ref_count=F('ref_count') + 1, updated_at=timezone.now())
+            # With the row locked and referenced, gc_blobs can no longer remove the file
+            return storage.blob_exists(digest)
+    
+    @classmethod
+    def release(cls, *digests):
+        """Drop one reference from each given blob (empty digests are ignored)."""
+        now = timezone.now()
+        for digest in digests:
+            if digest:
+                cls.objects.filter(pk=digest).update(ref_count=F('ref_count') - 1, updated_at=now)
+
+
+def store_upload(uploaded_file):
+    """Stream an upload into the content store and take a reference to it. Returns (digest, size)."""
+    digest, size = storage.store_file(uploaded_file)
+    if not StoredBlob.acquire(digest, size):
+        # Collected between storing and taking the reference: write the bytes again
+        uploaded_file.seek(0)
+        storage.store_file(uploaded_file)
+    return digest, size
 
 
 class SubProjectGalleryImage(models.Model):
-    """Model for storing gallery images for subprojects directly in database."""
+    """Gallery image of a subproject. The bytes live in the content store (see storage.py)."""
     subproject = models.ForeignKey(SubProject, on_delete=models.CASCADE, related_name='gallery_images')
     
-    # Replace ImageField with BinaryField
-    image = models.BinaryField(verbose_name="تصویر")
+    # Legacy storage: images uploaded before the content store keep their bytes
+    # here until move_blobs_to_storage has run
+    image = models.BinaryField(verbose_name="تصویر", null=True, blank=True)
+    
+    # SHA-256 of the image in the content store
+    content_hash = models.CharField(max_length=64, blank=True, default='', db_index=True)
+    file_size = models.PositiveIntegerField(default=0)
+    
+    # Resized copies in the content store, see image_variants.py
+    variants = models.JSONField(default=dict, blank=True)
     
     # Optional: Add mime type to help with image rendering
     image_mime_type = models.CharField(max_length=100, default='image/jpeg')
@@ -1075,6 +1209,64 @@ class SubProjectGalleryImage(models.Model):
             return f"{self.title} - {self.subproject}"
         return f"تصویر {self.id} - {self.subproject}"
 
+    @property
+    def url(self):
+        return reverse('creator_subproject:serve_gallery_image', args=[self.pk])
+    
+    def variant_url(self, name, webp=False):
+        return reverse('creator_subproject:serve_gallery_image_variant',
+                       args=[self.pk, f'{name}.webp' if webp else name])
+    
+    def _ordered_variants(self):
+        """(name, variant) smallest first. JSON columns may not keep key order, so follow VARIANT_SIZES."""
+        return [(name, self.variants[name]) for name, _size in VARIANT_SIZES if name in self.variants]
+    
+    @property
+    def thumbnail_url(self):
+        """Smallest available variant, or the original if none was generated."""
+        for name, variant in self._ordered_variants():
+            return self.variant_url(name)
+        return self.url
+    
+    def _srcset(self, webp):
+        entries = [
+            f"{self.variant_url(name, webp)} {variant['width']}w"
+            for name, variant in self._ordered_variants()
+            if not webp or variant.get('webp')
+        ]
+        return ', '.join(entries)
+    
+    @property
+    def srcset(self):
+        return self._srcset(webp=False)
+    
+    @property
+    def webp_srcset(self):
+        return self._srcset(webp=True)
+    
+    def open_image(self):
+        """Return a binary file object with the image content."""
+        if self.content_hash:
+            return storage.open_blob(self.content_hash)
+        import io
+        return io.BytesIO(bytes(self.image or b''))
+
+
+def variant_digests(variants):
+    """All blob digests referenced by a variants dict."""
+    digests = []
+    for variant in variants.values():
+        digests.append(variant['hash'])
+        if variant.get('webp'):
+            digests.append(variant['webp'])
+    return digests
+
+
+@receiver(post_delete, sender=SubProjectGalleryImage)
+def release_gallery_image_blobs(sender, instance, **kwargs):
+    """Release the stored image and its variants."""
+    StoredBlob.release(instance.content_hash, *variant_digests(instance.variants))
+
 
 class FinancialDocument(models.Model):
     """
@@ -1145,14 +1337,25 @@ class FinancialDocument(models.Model):
             return gregorian_to_jalali(self.approval_date)
         return None
 
+class DocumentFileManager(models.Manager):
+    """Leaves the legacy file blob out of queries unless it is asked for."""
+    def get_queryset(self):
+        return super().get_queryset().defer('file')
+
+
 class DocumentFile(models.Model):
     """
     Files attached to financial documents
     """
     document = models.ForeignKey(FinancialDocument, on_delete=models.CASCADE, related_name='documents')
     
-    # Replace FileField with BinaryField
-    file = models.BinaryField(verbose_name=_('فایل'))
+    # Legacy storage: files uploaded before the content store keep their bytes
+    # here until move_blobs_to_storage has run
+    file = models.BinaryField(verbose_name=_('فایل'), null=True, blank=True)
+    
+    # SHA-256 of the file in the content store (see storage.py)
+    content_hash = models.CharField(max_length=64, blank=True, default='', db_index=True)
+    file_size = models.PositiveBigIntegerField(default=0)
     
     # Add mime type to help with file rendering
     file_mime_type = models.CharField(max_length=100, default='application/octet-stream', verbose_name=_("نوع فایل (MIME)"))
@@ -1160,16 +1363,82 @@ class DocumentFile(models.Model):
     filename = models.CharField(max_length=255, verbose_name=_('نام فایل'))
     uploaded_at = models.DateTimeField(auto_now_add=True)
     
+    objects = DocumentFileManager()
+    
     class Meta:
         db_table = 'creator_subproject_documentfile'
     
     def __str__(self):
         return self.filename
+    
+    @classmethod
+    def create_from_upload(cls, document, uploaded_file):
+        """Stream an uploaded file into the content store and attach it to document."""
+        from django.db import transaction
+        with transaction.atomic():
+            digest, size = store_upload(uploaded_file)
+            document_file = cls.objects.create(
+                document=document,
+                content_hash=digest,
+                file_size=size,
+                filename=uploaded_file.name,
+                file_mime_type=uploaded_file.content_type or 'application/octet-stream',
+            )
+        
+        # PDFs are made searchable in the background
+        from .text_index import schedule_text_extraction
+        schedule_text_extraction(document_file)
+        return document_file
+    
+    def open_file(self):
+        """Return a binary file object with the file content."""
+        if self.content_hash:
+            return storage.open_blob(self.content_hash)
+        import io
+        return io.BytesIO(bytes(self.file or b''))
 
     def get_absolute_url(self):
         from django.urls import reverse  # Moved import inside the method
         return reverse('creator_subproject:serve_document_file', args=[self.pk])
 
+@receiver(post_delete, sender=DocumentFile)
+def release_document_file_blob(sender, instance, **kwargs):
+    """Release the stored file; gc_blobs removes it once nothing refers to it."""
+    StoredBlob.release(instance.content_hash)
+
+class DocumentText(models.Model):
+    """Normalized text extracted from a document file (see text_index.py)."""
+    STATUS_DONE = 'done'
+    STATUS_EMPTY = 'empty'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_DONE, 'استخراج شده'),
+        (STATUS_EMPTY, 'بدون متن'),
+        (STATUS_FAILED, 'ناموفق'),
+    )
+    
+    document_file = models.OneToOneField(DocumentFile, on_delete=models.CASCADE, related_name='text_index')
+    document = models.ForeignKey(FinancialDocument, on_delete=models.CASCADE, related_name='texts')
+    text = models.TextField(blank=True)
+    page_count = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_DONE)
+    error = models.TextField(blank=True)
+    extracted_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.document_file} ({self.get_status_display()})"
+
+
+class DocumentTextToken(models.Model):
+    """Inverted index entry: one distinct normalized word of a DocumentText."""
+    token = models.CharField(max_length=64)
+    document_text = models.ForeignKey(DocumentText, on_delete=models.CASCADE, related_name='tokens')
+    
+    class Meta:
+        # Token first, so exact and prefix lookups use the index
+        unique_together = ('token', 'document_text')
+
+
 class Payment(models.Model):
     """
     Represents a payment record in the system.
@@ -0,0 +1,407 @@
+"""
+Dependency-based scheduling of subprojects.
+
+Subprojects form a dependency graph through related_subproject: each one
+has at most one predecessor, and the relationship type decides which end
+of the predecessor it is tied to. The scheduler builds that graph once,
+orders it topologically and computes every date in a single pass, so
+chains of any depth resolve and cycles are reported instead of silently
+left unresolved.
+"""
+import datetime
+from collections import deque
+
+# Relationship types (see SubProject.RELATIONSHIP_TYPE_CHOICES)
+AFTER = 'بعد از'
+BEFORE = 'قبل از'
+START_WITH = 'شروع با'
+END_WITH = 'پایان با'
+FLOATING = 'شناور'
+
+DEPENDENT_RELATIONSHIPS = (AFTER, BEFORE, START_WITH, END_WITH)
+
+# Duration used for subprojects without an estimate on the Gantt chart
+DEFAULT_GANTT_DURATION = 180
+
+
+def relationship_dates(relationship_type, related_start, related_end, delay_days, duration_days):
+    """
+    Return (start, end) of a subproject tied to a related subproject,
+    or None if the relationship type does not define a dependency.
+    """
+    delay = datetime.timedelta(days=delay_days or 0)
+    duration = datetime.timedelta(days=duration_days or 0)
+
+    if relationship_type == AFTER:
+        # Start AFTER the related project ENDS (+ delay)
+        start = related_end + delay
+        return start, start + duration
+    if relationship_type == BEFORE:
+        # End BEFORE the related project STARTS (- delay)
+        end = related_start - delay
+        return end - duration, end
+    if relationship_type == START_WITH:
+        # Start WITH the related project START (+ delay)
+        start = related_start + delay
+        return start, start + duration
+    if relationship_type == END_WITH:
+        # End WITH the related project END (+ delay)
+        end = related_end + delay
+        return end - duration, end
+    return None
+
+
+class ScheduleTask:
+    """
+    One node of the schedule.
+
+    A task is either fixed (start/end are given, e.g. from a contract) or
+    dependent on related_id through relationship_type.
+    """
+
+    __slots__ = ('id', 'related_id', 'relationship_type', 'delay', 'duration', 'start', 'end', 'fixed')
+
+    def __init__(self, id, related_id=None, relationship_type=None, delay=0, duration=0,
+                 start=None, end=None, fixed=False):
+        self.id = id
+        self.related_id = related_id
+        self.relationship_type = relationship_type
+        self.delay = delay or 0
+        self.duration = duration or 0
+        self.start = start
+        self.end = end
+        self.fixed = fixed
+
+    @property
+    def is_dependent(self):
+        return (not self.fixed and self.related_id is not None
+                and self.relationship_type in DEPENDENT_RELATIONSHIPS)
+
+
+class ScheduleResult:
+    """
+    Output of schedule().
+
+    dates maps task id to (start, end); tasks that could not be scheduled
+    (part of a cycle, downstream of one, or tied to an unknown task) map to
+    (None, None). order lists scheduled ids in topological order, and
+    cycles lists each dependency cycle as a list of ids.
+    """
+
+    def __init__(self, dates, order, cycles, unresolved):
+        self.dates = dates
+        self.order = order
+        self.cycles = cycles
+        self.unresolved = unresolved
+
+    @property
+    def has_cycles(self):
+        return bool(self.cycles)
+
+
+def find_cycles(tasks):
+    """
+    Return the dependency cycles among tasks as lists of ids.
+    Each task has at most one predecessor, so following related_id from
+    any node either terminates or loops back into exactly one cycle.
+    """
+    by_id = {task.id: task for task in tasks}
+    state = {}  # id -> 1 while on the current walk, 2 when finished
+    cycles = []
+    for task in tasks:
+        path = []
+        current = task
+        while current is not None and current.id not in state:
+            state[current.id] = 1
+            path.append(current.id)
+            current = by_id.get(current.related_id) if current.is_dependent else None
+        if current is not None and state.get(current.id) == 1:
+            cycles.append(path[path.index(current.id):])
+        for task_id in path:
+            state[task_id] = 2
+    return cycles
+
+
+def schedule(tasks, keep_dates=False):
+    """
+    Compute the dates of all tasks in one topological pass (Kahn's algorithm).
+    Runs in O(n) for n tasks.
+
+    With keep_dates, a dependent task whose related task is unknown, undated
+    or on a cycle keeps its own start/end, as SubProject.calculate_dates()
+    does on save; otherwise it is left unscheduled.
+    """
+    by_id = {task.id: task for task in tasks}
+    dependents = {}
+    pending = deque()
+    unresolved = set()
+
+    for task in tasks:
+        if task.is_dependent and task.related_id in by_id:
+            dependents.setdefault(task.related_id, []).append(task.id)
+        elif task.is_dependent and not keep_dates:
+            unresolved.add(task.id)
+        else:
+            pending.append(task.id)
+
+    dates = {}
+    order = []
+    while pending:
+        task_id = pending.popleft()
+        task = by_id[task_id]
+        if task.is_dependent:
+            related_start, related_end = dates.get(task.related_id, (None, None))
+            if related_start is not None and related_end is not None:
+                dates[task_id] = relationship_dates(
+                    task.relationship_type, related_start, related_end, task.delay, task.duration)
+                order.append(task_id)
+            elif keep_dates:
+                dates[task_id] = (task.start, task.end)
+                order.append(task_id)
+            else:
+                dates[task_id] = (None, None)
+                unresolved.add(task_id)
+        else:
+            dates[task_id] = (task.start, task.end)
+            order.append(task_id)
+        pending.extend(dependents.get(task_id, ()))
+
+    # Anything never reached is on a cycle or downstream of one
+    missing = [task_id for task_id in by_id if task_id not in dates]
+    cycles = find_cycles(tasks) if missing else []
+    for task_id in missing:
+        task = by_id[task_id]
+        dates[task_id] = (task.start, task.end) if keep_dates else (None, None)
+        unresolved.add(task_id)
+
+    return ScheduleResult(dates, order, cycles, unresolved)
+
+
+def saved_task(id, related_id, relationship_type, delay, duration, start, end,
+               contract_start, contract_end):
+    """
+    Build a task using the rules applied when a subproject is saved (see
+    SubProject.calculate_dates()): contract dates win, related subprojects
+    drive the dates with a 30 day default duration, and anything else keeps
+    its stored dates. Use with schedule(..., keep_dates=True).
+    """
+    if contract_start and contract_end:
+        return ScheduleTask(id, start=contract_start, end=contract_end, fixed=True)
+    if related_id and relationship_type in DEPENDENT_RELATIONSHIPS:
+        return ScheduleTask(id, related_id=related_id, relationship_type=relationship_type,
+                            delay=delay, duration=duration or 30, start=start, end=end)
+    return ScheduleTask(id, start=start, end=end, fixed=True)
+
+
+def saved_task_for_subproject(subproject):
+    """Build the saved-dates task for a SubProject instance without touching its relations."""
+    return saved_task(
+        subproject.id,
+        subproject.related_subproject_id,
+        subproject.relationship_type,
+        subproject.relationship_delay,
+        subproject.imagenary_duration,
+        subproject.start_date,
+        subproject.end_date,
+        subproject.contract_start_date,
+        subproject.contract_end_date,
+    )
+
+
+def apply_overrides(tasks, overrides):
+    """
+    Return copies of tasks with what-if overrides applied. overrides maps a
+    task id to a dict with any of:
+        slip      days the task slips (later): fixed tasks move, dependent
+                  tasks get their delay changed by the days
+        delay     new relationship delay in days
+        duration  new duration in days
+        start/end fixed dates (the task no longer follows its relationship)
+    """
+    result = []
+    for task in tasks:
+        override = overrides.get(task.id)
+        if not override:
+            result.append(task)
+            continue
+
+        task = ScheduleTask(task.id, task.related_id, task.relationship_type, task.delay,
+                            task.duration, task.start, task.end, task.fixed)
+        if 'start' in override or 'end' in override:
+            task.start = override.get('start', task.start)
+            task.end = override.get('end', task.end)
+            task.fixed = True
+        if 'delay' in override:
+            task.delay = override['delay']
+        if 'duration' in override:
+            task.duration = override['duration']
+            if task.fixed and task.start:
+                task.end = task.start + datetime.timedelta(days=task.duration)
+        if override.get('slip'):
+            if task.is_dependent:
+                # The delay moves a BEFORE task earlier, every other relationship later
+                task.delay += -override['slip'] if task.relationship_type == BEFORE else override['slip']
+            else:
+                slip = datetime.timedelta(days=override['slip'])
+                task.start = task.start + slip if task.start else None
+                task.end = task.end + slip if task.end else None
+        result.append(task)
+    return result
+
+
+def gantt_task(id, related_id, relationship_type, delay, duration, start, end, has_contract, today):
+    """
+    Build a task using the Gantt chart rules: subprojects with a contract
+    keep their dates, floating or unrelated subprojects start today, and
+    the rest follow their related subproject.
+    """
+    duration = duration or DEFAULT_GANTT_DURATION
+    if has_contract:
+        if not start or not end:
+            start, end = today, today + datetime.timedelta(days=duration)
+        return ScheduleTask(id, start=start, end=end, duration=duration, fixed=True)
+
+    if relationship_type == FLOATING or not related_id or not relationship_type:
+        return ScheduleTask(id, start=today, end=today + datetime.timedelta(days=duration),
+                            duration=duration, fixed=True)
+
+    return ScheduleTask(id, related_id=related_id, relationship_type=relationship_type,
+                        delay=delay, duration=duration)
+
+
+def gantt_task_for_subproject(subproject, today):
+    """Build the Gantt task for a SubProject instance without touching its relations."""
+    return gantt_task(
+        subproject.id,
+        subproject.related_subproject_id,
+        subproject.relationship_type,
+        subproject.relationship_delay,
+        subproject.imagenary_duration,
+        subproject.start_date,
+        subproject.end_date,
+        bool(subproject.contract_amount),
+        today,
+    )
+
+
+class CriticalPathResult:
+    """
+    Output of analyze_critical_path().
+
+    early_start/early_finish are the scheduled dates, late_start/late_finish
+    the latest dates that do not delay the project finish, and total_float
+    the slack in days. critical_path lists the ids with no slack, in
+    chronological order.
+    """
+
+    def __init__(self, early_start, early_finish, late_start, late_finish, total_float,
+                 critical_path, project_finish):
+        self.early_start = early_start
+        self.early_finish = early_finish
+        self.late_start = late_start
+        self.late_finish = late_finish
+        self.total_float = total_float
+        self.critical_path = critical_path
+        self.project_finish = project_finish
+
+    def as_dict(self, task_id):
+        """Per-task fields as exposed by the Gantt API."""
+        if task_id not in self.total_float:
+            return {'earlyStart': '', 'earlyFinish': '', 'lateStart': '', 'lateFinish': '',
+                    'totalFloat': None, 'isCritical': False}
+        return {
+            'earlyStart': self.early_start[task_id].strftime('%Y-%m-%d'),
+            'earlyFinish': self.early_finish[task_id].strftime('%Y-%m-%d'),
+            'lateStart': self.late_start[task_id].strftime('%Y-%m-%d'),
+            'lateFinish': self.late_finish[task_id].strftime('%Y-%m-%d'),
+            'totalFloat': self.total_float[task_id],
+            'isCritical': self.total_float[task_id] <= 0,
+        }
+
+
+def _precedence_edges(task, related):
+    """
+    Translate a dependency into a precedence edge (earlier, later, kind, lag).
+    kind is 'FS', 'SS' or 'FF'. A 'before' relationship places the dependent
+    ahead of its related subproject, so the edge is reversed.
+    """
+    if task.relationship_type == AFTER:
+        return related, task.id, 'FS', task.delay
+    if task.relationship_type == START_WITH:
+        return related, task.id, 'SS', task.delay
+    if task.relationship_type == END_WITH:
+        return related, task.id, 'FF', task.delay
+    if task.relationship_type == BEFORE:
+        return task.id, related, 'FS', task.delay
+    return None
+
+
+def analyze_critical_path(tasks, result):
+    """
+    Critical path analysis over a schedule produced by schedule().
+
+    The forward pass is the schedule itself (early dates). The backward pass
+    walks the precedence graph in reverse topological order to get late
+    dates against the project finish (latest early finish). Every subproject
+    has at most one related subproject, so the graph has n - 1 edges at most
+    and the whole analysis is O(n).
+    """
+    early_start = {}
+    early_finish = {}
+    for task_id, (start, end) in result.dates.items():
+        if start is not None and end is not None:
+            early_start[task_id] = start
+            early_finish[task_id] = end
+
+    if not early_start:
+        return CriticalPathResult({}, {}, {}, {}, {}, [], None)
+
+    by_id = {task.id: task for task in tasks}
+    successors = {task_id: [] for task_id in early_start}
+    in_degree = {task_id: 0 for task_id in early_start}
+    for task_id in early_start:
+        task = by_id[task_id]
+        if not task.is_dependent or task.related_id not in early_start:
+            continue
+        edge = _precedence_edges(task, task.related_id)
+        if edge:
+            earlier, later, kind, lag = edge
+            successors[earlier].append((later, kind, lag))
+            in_degree[later] += 1
+
+    # Topological order of the precedence graph
+    order = []
+    pending = deque(task_id for task_id, degree in in_degree.items() if degree == 0)
+    while pending:
+        task_id = pending.popleft()
+        order.append(task_id)
+        for later, _, _ in successors[task_id]:
+            in_degree[later] -= 1
+            if in_degree[later] == 0:
+                pending.append(later)
+
+    project_finish = max(early_finish.values())
+    late_start = {}
+    late_finish = {}
+    for task_id in reversed(order):
+        duration = early_finish[task_id] - early_start[task_id]
+        finish = project_finish
+        for later, kind, lag in successors[task_id]:
+            lag = datetime.timedelta(days=lag or 0)
+            if kind == 'FS':
+                bound = late_start[later] - lag
+            elif kind == 'SS':
+                bound = late_start[later] - lag + duration
+            else:
+                bound = late_finish[later] - lag
+            finish = min(finish, bound)
+        late_finish[task_id] = finish
+        late_start[task_id] = finish - duration
+
+    total_float = {task_id: (late_start[task_id] - early_start[task_id]).days for task_id in order}
+    critical_path = sorted(
+        (task_id for task_id in order if total_float[task_id] <= 0),
+        key=lambda task_id: (early_start[task_id], early_finish[task_id])
+    )
+    return CriticalPathResult(early_start, early_finish, late_start, late_finish, total_float,
+                              critical_path, project_finish)
@@ -0,0 +1,86 @@
+"""
+Content-addressed file storage for uploaded files.
+
+Files are stored once per content under their SHA-256 digest:
+
+    <CONTENT_STORE_ROOT>/ab/cd/abcd1234...
+
+Writes go to a temporary file in the store and are renamed into place, so
+a blob is either complete or absent, and storing the same bytes twice
+leaves a single copy.
+"""
+import os
+import hashlib
+import tempfile
+from django.conf import settings
+
+STORE_ROOT = getattr(settings, 'CONTENT_STORE_ROOT', os.path.join(settings.MEDIA_ROOT, 'content'))
+
+# Size of the pieces read while hashing or copying files
+CHUNK_SIZE = 64 * 1024
+
+
+def blob_path(digest):
+    """Return the absolute path of the blob with the given SHA-256 hex digest."""
+    return os.path.join(STORE_ROOT, digest[:2], digest[2:4], digest)
+
+
+def blob_exists(digest):
+    return bool(digest) and os.path.exists(blob_path(digest))
+
+
+def store_chunks(chunks):
+    """
+    Store an iterable of byte strings and return (digest, size).
+    The data is hashed while it is written, so it is never held in memory.
+    """
+    os.makedirs(STORE_ROOT, exist_ok=True)
+    sha256 = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=STORE_ROOT, prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                sha256.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+
+        digest = sha256.hexdigest()
+        path = blob_path(digest)
+        try:
+            # Already stored: refresh its mtime so gc_blobs does not take it for an old untracked file
+            os.utime(path)
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        return digest, size
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def store_file(uploaded_file):
+    """Store a Django UploadedFile (or any file object) and return (digest, size)."""
+    if hasattr(uploaded_file, 'chunks'):
+        return store_chunks(uploaded_file.chunks(CHUNK_SIZE))
+    return store_chunks(iter(lambda: uploaded_file.read(CHUNK_SIZE), b''))
+
+
+def store_bytes(data):
+    """Store an in-memory byte string and return (digest, size)."""
+    return store_chunks([bytes(data)])
+
+
+def open_blob(digest):
+    """Open a stored blob for binary reading."""
+    return open(blob_path(digest), 'rb')
+
+
+def delete_blob(digest):
+    """Remove a blob from the store. Missing blobs are ignored."""
+    try:
+        os.remove(blob_path(digest))
+    except FileNotFoundError:
+        pass
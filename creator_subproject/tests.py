@@ -1,3 +1,96 @@
-from django.test import TestCase
+import datetime
+from django.test import SimpleTestCase
+from .scheduling import (
+    ScheduleTask, schedule, gantt_task, analyze_critical_path, apply_overrides, AFTER, BEFORE, START_WITH, END_WITH, FLOATING
+)
 
 # Create your tests here.
+
+class SchedulerTest(SimpleTestCase):
+    def setUp(self):
+        self.today = datetime.date(2025, 1, 1)
+
+    def test_chain_deeper_than_ten_is_resolved(self):
+        """Test that long dependency chains are scheduled in one pass"""
+        tasks = [ScheduleTask(0, start=self.today, end=self.today + datetime.timedelta(days=10), fixed=True)]
+        for i in range(1, 25):
+            tasks.append(ScheduleTask(i, related_id=i - 1, relationship_type=AFTER, duration=10))
+        # Reverse the order so dependents come before their predecessors
+        result = schedule(list(reversed(tasks)))
+        self.assertFalse(result.has_cycles)
+        self.assertEqual(result.dates[24], (self.today + datetime.timedelta(days=240),
+                                            self.today + datetime.timedelta(days=250)))
+
+    def test_relationship_types(self):
+        """Test that before/end-with relationships anchor the end date"""
+        start, end = self.today, self.today + datetime.timedelta(days=30)
+        tasks = [
+            ScheduleTask(1, start=start, end=end, fixed=True),
+            ScheduleTask(2, related_id=1, relationship_type=BEFORE, delay=5, duration=10),
+            ScheduleTask(3, related_id=1, relationship_type=END_WITH, delay=2, duration=10),
+        ]
+        result = schedule(tasks)
+        self.assertEqual(result.dates[2], (start - datetime.timedelta(days=15), start - datetime.timedelta(days=5)))
+        self.assertEqual(result.dates[3], (end - datetime.timedelta(days=8), end + datetime.timedelta(days=2)))
+
+    def test_cycles_are_reported(self):
+        """Test that circular relationships are reported instead of ignored"""
+        tasks = [
+            ScheduleTask(1, related_id=2, relationship_type=AFTER, duration=5),
+            ScheduleTask(2, related_id=1, relationship_type=AFTER, duration=5),
+            ScheduleTask(3, related_id=2, relationship_type=AFTER, duration=5),
+        ]
+        result = schedule(tasks)
+        self.assertEqual(len(result.cycles), 1)
+        self.assertEqual(sorted(result.cycles[0]), [1, 2])
+        self.assertEqual(result.dates[3], (None, None))
+        self.assertIn(3, result.unresolved)
+
+    def test_gantt_floating_starts_today(self):
+        """Test that floating subprojects start today on the Gantt chart"""
+        task = gantt_task(1, 2, FLOATING, 0, None, None, None, False, self.today)
+        result = schedule([task])
+        self.assertEqual(result.dates[1], (self.today, self.today + datetime.timedelta(days=180)))
+
+    def test_critical_path_and_float(self):
+        """Test late dates and float: the long branch is critical, the short one has slack"""
+        day = datetime.timedelta(days=1)
+        tasks = [
+            ScheduleTask(1, start=self.today, end=self.today + 10 * day, fixed=True),
+            ScheduleTask(2, related_id=1, relationship_type=AFTER, duration=30),
+            ScheduleTask(3, related_id=1, relationship_type=START_WITH, delay=5, duration=10),
+            ScheduleTask(4, related_id=2, relationship_type=END_WITH, duration=5),
+        ]
+        analysis = analyze_critical_path(tasks, schedule(tasks))
+        self.assertEqual(analysis.project_finish, self.today + 40 * day)
+        self.assertEqual(analysis.critical_path, [1, 2, 4])
+        self.assertEqual(analysis.total_float[3], 25)
+        self.assertEqual(analysis.late_start[3], self.today + 30 * day)
+
+    def test_slip_override_moves_dependents(self):
+        """Test that a what-if slip moves the chain without touching the original tasks"""
+        day = datetime.timedelta(days=1)
+        tasks = [
+            ScheduleTask(1, start=self.today, end=self.today + 10 * day, fixed=True),
+            ScheduleTask(2, related_id=1, relationship_type=AFTER, duration=5),
+            ScheduleTask(3, related_id=99, relationship_type=AFTER, duration=5,
+                         start=self.today, end=self.today + 5 * day),
+        ]
+        result = schedule(apply_overrides(tasks, {1: {'slip': 60}}), keep_dates=True)
+        self.assertEqual(result.dates[2], (self.today + 70 * day, self.today + 75 * day))
+        # Unknown related subprojects keep their stored dates
+        self.assertEqual(result.dates[3], (self.today, self.today + 5 * day))
+        self.assertEqual(tasks[0].start, self.today)
+
+    def test_slip_override_on_before_task_moves_it_later(self):
+        """Test that slipping a BEFORE-dependent task pushes it and its dependents later"""
+        day = datetime.timedelta(days=1)
+        tasks = [
+            ScheduleTask(1, start=self.today, end=self.today + 10 * day, fixed=True),
+            ScheduleTask(2, related_id=1, relationship_type=BEFORE, delay=5, duration=10),
+            ScheduleTask(3, related_id=2, relationship_type=AFTER, duration=5),
+        ]
+        result = schedule(apply_overrides(tasks, {2: {'slip': 60}}))
+        self.assertEqual(result.dates[2], (self.today + 45 * day, self.today + 55 * day))
+        self.assertEqual(result.dates[3], (self.today + 55 * day, self.today + 60 * day))
+        self.assertEqual(tasks[1].delay, 5)
@@ -0,0 +1,164 @@
+"""
+Text extraction and search for financial document files.
+
+Text is pulled out of uploaded PDFs in the background, normalized (Arabic
+letter forms, Persian/Arabic digits, diacritics, half-spaces) and split
+into tokens. Each distinct token is stored in DocumentTextToken, an
+inverted index keyed on (token, document_text), so a search is one query
+of indexed lookups instead of opening files or scanning text with LIKE.
+"""
+import re
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from .background import run_after_commit
+
+try:
+    from PyPDF2 import PdfReader
+    PYPDF2_AVAILABLE = True
+except ImportError:
+    PYPDF2_AVAILABLE = False
+
+# Limits that keep a single huge scan from tying up a worker
+MAX_PAGES = 200
+MAX_TEXT_LENGTH = 200000
+MAX_TOKEN_LENGTH = 64
+
+_CHARACTER_MAP = str.maketrans({
+    'ي': 'ی', 'ى': 'ی', 'ئ': 'ی',
+    'ك': 'ک',
+    'ة': 'ه', 'ۀ': 'ه',
+    'أ': 'ا', 'إ': 'ا', 'ٱ': 'ا',
+    'ؤ': 'و',
+    '۰': '0', '۱': '1', '۲': '2', '۳': '3', '۴': '4',
+    '۵': '5', '۶': '6', '۷': '7', '۸': '8', '۹': '9',
+    '٠': '0', '١': '1', '٢': '2', '٣': '3', '٤': '4',
+    '٥': '5', '٦': '6', '٧': '7', '٨': '8', '٩': '9',
+    '\u200c': ' ',  # zero-width non-joiner (half-space)
+    '\u200d': None,  # zero-width joiner
+    '\u0640': None,  # tatweel
+})
+
+# Arabic diacritics (harakat, tanwin, superscript alef)
+_DIACRITICS = re.compile('[\u064b-\u065f\u0670]')
+
+# Words, and compounds such as letter numbers (123/45, 1403-52)
+_TOKEN = re.compile(r'\w+(?:[/\-.]\w+)*')
+
+
+def normalize_text(text):
+    """Normalize Persian text so that different spellings of the same word match."""
+    text = _DIACRITICS.sub('', text.translate(_CHARACTER_MAP))
+    return re.sub(r'\s+', ' ', text).strip().lower()
+
+
+def tokenize(text):
+    """
+    Return the distinct tokens of normalized text. Compounds like 123/45
+    are indexed both whole and by their parts.
+    """
+    tokens = set()
+    for match in _TOKEN.finditer(text):
+        token = match.group()
+        tokens.add(token[:MAX_TOKEN_LENGTH])
+        if any(separator in token for separator in '/-.'):
+            tokens.update(part[:MAX_TOKEN_LENGTH] for part in re.split(r'[/\-.]', token) if part)
+    return tokens
+
+
+def is_pdf(document_file):
+    return (document_file.file_mime_type == 'application/pdf'
+            or document_file.filename.lower().endswith('.pdf'))
+
+
+def extract_pdf_text(file_obj):
+    """Return (text, page_count) of a PDF file object."""
+    reader = PdfReader(file_obj)
+    parts = []
+    length = 0
+    for page in reader.pages[:MAX_PAGES]:
+        page_text = page.extract_text() or ''
+        parts.append(page_text)
+        length += len(page_text)
+        if length >= MAX_TEXT_LENGTH:
+            break
+    return '\n'.join(parts)[:MAX_TEXT_LENGTH], len(reader.pages)
+
+
+def index_document_file(document_file_id):
+    """Extract, normalize and index the text of one document file."""
+    from .models import DocumentFile, DocumentText, DocumentTextToken
+
+    document_file = DocumentFile.objects.get(pk=document_file_id)
+    status, error, text, page_count = DocumentText.STATUS_DONE, '', '', 0
+    try:
+        with document_file.open_file() as f:
+            raw_text, page_count = extract_pdf_text(f)
+        text = normalize_text(raw_text)
+        if not text:
+            status = DocumentText.STATUS_EMPTY
+    except Exception as e:
+        status, error = DocumentText.STATUS_FAILED, str(e)[:1000]
+
+    # The file name is searchable too, even when the PDF has no text layer
+    tokens = tokenize(text) | tokenize(normalize_text(document_file.filename))
+
+    with transaction.atomic():
+        document_text, _ = DocumentText.objects.update_or_create(
+            document_file=document_file,
+            defaults={
+                'document_id': document_file.document_id,
+                'text': text,
+                'page_count': page_count,
+                'status': status,
+                'error': error,
+            },
+        )
+        document_text.tokens.all().delete()
+        DocumentTextToken.objects.bulk_create(
+            [DocumentTextToken(token=token, document_text=document_text) for token in tokens],
+            batch_size=1000,
+        )
+    return document_text
+
+
+def schedule_text_extraction(document_file):
+    """Queue text extraction for an uploaded PDF once the upload is committed."""
+    if PYPDF2_AVAILABLE and is_pdf(document_file):
+        run_after_commit(index_document_file, document_file.pk)
+
+
+def search(query, queryset=None, limit=50):
+    """
+    Return DocumentText rows matching every word of query (words of three or
+    more characters also match as prefixes), best matches first.
+    """
+    from .models import DocumentText, DocumentTextToken
+
+    words = sorted(tokenize(normalize_text(query)), key=len, reverse=True)[:8]
+    if not words:
+        return DocumentText.objects.none()
+
+    # The permission scope comes first and every word is an indexed EXISTS
+    # on the token table, so the intersection is done by the database
+    results = queryset if queryset is not None else DocumentText.objects.all()
+    for word in words:
+        lookup = {'token__startswith': word} if len(word) >= 3 else {'token': word}
+        results = results.filter(Exists(DocumentTextToken.objects.filter(document_text=OuterRef('pk'), **lookup)))
+
+    # Rank exact token hits above prefix-only hits; a correlated count
+    # keeps the outer query free of a join and GROUP BY over the text
+    exact_hits = (DocumentTextToken.objects.filter(document_text=OuterRef('pk'), token__in=words)
+                  .values('document_text').annotate(hits=Count('id')).values('hits'))
+    results = results.annotate(exact_hits=Coalesce(Subquery(exact_hits), 0))
+    return results.order_by('-exact_hits', '-document_id')[:limit]
+
+
+def snippet(text, query, width=80):
+    """A short excerpt of normalized text around the first matching word."""
+    for word in sorted(tokenize(normalize_text(query)), key=len, reverse=True):
+        position = text.find(word)
+        if position >= 0:
+            start = max(position - width // 2, 0)
+            return ('…' if start else '') + text[start:start + width] + ('…' if start + width < len(text) else '')
+    return text[:width]
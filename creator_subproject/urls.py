@@ -20,6 +20,8 @@ urlpatterns = [
     path('financial-document/<int:document_id>/delete/', views.delete_financial_document, name='delete_financial_document'),
     path('document-file/delete/<int:pk>/', views.delete_document_file, name='delete_document_file'),
     path('document-file/serve/<int:pk>/', views.serve_document_file, name='serve_document_file'), # New URL
+    path('documents/bundle/<str:scope>/<int:pk>/', views.download_documents_bundle, name='download_documents_bundle'),
+    path('api/documents/search/', views.search_documents, name='search_documents'),
     
     # Backward compatibility URLs for allocations
     path('subproject/<int:subproject_id>/allocations/', views.financial_documents, name='allocations'),
@@ -44,6 +46,8 @@ urlpatterns = [
     path('subproject/<int:pk>/gallery/', views.subproject_gallery, name='subproject_gallery'),
     path('subproject/<int:subproject_id>/gallery/upload/', views.upload_gallery_image, name='upload_gallery_image'),
     path('gallery/image/<int:image_id>/delete/', views.delete_gallery_image, name='delete_gallery_image'),
+    path('gallery/image/<int:image_id>/', views.serve_gallery_image, name='serve_gallery_image'),
+    path('gallery/image/<int:image_id>/<str:variant>/', views.serve_gallery_image_variant, name='serve_gallery_image_variant'),
     
     # Project situation URLs
     path('project/<int:project_id>/situations/', views.project_situations_list, name='project_situations_list'),
@@ -55,4 +59,6 @@ urlpatterns = [
     # API endpoints
     path('api/subproject/<int:subproject_id>/dates/', views.get_subproject_dates, name='get_subproject_dates'),
     path('api/project/<int:project_id>/gantt-data/', views.get_project_gantt_data, name='get_project_gantt_data'),
+    path('api/portfolio/gantt-data/', views.get_portfolio_gantt_data, name='get_portfolio_gantt_data'),
+    path('api/project/<int:project_id>/simulate/', views.simulate_project_schedule, name='simulate_project_schedule'),
 ] 
\ No newline at end of file
@@ -1,30 +1,31 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import HttpResponseForbidden, JsonResponse, HttpResponseNotFound, HttpResponse
+from django.http import HttpResponseForbidden, JsonResponse, HttpResponseNotFound, HttpResponse, Http404
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.db.models import Q, F, Sum, Case, When, Value, DecimalField, ExpressionWrapper, Max
+from django.db.models import Q, F, Sum, Case, When, Value, DecimalField, ExpressionWrapper, Max, Count
 from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.urls import reverse
+from django.core.cache import cache
 import json
 import datetime
 from dateutil.relativedelta import relativedelta
 import jdatetime  # Import jdatetime for Persian date conversion
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import ListView
+from django.views.decorators.http import require_POST
 from django.utils.translation import gettext as _
 from django.core.exceptions import PermissionDenied
 import os
 from decimal import Decimal, InvalidOperation
-import base64 # Added for base64 image encoding
 
 from creator_project.models import Project, ALL_Project
 from accounts.models import User
 from .models import (
     SubProject, SituationReport, SubProjectRejectionComment, 
     ProjectSituation, SubProjectUpdateHistory, AdjustmentSituationReport, SubProjectGalleryImage,
-    FinancialDocument, Payment, DocumentFile, FINANCIAL_DOCUMENT_TYPES
+    FinancialDocument, Payment, DocumentFile, FINANCIAL_DOCUMENT_TYPES, store_upload
 )
 from .forms import (
     SubProjectForm, SubProjectRejectionForm, SituationReportForm, 
@@ -32,6 +33,14 @@ from .forms import (
     FinancialDocumentForm, PaymentForm, DocumentFileForm
 )
 from .utils import jalali_to_gregorian, gregorian_to_jalali
+from .image_variants import schedule_variants
+from .scheduling import (
+    relationship_dates, gantt_task, gantt_task_for_subproject, saved_task_for_subproject, schedule,
+    analyze_critical_path, apply_overrides
+)
+
+# Gantt data is cached until a subproject of the project changes (or the day rolls over)
+GANTT_CACHE_TIMEOUT = 60 * 60 * 24
 
 def can_modify_project(user, project):
     """
@@ -125,12 +134,16 @@ def subproject_detail(request, pk):
     # Get rejection comments if any
     rejection_comments = subproject.rejection_comments.all()
     
+    # Latest gallery images, without their legacy blobs
+    latest_gallery_images = subproject.gallery_images.defer('image')[:3]
+    
     # Prepare context
     context = {
         'subproject': subproject,
         'allocations': financial_documents,  # For backward compatibility in templates
         'adjustment_allocations': payments,  # For backward compatibility in templates
         'rejection_comments': rejection_comments,
+        'latest_gallery_images': latest_gallery_images,
         'latest_situation_report': financial_documents.first() if financial_documents else None,
         'latest_adjustment_report': payments.first() if payments else None,
     }
@@ -219,25 +232,10 @@ def calculate_dates_based_on_relationship(subproject, post_data, related_subproj
         return
         
     # Calculate dates based on relationship type
-    if relationship_type == 'بعد از':  # After
-        # Start AFTER the related project ENDS (+ delay)
-        subproject.start_date = related_subproject.end_date + datetime.timedelta(days=delay_days)
-        subproject.end_date = subproject.start_date + datetime.timedelta(days=imagenary_duration)
-        
-    elif relationship_type == 'قبل از':  # Before
-        # End BEFORE the related project STARTS (- delay)
-        subproject.end_date = related_subproject.start_date - datetime.timedelta(days=delay_days)
-        subproject.start_date = subproject.end_date - datetime.timedelta(days=imagenary_duration)
-        
-    elif relationship_type == 'شروع با':  # Start With
-        # Start WITH the related project START (+ delay)
-        subproject.start_date = related_subproject.start_date + datetime.timedelta(days=delay_days)
-        subproject.end_date = subproject.start_date + datetime.timedelta(days=imagenary_duration)
-        
-    elif relationship_type == 'پایان با':  # End With
-        # End WITH the related project END (+ delay)
-        subproject.end_date = related_subproject.end_date + datetime.timedelta(days=delay_days)
-        subproject.start_date = subproject.end_date - datetime.timedelta(days=imagenary_duration)
+    dates = relationship_dates(relationship_type, related_subproject.start_date, related_subproject.end_date,
+                               delay_days, imagenary_duration)
+    if dates:
+        subproject.start_date, subproject.end_date = dates
     else:
         # Default behavior for unknown relationship type or "شناور" (floating)
         today = timezone.now().date()
@@ -1055,12 +1053,7 @@ def add_allocation(request, subproject_id):
             # Handle document files with multiple file upload support
             files = request.FILES.getlist('files')
             for file_obj in files:
-                DocumentFile.objects.create(
-                    document=financial_document,
-                    file=file_obj.read(), # Read binary content
-                    filename=file_obj.name,
-                    file_mime_type=file_obj.content_type # Store MIME type
-                )
+                DocumentFile.create_from_upload(financial_document, file_obj)
             
             messages.success(request, _('سند مالی با موفقیت اضافه شد.'))
             return redirect('creator_subproject:subproject_detail', pk=subproject.id)
@@ -1105,12 +1098,7 @@ def edit_allocation(request, pk):
             # Handle document files
             files = request.FILES.getlist('files')
             for file_obj in files:
-                DocumentFile.objects.create(
-                    document=financial_document,
-                    file=file_obj.read(), # Read binary content
-                    filename=file_obj.name,
-                    file_mime_type=file_obj.content_type # Store MIME type
-                )
+                DocumentFile.create_from_upload(financial_document, file_obj)
             
             messages.success(request, _('سند مالی با موفقیت بروزرسانی شد.'))
             return redirect('creator_subproject:subproject_detail', pk=subproject.id)
@@ -1367,7 +1355,8 @@ def get_subproject_dates(request, subproject_id):
 def get_project_gantt_data(request, project_id):
     """
     API endpoint to get updated Gantt chart data for all subprojects in a project.
-    Returns calculated dates for subprojects without contracts.
+    Returns calculated dates for subprojects without contracts, plus the
+    earliest/latest dates, total float and critical path of the schedule.
     """
     from django.http import JsonResponse
     from creator_project.models import Project
@@ -1376,35 +1365,16 @@ def get_project_gantt_data(request, project_id):
     
     try:
         project = Project.objects.get(id=project_id)
-        subprojects = project.subprojects.all()
-        
-        # Calculate dynamic dates similar to the JavaScript function
-        gantt_data = []
         today = timezone.now().date()
         
-        # Convert subprojects to list for processing
-        subproject_list = []
-        for sp in subprojects:
-            subproject_list.append({
-                'id': sp.id,
-                'name': f"{sp.sub_project_type}" + (f" - {sp.name}" if sp.name else ""),
-                'start': sp.start_date.strftime('%Y-%m-%d') if sp.start_date else '',
-                'end': sp.end_date.strftime('%Y-%m-%d') if sp.end_date else '',
-                'progress': float(sp.physical_progress) if sp.physical_progress else 0,
-                'relationshipType': sp.relationship_type or '',
-                'relatedId': sp.related_subproject.id if sp.related_subproject else None,
-                'relationshipDelay': sp.relationship_delay or 0,
-                'hasContract': bool(sp.contract_amount),
-                'imaginaryDuration': sp.imagenary_duration or 180
-            })
-        
-        # Calculate dynamic dates
-        processed_subprojects = calculate_dynamic_dates_backend(subproject_list, today)
+        # Serve the cached schedule while no subproject has changed
+        cache_key = gantt_cache_key(project.id, today)
+        data = cache.get(cache_key)
+        if data is None:
+            data = build_project_gantt_data(project, today)
+            cache.set(cache_key, data, GANTT_CACHE_TIMEOUT)
         
-        return JsonResponse({
-            'success': True,
-            'subprojects': processed_subprojects
-        })
+        return JsonResponse({'success': True, **data})
     except Project.DoesNotExist:
         return JsonResponse({
             'success': False,
@@ -1416,140 +1386,432 @@ def get_project_gantt_data(request, project_id):
             'error': str(e)
         }, status=500)
 
-def calculate_dynamic_dates_backend(subprojects, today):
+def gantt_cache_key(project_id, today):
     """
-    Backend implementation of dynamic date calculation for subprojects.
+    Cache key for a project's Gantt data. It changes whenever a subproject
+    is saved (max updated_at), added or removed (count), and every day since
+    floating subprojects are anchored to today.
+    """
+    state = SubProject.objects.filter(project_id=project_id).aggregate(
+        last_update=Max('updated_at'), count=Count('id'))
+    last_update = state['last_update'].timestamp() if state['last_update'] else 0
+    return f"gantt:{project_id}:{last_update}:{state['count']}:{today.isoformat()}"
+
+def build_project_gantt_data(project, today):
+    """
+    Build the Gantt API payload for a project: scheduled subprojects with
+    their critical path fields, dependency cycles and the critical path.
+    """
+    subproject_list = []
+    for sp in project.subprojects.all():
+        subproject_list.append({
+            'id': sp.id,
+            'name': f"{sp.sub_project_type}" + (f" - {sp.name}" if sp.name else ""),
+            'start': sp.start_date.strftime('%Y-%m-%d') if sp.start_date else '',
+            'end': sp.end_date.strftime('%Y-%m-%d') if sp.end_date else '',
+            'progress': float(sp.physical_progress) if sp.physical_progress else 0,
+            'relationshipType': sp.relationship_type or '',
+            'relatedId': sp.related_subproject_id,
+            'relationshipDelay': sp.relationship_delay or 0,
+            'hasContract': bool(sp.contract_amount),
+            'imaginaryDuration': sp.imagenary_duration or 180
+        })
+    
+    tasks = gantt_item_tasks(subproject_list, today)
+    processed_subprojects, schedule_result = schedule_gantt_items(subproject_list, today, tasks)
+    
+    # Earliest/latest dates and float for every scheduled subproject
+    analysis = analyze_critical_path(tasks, schedule_result)
+    for sp in processed_subprojects:
+        sp.update(analysis.as_dict(sp['id']))
+    
+    return {
+        'subprojects': processed_subprojects,
+        'cycles': schedule_result.cycles,
+        'criticalPath': analysis.critical_path,
+        'projectFinish': analysis.project_finish.strftime('%Y-%m-%d') if analysis.project_finish else '',
+    }
+
+def gantt_item_tasks(subprojects, today):
+    """Build schedule tasks from Gantt items (dicts as built by build_project_gantt_data)."""
+    tasks = []
+    for sp in subprojects:
+        start = datetime.datetime.strptime(sp['start'], '%Y-%m-%d').date() if sp['start'] else None
+        end = datetime.datetime.strptime(sp['end'], '%Y-%m-%d').date() if sp['end'] else None
+        tasks.append(gantt_task(
+            sp['id'], sp['relatedId'], sp['relationshipType'], sp['relationshipDelay'],
+            sp['imaginaryDuration'], start, end, sp['hasContract'], today
+        ))
+    return tasks
+
+def schedule_gantt_items(subprojects, today, tasks=None):
+    """
+    Schedule Gantt items with the dependency scheduler. Returns the items
+    with calculated 'start'/'end' strings and the ScheduleResult, whose
+    cycles lists any circular relationships that could not be scheduled.
     """
     import copy
-    import datetime
     
     processed_subprojects = copy.deepcopy(subprojects)
+    if tasks is None:
+        tasks = gantt_item_tasks(processed_subprojects, today)
     
-    # First pass: Handle floating subprojects and those with contracts
+    result = schedule(tasks)
     for sp in processed_subprojects:
-        if sp['hasContract']:
-            # Keep original dates for subprojects with contracts, but validate them
-            if not sp['start'] or not sp['end']:
-                # Set default dates even for contract subprojects if dates are missing
-                sp['start'] = today.strftime('%Y-%m-%d')
-                sp['end'] = (today + datetime.timedelta(days=sp['imaginaryDuration'])).strftime('%Y-%m-%d')
-        elif sp['relationshipType'] == 'شناور' or not sp['relatedId'] or not sp['relationshipType']:
-            # Floating subprojects or those without relationships start from today
-            start_date = today
-            end_date = start_date + datetime.timedelta(days=sp['imaginaryDuration'])
-            
-            sp['start'] = start_date.strftime('%Y-%m-%d')
-            sp['end'] = end_date.strftime('%Y-%m-%d')
-        else:
-            # Clear any existing dates for subprojects that will be calculated based on relationships
-            sp['start'] = ""
-            sp['end'] = ""
+        start, end = result.dates[sp['id']]
+        sp['start'] = start.strftime('%Y-%m-%d') if start else ''
+        sp['end'] = end.strftime('%Y-%m-%d') if end else ''
     
-    # Multiple passes to resolve dependencies
-    max_iterations = 10
-    changed = True
+    return processed_subprojects, result
+
+def calculate_dynamic_dates_backend(subprojects, today):
+    """
+    Backend implementation of dynamic date calculation for subprojects.
+    """
+    return schedule_gantt_items(subprojects, today)[0]
+
+@login_required
+def get_portfolio_gantt_data(request):
+    """
+    API endpoint for a timeline across many projects, filtered by program
+    and/or province and optionally by a date window (from/to, YYYY-MM-DD).
+
+    All subprojects in scope are loaded with one query and scheduled in a
+    single pass. The response is columnar: one array per field, with
+    'project' holding the index of each subproject's project in 'projects'.
+    """
+    program_id = request.GET.get('program')
+    province = request.GET.get('province')
+    if not program_id and not province:
+        return JsonResponse({'success': False, 'error': 'program or province is required'}, status=400)
     
-    while changed and max_iterations > 0:
-        changed = False
-        max_iterations -= 1
+    try:
+        window_start = datetime.date.fromisoformat(request.GET['from']) if request.GET.get('from') else None
+        window_end = datetime.date.fromisoformat(request.GET['to']) if request.GET.get('to') else None
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Dates must be in YYYY-MM-DD format'}, status=400)
+    
+    subprojects = SubProject.objects.select_related('project').only(
+        'id', 'name', 'sub_project_type', 'start_date', 'end_date', 'physical_progress',
+        'relationship_type', 'related_subproject', 'relationship_delay', 'imagenary_duration',
+        'contract_amount', 'project__id', 'project__name', 'project__province', 'project__program',
+        'project__estimated_opening_time',
+    )
+    if program_id:
+        subprojects = subprojects.filter(project__program_id=program_id)
+    if province:
+        subprojects = subprojects.filter(project__province=province)
+    
+    # Only admins, the CEO and chief executives see every province; experts,
+    # vice chief executives and province managers see their assigned ones
+    user = request.user
+    if not (user.is_admin or user.is_ceo or user.is_chief_executive):
+        if not (user.is_expert or user.is_vice_chief_executive or user.is_province_manager):
+            return JsonResponse({'success': False, 'error': 'Permission denied'}, status=403)
+        subprojects = subprojects.filter(project__province__in=user.get_assigned_provinces() or [])
+    
+    subprojects = list(subprojects.order_by('project_id', 'id'))
+    today = timezone.now().date()
+    
+    # Projects are independent components of one DAG, so a single pass schedules all of them
+    result = schedule([gantt_task_for_subproject(sp, today) for sp in subprojects])
+    
+    projects = {'id': [], 'name': [], 'province': [], 'openingDate': []}
+    project_index = {}
+    columns = {'id': [], 'project': [], 'name': [], 'start': [], 'end': [], 'progress': [],
+               'relatedId': [], 'relationshipType': []}
+    for sp in subprojects:
+        start, end = result.dates[sp.id]
+        if window_start and (end is None or end < window_start):
+            continue
+        if window_end and (start is None or start > window_end):
+            continue
         
-        for sp in processed_subprojects:
-            if sp['hasContract'] or sp['relationshipType'] == 'شناور' or not sp['relatedId'] or not sp['relationshipType']:
-                continue  # Skip if has contract, floating, or no relationship
-            
-            # Find related subproject
-            related_sp = None
-            for rsp in processed_subprojects:
-                if rsp['id'] == sp['relatedId']:
-                    related_sp = rsp
-                    break
-            
-            if not related_sp:
-                continue
-                
-            if not related_sp['start'] or not related_sp['end']:
-                continue  # Skip if related subproject doesn't have dates yet
-            
-            related_start = datetime.datetime.strptime(related_sp['start'], '%Y-%m-%d').date()
-            related_end = datetime.datetime.strptime(related_sp['end'], '%Y-%m-%d').date()
-            delay = sp['relationshipDelay']
-            
-            if sp['relationshipType'] == 'بعد از':  # After - sp starts when related ends
-                new_start = related_end + datetime.timedelta(days=delay)
-                new_end = new_start + datetime.timedelta(days=sp['imaginaryDuration'])
-            elif sp['relationshipType'] == 'قبل از':  # Before - sp ends when related starts
-                new_end = related_start - datetime.timedelta(days=delay)
-                new_start = new_end - datetime.timedelta(days=sp['imaginaryDuration'])
-            elif sp['relationshipType'] == 'شروع با':  # Start with - sp starts with related
-                new_start = related_start + datetime.timedelta(days=delay)
-                new_end = new_start + datetime.timedelta(days=sp['imaginaryDuration'])
-            elif sp['relationshipType'] == 'پایان با':  # End with - sp ends with related
-                new_end = related_end + datetime.timedelta(days=delay)
-                new_start = new_end - datetime.timedelta(days=sp['imaginaryDuration'])
-            else:
-                continue
-            
-            new_start_str = new_start.strftime('%Y-%m-%d')
-            new_end_str = new_end.strftime('%Y-%m-%d')
-            
-            if sp['start'] != new_start_str or sp['end'] != new_end_str:
-                sp['start'] = new_start_str
-                sp['end'] = new_end_str
-                changed = True
+        if sp.project_id not in project_index:
+            project_index[sp.project_id] = len(projects['id'])
+            projects['id'].append(sp.project_id)
+            projects['name'].append(sp.project.name)
+            projects['province'].append(sp.project.province)
+            opening = sp.project.estimated_opening_time
+            projects['openingDate'].append(opening.strftime('%Y-%m-%d') if opening else '')
+        
+        columns['id'].append(sp.id)
+        columns['project'].append(project_index[sp.project_id])
+        columns['name'].append(f"{sp.sub_project_type}" + (f" - {sp.name}" if sp.name else ""))
+        columns['start'].append(start.strftime('%Y-%m-%d') if start else '')
+        columns['end'].append(end.strftime('%Y-%m-%d') if end else '')
+        columns['progress'].append(float(sp.physical_progress) if sp.physical_progress else 0)
+        columns['relatedId'].append(sp.related_subproject_id)
+        columns['relationshipType'].append(sp.relationship_type or '')
     
-    return processed_subprojects
+    return JsonResponse({
+        'success': True,
+        'count': len(columns['id']),
+        'projects': projects,
+        'subprojects': columns,
+        'cycles': result.cycles,
+    }, json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')})
+
+def parse_schedule_overrides(raw_overrides):
+    """
+    Parse the overrides of a simulation request:
+    [{"id": 12, "slip": 60}, {"id": 15, "start": "2025-03-01", "end": "2025-06-01"}, ...]
+    Returns {id: override}. Raises ValueError on malformed input.
+    """
+    overrides = {}
+    for item in raw_overrides:
+        override = {}
+        for field in ('slip', 'delay', 'duration'):
+            if item.get(field) is not None:
+                override[field] = int(item[field])
+        for field in ('start', 'end'):
+            if item.get(field):
+                override[field] = datetime.date.fromisoformat(item[field])
+        overrides[int(item['id'])] = override
+    return overrides
+
+@login_required
+@require_POST
+def simulate_project_schedule(request, project_id):
+    """
+    What-if simulation for a project's schedule. Applies the posted overrides
+    to an in-memory snapshot of the subprojects, reschedules them with the
+    same rules used on save and returns the changed dates and the resulting
+    project and program opening dates. Nothing is written to the database.
+    """
+    import time
+    started = time.perf_counter()
+    
+    project = get_object_or_404(Project.objects.select_related('program'), id=project_id)
+    # Experts and vice chief executives only for their assigned provinces,
+    # as in the portfolio timeline
+    user = request.user
+    if not (user.is_admin or user.is_ceo or user.is_chief_executive or can_modify_project(user, project)
+            or ((user.is_expert or user.is_vice_chief_executive)
+                and project.province in user.get_assigned_provinces())):
+        return JsonResponse({'success': False, 'error': 'Permission denied'}, status=403)
+    
+    try:
+        payload = json.loads(request.body or b'{}')
+        overrides = parse_schedule_overrides(payload.get('overrides', []))
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        return JsonResponse({'success': False, 'error': f'Invalid overrides: {e}'}, status=400)
+    
+    subprojects = list(project.subprojects.only(
+        'id', 'name', 'sub_project_type', 'start_date', 'end_date', 'relationship_type',
+        'related_subproject', 'relationship_delay', 'imagenary_duration',
+        'contract_start_date', 'contract_end_date',
+    ))
+    unknown = set(overrides) - {sp.id for sp in subprojects}
+    if unknown:
+        return JsonResponse({'success': False, 'error': f'Unknown subprojects: {sorted(unknown)}'}, status=400)
+    
+    # Compare against a baseline run so only the effect of the overrides shows up
+    tasks = [saved_task_for_subproject(sp) for sp in subprojects]
+    baseline = schedule(tasks, keep_dates=True)
+    simulated = schedule(apply_overrides(tasks, overrides), keep_dates=True)
+    
+    def iso(value):
+        return value.strftime('%Y-%m-%d') if value else ''
+    
+    changes = []
+    for sp in subprojects:
+        old_start, old_end = baseline.dates[sp.id]
+        new_start, new_end = simulated.dates[sp.id]
+        if (old_start, old_end) == (new_start, new_end):
+            continue
+        changes.append({
+            'id': sp.id,
+            'name': f"{sp.sub_project_type}" + (f" - {sp.name}" if sp.name else ""),
+            'oldStart': iso(old_start),
+            'oldEnd': iso(old_end),
+            'newStart': iso(new_start),
+            'newEnd': iso(new_end),
+            'shiftDays': (new_end - old_end).days if old_end and new_end else None,
+        })
+    
+    # The opening date only moves when the work runs past it
+    baseline_finish = max((end for _, end in baseline.dates.values() if end), default=None)
+    simulated_finish = max((end for _, end in simulated.dates.values() if end), default=None)
+    opening = project.estimated_opening_time
+    simulated_opening = max(filter(None, (opening, simulated_finish)), default=None)
+    
+    program_data = None
+    if project.program:
+        other_projects_opening = project.program.projects.exclude(pk=project.pk).aggregate(
+            latest=Max('estimated_opening_time'))['latest']
+        program_data = {
+            'id': project.program.id,
+            'openingDate': iso(project.program.program_opening_date),
+            'simulatedOpeningDate': iso(max(filter(None, (other_projects_opening, simulated_opening)), default=None)),
+        }
+    
+    return JsonResponse({
+        'success': True,
+        'changes': changes,
+        'cycles': simulated.cycles,
+        'project': {
+            'id': project.id,
+            'estimatedOpeningTime': iso(opening),
+            'baselineFinish': iso(baseline_finish),
+            'simulatedFinish': iso(simulated_finish),
+            'simulatedOpeningTime': iso(simulated_opening),
+        },
+        'program': program_data,
+        'elapsedMs': round((time.perf_counter() - started) * 1000, 2),
+    })
 
 @login_required
 def subproject_gallery(request, pk):
     """View gallery images for a subproject."""
     subproject = get_object_or_404(SubProject, id=pk)
-    images = subproject.gallery_images.all()
-    
-    # Convert binary images to base64 for HTML rendering
-    image_data = []
-    for img in images:
-        try:
-            # Validate image data
-            if not img.image:
-                print(f"Warning: No image data for image ID {img.id}")
-                continue
-            
-            # Ensure image is bytes
-            if not isinstance(img.image, bytes):
-                print(f"Warning: Image data for ID {img.id} is not in bytes format")
-                continue
-            
-            # Convert binary to base64 for HTML img tag
-            base64_image = base64.b64encode(img.image).decode('utf-8')
-            
-            # Validate base64 encoding
-            if not base64_image:
-                print(f"Warning: Failed to encode image ID {img.id}")
-                continue
-            
-            image_data.append({
-                'id': img.id,
-                'title': img.title or f'تصویر {img.id}',
-                'description': img.description or '',
-                'mime_type': img.image_mime_type or 'image/jpeg',
-                'base64_image': base64_image
-            })
-        except Exception as e:
-            print(f"Error processing image {img.id}: {e}")
     
-    # Log total images processed
-    print(f"Total images processed: {len(image_data)}")
+    # Images are served by URL, so the legacy blobs are never loaded here
+    images = subproject.gallery_images.defer('image')
     
     context = {
         'subproject': subproject,
-        'images': image_data,
+        'images': images,
     }
     
     return render(request, 'creator_subproject/subproject_gallery.html', context)
 
+def parse_byte_range(header, size):
+    """
+    Parse a single-range Range header against a file of the given size.
+    Returns (start, end) inclusive, None to serve the whole file (no header,
+    multiple ranges or an unknown unit), or False if the range cannot be
+    satisfied.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, _, last = header[len('bytes='):].strip().partition('-')
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        elif last:
+            # Suffix range: the last N bytes
+            start = max(size - int(last), 0)
+            end = size - 1
+        else:
+            return None
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        return False
+    return start, min(end, size - 1)
+
+def iter_file_range(file_obj, start, length, chunk_size):
+    """Yield length bytes of file_obj from start in chunks, then close it."""
+    try:
+        file_obj.seek(start)
+        while length > 0:
+            chunk = file_obj.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file_obj.close()
+
+def stored_file_response(request, digest, content_type, filename=None, as_attachment=False):
+    """
+    Serve a blob from the content store in chunks, with Range support.
+    The digest doubles as a strong ETag (If-None-Match, If-Range), and since
+    the content behind a digest never changes clients may cache it for good.
+    When CONTENT_STORE_ACCEL_PREFIX is set (e.g. '/protected-content/') the
+    file is handed to the web server with X-Accel-Redirect instead.
+    """
+    from django.conf import settings
+    from django.http import FileResponse, HttpResponseNotModified, StreamingHttpResponse
+    from django.utils.http import content_disposition_header
+    from . import storage
+    
+    etag = f'"{digest}"'
+    if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+    
+    accel_prefix = getattr(settings, 'CONTENT_STORE_ACCEL_PREFIX', None)
+    if accel_prefix:
+        # The web server takes care of ranges and conditional requests
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = accel_prefix + os.path.relpath(storage.blob_path(digest), storage.STORE_ROOT)
+        if filename or as_attachment:
+            response['Content-Disposition'] = content_disposition_header(as_attachment, filename or '')
+    else:
+        try:
+            blob = storage.open_blob(digest)
+        except FileNotFoundError:
+            return HttpResponseNotFound("File not found")
+        size = os.fstat(blob.fileno()).st_size
+        
+        # A range only applies if the client still has the same content
+        byte_range = None
+        if request.method == 'GET' and request.headers.get('If-Range', etag) == etag:
+            byte_range = parse_byte_range(request.headers.get('Range'), size)
+        
+        if byte_range is False:
+            blob.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        
+        if byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                iter_file_range(blob, start, end - start + 1, storage.CHUNK_SIZE),
+                status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = str(end - start + 1)
+            if filename or as_attachment:
+                response['Content-Disposition'] = content_disposition_header(as_attachment, filename or '')
+        else:
+            response = FileResponse(blob, content_type=content_type, as_attachment=as_attachment,
+                                    filename=filename or '')
+            response.block_size = storage.CHUNK_SIZE
+        response['Accept-Ranges'] = 'bytes'
+    
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+@login_required
+def serve_gallery_image(request, image_id):
+    """Serve a gallery image from the content store (or its legacy database blob)."""
+    image = get_object_or_404(SubProjectGalleryImage.objects.defer('image'), id=image_id)
+    if image.content_hash:
+        return stored_file_response(request, image.content_hash, image.image_mime_type or 'image/jpeg')
+    
+    # Not moved to the content store yet
+    image.refresh_from_db(fields=['image'])
+    if not image.image:
+        return HttpResponseNotFound("Image not found")
+    return HttpResponse(bytes(image.image), content_type=image.image_mime_type or 'image/jpeg')
+
+@login_required
+def serve_gallery_image_variant(request, image_id, variant):
+    """Serve a resized variant ('medium' or 'medium.webp') of a gallery image."""
+    image = get_object_or_404(SubProjectGalleryImage.objects.defer('image'), id=image_id)
+    name, _, extension = variant.partition('.')
+    info = image.variants.get(name)
+    if not info:
+        # Not generated (yet): fall back to the original
+        return serve_gallery_image(request, image_id)
+    
+    if extension == 'webp':
+        if not info.get('webp'):
+            raise Http404("Variant not found")
+        return stored_file_response(request, info['webp'], 'image/webp')
+    return stored_file_response(request, info['hash'], info['mime_type'])
+
 @login_required
 def upload_gallery_image(request, subproject_id):
     """Upload a new image to the subproject gallery."""
+    from django.db import transaction
+    
     subproject = get_object_or_404(SubProject, id=subproject_id)
     
     # Check if user has permission to edit this subproject
@@ -1562,18 +1824,23 @@ def upload_gallery_image(request, subproject_id):
     if request.method == 'POST':
         form = SubProjectGalleryImageForm(request.POST, request.FILES)
         if form.is_valid():
-            # Read the uploaded file as binary
+            # Stream the upload into the content store (identical files are stored once)
             uploaded_file = request.FILES['image']
-            binary_data = uploaded_file.read()
+            uploaded_file.seek(0)
+            with transaction.atomic():
+                digest, size = store_upload(uploaded_file)
+                gallery_image = SubProjectGalleryImage(
+                    subproject=subproject,
+                    content_hash=digest,
+                    file_size=size,
+                    image_mime_type=uploaded_file.content_type or 'image/jpeg',
+                    title=form.cleaned_data.get('title'),
+                    description=form.cleaned_data.get('description')
+                )
+                gallery_image.save()
             
-            gallery_image = SubProjectGalleryImage(
-                subproject=subproject,
-                image=binary_data,
-                image_mime_type=uploaded_file.content_type or 'image/jpeg',
-                title=form.cleaned_data.get('title'),
-                description=form.cleaned_data.get('description')
-            )
-            gallery_image.save()
+            # Thumbnails are generated in the background once the row is committed
+            schedule_variants(gallery_image.id)
             
             messages.success(request, 'تصویر با موفقیت آپلود شد.')
             return redirect('creator_subproject:subproject_gallery', pk=subproject.id)
@@ -1660,12 +1927,7 @@ def add_financial_document(request, subproject_id):
             # Handle multiple file uploads
             files = request.FILES.getlist('files')
             for file_obj in files:
-                DocumentFile.objects.create(
-                    document=document,
-                    file=file_obj.read(), # Read binary content
-                    filename=file_obj.name,
-                    file_mime_type=file_obj.content_type # Store MIME type
-                )
+                DocumentFile.create_from_upload(document, file_obj)
 
             # Reset project approval status if user is province manager
             if request.user.is_province_manager:
@@ -1720,12 +1982,7 @@ def edit_financial_document(request, document_id):
             # Handle multiple file uploads
             files = request.FILES.getlist('files')
             for file_obj in files:
-                DocumentFile.objects.create(
-                    document=document,
-                    file=file_obj.read(), # Read binary content
-                    filename=file_obj.name,
-                    file_mime_type=file_obj.content_type # Store MIME type
-                )
+                DocumentFile.create_from_upload(document, file_obj)
 
             # Reset project approval status if user is province manager
             if request.user.is_province_manager:
@@ -1874,10 +2131,145 @@ def financial_ledger(request, subproject_id):
     }
     return render(request, 'creator_subproject/financial_ledger.html', context)
 
+@login_required
+def search_documents(request):
+    """
+    API endpoint to search the text of financial document files, e.g. by
+    letter number or contractor name. Optional filters: subproject, project.
+    """
+    import time
+    from .models import DocumentText
+    from . import text_index
+    started = time.perf_counter()
+    
+    query = request.GET.get('q', '').strip()
+    if len(query) < 2:
+        return JsonResponse({'success': False, 'error': 'Query is too short'}, status=400)
+    
+    texts = DocumentText.objects.select_related('document', 'document__subproject', 'document_file').defer(
+        'document_file__file')
+    if request.GET.get('subproject'):
+        texts = texts.filter(document__subproject_id=request.GET['subproject'])
+    if request.GET.get('project'):
+        texts = texts.filter(document__subproject__project_id=request.GET['project'])
+    
+    # As in the portfolio timeline: only global roles search every province
+    user = request.user
+    if not (user.is_admin or user.is_ceo or user.is_chief_executive):
+        if not (user.is_expert or user.is_vice_chief_executive or user.is_province_manager):
+            return JsonResponse({'success': False, 'error': 'Permission denied'}, status=403)
+        texts = texts.filter(document__subproject__project__province__in=user.get_assigned_provinces() or [])
+    
+    results = []
+    for document_text in text_index.search(query, texts):
+        document = document_text.document
+        results.append({
+            'documentId': document.id,
+            'documentType': document.get_document_type_display(),
+            'documentNumber': document.document_number,
+            'subprojectId': document.subproject_id,
+            'subproject': str(document.subproject),
+            'fileId': document_text.document_file_id,
+            'filename': document_text.document_file.filename,
+            'url': document_text.document_file.get_absolute_url(),
+            'snippet': text_index.snippet(document_text.text, query),
+        })
+    
+    return JsonResponse({
+        'success': True,
+        'results': results,
+        'elapsedMs': round((time.perf_counter() - started) * 1000, 2),
+    })
+
+@login_required
+def download_documents_bundle(request, scope, pk):
+    """
+    Stream a ZIP with every document file of a subproject, project or program
+    (scope), plus gallery images when ?images=1, and a manifest.csv with the
+    financial document details of each file.
+    """
+    from django.http import StreamingHttpResponse
+    from django.utils.http import content_disposition_header
+    from creator_program.models import Program
+    from .bundles import BundleEntry, iter_zip
+    
+    scopes = {
+        'subproject': (SubProject, 'subproject'),
+        'project': (Project, 'subproject__project'),
+        'program': (Program, 'subproject__project__program'),
+    }
+    if scope not in scopes:
+        raise Http404("Unknown bundle scope")
+    model, lookup = scopes[scope]
+    owner = get_object_or_404(model, pk=pk)
+    
+    # Same visibility as the subproject pages: staff roles see everything,
+    # province managers only their provinces
+    user = request.user
+    if not (user.is_admin or user.is_ceo or user.is_chief_executive or user.is_expert
+            or user.is_vice_chief_executive):
+        province = owner.project.province if scope == 'subproject' else owner.province
+        if not (user.is_province_manager and province in user.get_assigned_provinces()):
+            raise PermissionDenied
+    
+    document_files = DocumentFile.objects.filter(**{f'document__{lookup}': owner}).select_related(
+        'document', 'document__subproject').order_by('document__subproject_id', 'document_id', 'id')
+    include_images = request.GET.get('images') in ('1', 'true')
+    
+    def subproject_folder(subproject):
+        name = f"{subproject.id}-{subproject.sub_project_type}" + (f"-{subproject.name}" if subproject.name else '')
+        return name.replace('/', '-')
+    
+    def entries():
+        for document_file in document_files.iterator(chunk_size=200):
+            document = document_file.document
+            yield BundleEntry(
+                path=(f"{subproject_folder(document.subproject)}/"
+                      f"{document.get_document_type_display()}-{document.document_number}/"
+                      f"{document_file.filename.replace('/', '-')}"),
+                open=document_file.open_file,
+                mime_type=document_file.file_mime_type,
+                modified=document_file.uploaded_at,
+                metadata={
+                    'subproject': str(document.subproject),
+                    'document_type': document.get_document_type_display(),
+                    'document_number': document.document_number,
+                    'contractor_amount': document.contractor_amount,
+                    'approved_amount': document.approved_amount,
+                    'contractor_date': document.jalali_contractor_date or '',
+                    'approval_date': document.jalali_approval_date or '',
+                    'uploaded_at': document_file.uploaded_at.strftime('%Y-%m-%d %H:%M'),
+                },
+            )
+        if include_images:
+            images = SubProjectGalleryImage.objects.filter(**{lookup: owner}).defer('image').select_related(
+                'subproject').order_by('subproject_id', 'id')
+            for image in images.iterator(chunk_size=200):
+                extension = image.image_mime_type.split('/')[-1] if image.image_mime_type else 'jpg'
+                yield BundleEntry(
+                    path=f"{subproject_folder(image.subproject)}/gallery/{image.id}.{extension}",
+                    open=image.open_image,
+                    mime_type=image.image_mime_type,
+                    modified=image.upload_date,
+                    metadata={
+                        'subproject': str(image.subproject),
+                        'document_type': image.title or 'تصویر',
+                        'uploaded_at': image.upload_date.strftime('%Y-%m-%d %H:%M'),
+                    },
+                )
+    
+    manifest_fields = ('subproject', 'document_type', 'document_number', 'contractor_amount',
+                       'approved_amount', 'contractor_date', 'approval_date', 'uploaded_at')
+    response = StreamingHttpResponse(iter_zip(entries(), manifest_fields=manifest_fields),
+                                     content_type='application/zip')
+    response['Content-Disposition'] = content_disposition_header(True, f"documents-{scope}-{pk}.zip")
+    return response
+
 @login_required
 def serve_document_file(request, pk):
     """
-    Serve a document file directly from the database.
+    Serve a document file from the content store, streamed and resumable.
+    Files uploaded before the content store are served from the database.
     """
     document_file = get_object_or_404(DocumentFile, pk=pk)
     
@@ -1885,6 +2277,10 @@ def serve_document_file(request, pk):
     # For now, let's assume if they can access the URL, they can view the file.
     # More granular permissions can be added here if needed.
 
+    if document_file.content_hash:
+        return stored_file_response(request, document_file.content_hash, document_file.file_mime_type,
+                                    filename=document_file.filename, as_attachment=True)
+
     response = HttpResponse(document_file.file, content_type=document_file.file_mime_type)
     response['Content-Disposition'] = f'attachment; filename="{document_file.filename}"'
     return response
@@ -139,48 +139,52 @@ def send_announcement(request):
             # Initialize SMS client
             sms_client = IPPanelClient(api_key=sms_settings.api_key)
             
+            users_by_number = {}
+            for user in recipients.only('id', 'phone_number', 'province'):
+                users_by_number.setdefault(user.phone_number.strip(), []).append(user)
+            
             success_count = 0
             failed_count = 0
+            failed_numbers = []
             
-            # Send SMS to each recipient
-            for user in recipients:
-                try:
-                    with transaction.atomic():
-                        # Create log entry
-                        sms_log = SMSLog.objects.create(
-                            recipient=user,
-                            message=message_text,
-                            project_name="اطلاع‌رسانی عمومی",
-                            project_id="ANNOUNCE",
-                            province=user.province or "-",
-                            status='pending'
-                        )
-                        
-                        # Send SMS
-                        result = sms_client.send_sms(
-                            recipient_numbers=user.phone_number,
-                            message_text=message_text,
-                            sender_number=sms_settings.sender_number
-                        )
-                        
-                        if result.get('meta', {}).get('status') == True:
-                            # Update log with success
-                            message_id = result.get('data', {}).get('message_id')
-                            sms_log.status = 'sent'
-                            sms_log.message_id = message_id
-                            sms_log.save()
-                            success_count += 1
-                        else:
-                            # Update log with error
-                            error_message = result.get('meta', {}).get('message', 'Unknown error')
-                            sms_log.status = 'failed'
-                            sms_log.error_message = error_message
-                            sms_log.save()
-                            failed_count += 1
-                            
-                except Exception as e:
-                    failed_count += 1
+            # One request per chunk of numbers instead of one per user
+            for chunk, result in sms_client.send_bulk_sms(
+                    users_by_number, message_text, sender_number=sms_settings.sender_number):
+                if result.get('meta', {}).get('status') == True:
+                    status = 'sent'
+                    message_id = (result.get('data') or {}).get('message_id')
+                    error_message = None
+                else:
+                    status = 'failed'
+                    message_id = None
+                    error_message = result.get('meta', {}).get('message') or result.get('error') or 'Unknown error'
+                    failed_numbers.extend(chunk)
+                
+                logs = [
+                    SMSLog(
+                        recipient=user,
+                        message=message_text,
+                        project_name="اطلاع‌رسانی عمومی",
+                        project_id="ANNOUNCE",
+                        province=user.province or "-",
+                        status=status,
+                        message_id=message_id,
+                        error_message=error_message
+                    )
+                    for number in chunk for user in users_by_number[number]
+                ]
+                SMSLog.objects.bulk_create(logs)
+                if status == 'sent':
+                    success_count += len(logs)
+                else:
+                    failed_count += len(logs)
             
+            if failed_numbers:
+                messages.warning(
+                    request,
+                    f'ارسال به این شماره‌ها ناموفق بود: {"، ".join(failed_numbers[:20])}'
+                    + (f' و {len(failed_numbers) - 20} شماره دیگر' if len(failed_numbers) > 20 else '')
+                )
             messages.success(
                 request, 
                 f'پیامک به {success_count} کاربر با موفقیت ارسال شد. {failed_count} مورد ناموفق.'
@@ -1,10 +1,10 @@
 from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
-from .models import SMSProvider, SMSTemplate, SMSLog, SMSSettings
+from .models import SMSProvider, SMSTemplate, SMSLog, SMSSettings, SMSOutbox, NotificationLedger, NotificationRuleRun
 
 @admin.register(SMSProvider)
 class SMSProviderAdmin(admin.ModelAdmin):
-    list_display = ('name', 'base_url', 'is_active')
+    list_display = ('name', 'base_url', 'is_active', 'credit', 'credit_synced_at')
     list_filter = ('is_active',)
     search_fields = ('name',)
     
@@ -36,6 +36,34 @@ class SMSLogAdmin(admin.ModelAdmin):
     readonly_fields = ('sender', 'recipient_number', 'recipient_user', 'message', 
                        'template', 'status', 'error_message', 'sent_at', 'provider')
 
+@admin.register(SMSOutbox)
+class SMSOutboxAdmin(admin.ModelAdmin):
+    list_display = ('recipient_number', 'status', 'attempts', 'available_at', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('recipient_number', 'message')
+    readonly_fields = ('log', 'recipient_number', 'message', 'attempts', 'locked_at', 'locked_by',
+                       'last_error', 'created_at', 'sent_at')
+    actions = ['retry_now']
+
+    @admin.action(description=_('Retry selected messages now'))
+    def retry_now(self, request, queryset):
+        from django.utils import timezone
+        queryset.exclude(status=SMSOutbox.SENT).update(status=SMSOutbox.PENDING, available_at=timezone.now())
+
+@admin.register(NotificationLedger)
+class NotificationLedgerAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'period_key', 'project', 'recipient', 'created_at')
+    list_filter = ('kind',)
+    search_fields = ('project__name', 'recipient__username')
+    raw_id_fields = ('project', 'recipient', 'log')
+
+@admin.register(NotificationRuleRun)
+class NotificationRuleRunAdmin(admin.ModelAdmin):
+    list_display = ('rule', 'status', 'requested_by', 'candidates', 'queued', 'created_at', 'started_at', 'finished_at')
+    list_filter = ('rule', 'status')
+    readonly_fields = ('candidates', 'queued', 'error', 'started_at', 'finished_at')
+    raw_id_fields = ('requested_by',)
+
 @admin.register(SMSSettings)
 class SMSSettingsAdmin(admin.ModelAdmin):
     list_display = ('provider', 'outdated_project_days', 'not_examined_days')
@@ -0,0 +1,125 @@
+"""
+Delivery report polling for sent SMS.
+
+SENT logs older than a few minutes are grouped by gateway message id (a
+bulk send shares one id for all its recipients), each message's recipient
+statuses are fetched once on a thread pool, and the logs are moved to
+DELIVERED or FAILED with bulk updates. Logs without a final status are
+checked again later, less often the older they get, until they are too
+old to be worth asking about.
+"""
+import logging
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from .models import SMSLog
+from .utils import IPPanelSMSSender
+
+logger = logging.getLogger(__name__)
+
+DELIVERED_STATUSES = {'delivered', 'deliver', 'delivery', 'successful', 'success'}
+FAILED_STATUSES = {
+    'failed', 'fail', 'undelivered', 'not delivered', 'not_delivered', 'expired',
+    'rejected', 'blocked', 'blacklist', 'blacklisted', 'discarded', 'canceled', 'cancelled',
+}
+
+# (age of the message, time until the next check)
+CHECK_BACKOFF = (
+    (datetime.timedelta(hours=1), datetime.timedelta(minutes=5)),
+    (datetime.timedelta(hours=6), datetime.timedelta(minutes=30)),
+    (datetime.timedelta(hours=24), datetime.timedelta(hours=2)),
+)
+LATE_CHECK_INTERVAL = datetime.timedelta(hours=6)
+
+
+def final_status(gateway_status):
+    """Map a gateway status to DELIVERED or FAILED, or None while it is still in transit."""
+    status = gateway_status.strip().lower()
+    if status in DELIVERED_STATUSES:
+        return SMSLog.DELIVERED
+    if status in FAILED_STATUSES:
+        return SMSLog.FAILED
+    return None
+
+
+def number_key(number):
+    """Compare numbers by their last ten digits (0912..., 98912... and +98912... are the same)."""
+    digits = ''.join(char for char in str(number) if char.isdigit())
+    return digits[-10:]
+
+
+def next_check(sent_at, now):
+    age = now - sent_at
+    for max_age, interval in CHECK_BACKOFF:
+        if age < max_age:
+            return now + interval
+    return now + LATE_CHECK_INTERVAL
+
+
+def due_logs(min_age, max_age, limit):
+    """SENT logs at least min_age and at most max_age old whose next check is due."""
+    now = timezone.now()
+    return list(
+        SMSLog.objects.filter(
+            status=SMSLog.SENT,
+            sent_at__lte=now - min_age,
+            sent_at__gte=now - max_age,
+            provider__isnull=False,
+        )
+        .exclude(message_id__isnull=True).exclude(message_id='')
+        .filter(Q(next_status_check__isnull=True) | Q(next_status_check__lte=now))
+        .select_related('provider')
+        .only('id', 'recipient_number', 'message_id', 'sent_at', 'provider__api_key')
+        .order_by('sent_at')[:limit]
+    )
+
+
+def poll(min_age, max_age, limit=500, concurrency=8):
+    """Check one batch of due logs. Returns (checked, delivered, failed, unknown)."""
+    logs = due_logs(min_age, max_age, limit)
+    if not logs:
+        return 0, 0, 0, 0
+
+    by_message = {}
+    for log in logs:
+        by_message.setdefault((log.provider_id, log.message_id), []).append(log)
+
+    def fetch(key):
+        message_logs = by_message[key]
+        message_id = key[1]
+        if message_id.startswith('sim_'):
+            # Simulated sends never reach a phone; treat them as delivered
+            return {number_key(log.recipient_number): 'delivered' for log in message_logs}
+        try:
+            return {number_key(number): status for number, status in
+                    IPPanelSMSSender.fetch_statuses(message_logs[0].provider, message_id).items()}
+        except Exception as e:
+            logger.warning("Could not fetch delivery status of message %s: %s", message_id, e)
+            return {}
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        statuses = dict(zip(by_message, executor.map(fetch, list(by_message))))
+
+    now = timezone.now()
+    finished = []
+    waiting = []
+    for key, message_logs in by_message.items():
+        for log in message_logs:
+            status = final_status(statuses[key].get(number_key(log.recipient_number), ''))
+            if status:
+                log.status = status
+                log.delivered_at = now if status == SMSLog.DELIVERED else None
+                log.next_status_check = None
+                finished.append(log)
+            else:
+                log.next_status_check = next_check(log.sent_at, now)
+                waiting.append(log)
+
+    SMSLog.objects.bulk_update(finished, ['status', 'delivered_at', 'next_status_check'], batch_size=500)
+    SMSLog.objects.bulk_update(waiting, ['next_status_check'], batch_size=500)
+    delivered = sum(1 for log in finished if log.status == SMSLog.DELIVERED)
+    return len(logs), delivered, len(finished) - delivered, len(waiting)
@@ -0,0 +1,197 @@
+"""
+A local stand-in for the IPPanel gateway, for load tests.
+
+Implements the endpoints the code uses:
+
+ippanel SDK (point IPPANEL_BASE_URL at http://host:port/api/v1/):
+    POST sms/send/webservice/single
+    GET  sms/accounting/credit/show
+    GET  sms/message/show-recipient/message-id/<id>
+
+utils.ippanel.IPPanelClient (point IPPANEL_EDGE_BASE_URL at http://host:port):
+    POST /api/acl/message/sms/send
+    GET  /api/report/message/<id>
+
+Latency, error rate, a global rate limit (answered with 429) and the
+share of undelivered messages are configurable. Nothing is persisted.
+"""
+import json
+import time
+import random
+import threading
+import itertools
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class GatewayState:
+    """Messages, credit and rate-limit state shared by the handler threads."""
+
+    def __init__(self, credit=1000000, part_cost=1, latency=0.05, jitter=0.0, error_rate=0.0,
+                 rate_limit=0, undelivered_rate=0.0, delivery_delay=0.0):
+        self.credit = credit
+        self.part_cost = part_cost
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.undelivered_rate = undelivered_rate
+        self.delivery_delay = delivery_delay
+        self.messages = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.window_start = time.monotonic()
+        self.window_count = 0
+        self.stats = {'requests': 0, 'sent': 0, 'recipients': 0, 'errors': 0, 'throttled': 0}
+
+    def admit(self):
+        """Apply the configured rate limit. Returns False if the request should get a 429."""
+        with self.lock:
+            self.stats['requests'] += 1
+            if not self.rate_limit:
+                return True
+            now = time.monotonic()
+            if now - self.window_start >= 1:
+                self.window_start = now
+                self.window_count = 0
+            self.window_count += 1
+            if self.window_count > self.rate_limit:
+                self.stats['throttled'] += 1
+                return False
+            return True
+
+    def send(self, recipients, message):
+        parts = 1 if len(message) <= 70 else -(-len(message) // 67)
+        with self.lock:
+            message_id = next(self.ids)
+            self.credit -= parts * len(recipients) * self.part_cost
+            self.messages[message_id] = {
+                'sent_at': time.monotonic(),
+                'recipients': {
+                    str(number): 'failed' if random.random() < self.undelivered_rate else 'delivered'
+                    for number in recipients
+                },
+            }
+            self.stats['sent'] += 1
+            self.stats['recipients'] += len(recipients)
+        return message_id
+
+    def statuses(self, message_id):
+        message = self.messages.get(message_id)
+        if message is None:
+            return None
+        if time.monotonic() - message['sent_at'] < self.delivery_delay:
+            return {number: 'pending' for number in message['recipients']}
+        return message['recipients']
+
+
+class FakeIPPanelHandler(BaseHTTPRequestHandler):
+    server_version = 'FakeIPPanel/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def handle_request(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        state = self.state
+
+        delay = state.latency + random.uniform(0, state.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        if not state.admit():
+            return self.reply(429, {'status': 'ERROR', 'code': 429, 'error_message': 'Too many requests',
+                                    'meta': {'status': False, 'message': 'Too many requests'}})
+        if random.random() < state.error_rate:
+            with state.lock:
+                state.stats['errors'] += 1
+            return self.reply(503, {'status': 'ERROR', 'code': 503, 'error_message': 'Service unavailable'})
+
+        url = urlparse(self.path)
+        path = url.path.rstrip('/')
+        try:
+            payload = json.loads(body or b'{}')
+        except ValueError:
+            payload = {}
+
+        # ippanel SDK
+        if method == 'POST' and path.endswith('/sms/send/webservice/single'):
+            message_id = state.send(payload.get('recipient') or [], payload.get('message') or '')
+            return self.sdk_reply({'message_id': message_id})
+        if method == 'GET' and path.endswith('/sms/accounting/credit/show'):
+            return self.sdk_reply({'credit': state.credit})
+        if method == 'GET' and '/sms/message/show-recipient/message-id/' in path:
+            return self.sdk_statuses(path.rsplit('/', 1)[-1], parse_qs(url.query))
+
+        # utils.ippanel.IPPanelClient (edge API)
+        if method == 'POST' and path.endswith('/api/acl/message/sms/send'):
+            message_id = state.send(payload.get('mobile') or [], payload.get('message_text') or '')
+            return self.reply(200, {'meta': {'status': True, 'message': 'ok'}, 'data': {'message_id': message_id}})
+        if method == 'GET' and '/api/report/message/' in path:
+            statuses = self.lookup(path.rsplit('/', 1)[-1])
+            if statuses is None:
+                return self.reply(404, {'meta': {'status': False, 'message': 'Message not found'}})
+            return self.reply(200, {'meta': {'status': True, 'message': 'ok'}, 'data': [
+                {'mobile': number, 'status': status} for number, status in statuses.items()]})
+
+        self.reply(404, {'status': 'ERROR', 'code': 404, 'error_message': 'Not found'})
+
+    def lookup(self, message_id):
+        try:
+            return self.state.statuses(int(message_id))
+        except ValueError:
+            return None
+
+    def sdk_statuses(self, message_id, query):
+        statuses = self.lookup(message_id)
+        if statuses is None:
+            return self.reply(200, {'status': 'ERROR', 'code': 404, 'error_message': 'Message not found'})
+        page = int(query.get('page', ['0'])[0])
+        per_page = max(1, int(query.get('per_page', ['10'])[0]))
+        items = list(statuses.items())
+        deliveries = [{'recipient': number, 'status': status}
+                      for number, status in items[page * per_page:(page + 1) * per_page]]
+        meta = {'total': len(items), 'limit': per_page, 'page': page,
+                'pages': -(-len(items) // per_page), 'prev': None, 'next': None}
+        self.reply(200, {'status': 'OK', 'code': 200, 'error_message': '',
+                         'data': {'deliveries': deliveries}, 'meta': meta})
+
+    def sdk_reply(self, data):
+        self.reply(200, {'status': 'OK', 'code': 200, 'error_message': '', 'data': data})
+
+    def reply(self, status, data):
+        content = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class FakeIPPanelServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, state, verbose=False):
+        super().__init__(address, FakeIPPanelHandler)
+        self.state = state
+        self.verbose = verbose
+
+
+def start_in_thread(host='127.0.0.1', port=0, **options):
+    """Start a fake gateway on a background thread. Returns the server (server.server_address has the port)."""
+    server = FakeIPPanelServer((host, port), GatewayState(**options))
+    threading.Thread(target=server.serve_forever, daemon=True, name='fake-ippanel').start()
+    return server
@@ -0,0 +1,39 @@
+"""
+Deduplication of automated notifications through NotificationLedger.
+
+Callers look up, in one query for all candidates, which
+(project, recipient) pairs were already notified in the current period,
+and record a notification in the same transaction that queues its SMS.
+"""
+from django.db import IntegrityError, transaction
+from .models import NotificationLedger
+from .outbox import enqueue_sms
+
+
+def notified_pairs(kind, period_key, project_ids):
+    """(project_id, recipient_id) pairs already notified for kind in period_key."""
+    project_ids = list(project_ids)
+    pairs = set()
+    for i in range(0, len(project_ids), 1000):
+        pairs.update(NotificationLedger.objects.filter(
+            kind=kind, period_key=period_key, project_id__in=project_ids[i:i + 1000],
+        ).values_list('project_id', 'recipient_id'))
+    return pairs
+
+
+def notify(kind, period_key, recipient, projects, message, template=None):
+    """
+    Queue message to recipient about projects and record it in the ledger.
+    Returns the SMSLog, or None if another run already recorded it.
+    """
+    try:
+        with transaction.atomic():
+            log = enqueue_sms(recipient.phone_number, message, recipient_user=recipient, template=template)
+            NotificationLedger.objects.bulk_create([
+                NotificationLedger(project=project, recipient=recipient, kind=kind,
+                                   period_key=period_key, log=log)
+                for project in projects
+            ])
+    except IntegrityError:
+        return None
+    return log
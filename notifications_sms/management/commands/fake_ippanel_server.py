@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from notifications_sms.fake_ippanel import FakeIPPanelServer, GatewayState
+
+
+class Command(BaseCommand):
+    help = 'Run a local IPPanel-compatible gateway for load testing (never sends real SMS)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=50, help='Milliseconds added to every response')
+        parser.add_argument('--jitter', type=float, default=0, help='Up to this many extra random milliseconds')
+        parser.add_argument('--error-rate', type=float, default=0,
+                            help='Share of requests answered with 503 (0 to 1)')
+        parser.add_argument('--rate-limit', type=int, default=0,
+                            help='Requests per second before answering 429 (0 for no limit)')
+        parser.add_argument('--undelivered-rate', type=float, default=0,
+                            help='Share of recipients reported as failed in delivery reports (0 to 1)')
+        parser.add_argument('--delivery-delay', type=float, default=0,
+                            help='Seconds before delivery reports stop saying pending')
+        parser.add_argument('--credit', type=int, default=1000000, help='Starting account credit')
+        parser.add_argument('--verbose', action='store_true', help='Log every request')
+
+    def handle(self, *args, **options):
+        state = GatewayState(
+            credit=options['credit'],
+            latency=options['latency'] / 1000,
+            jitter=options['jitter'] / 1000,
+            error_rate=options['error_rate'],
+            rate_limit=options['rate_limit'],
+            undelivered_rate=options['undelivered_rate'],
+            delivery_delay=options['delivery_delay'],
+        )
+        server = FakeIPPanelServer((options['host'], options['port']), state, options['verbose'])
+        base = f"http://{options['host']}:{server.server_address[1]}"
+        self.stdout.write(self.style.SUCCESS(f"Fake IPPanel gateway listening on {base}"))
+        self.stdout.write(f"  IPPANEL_BASE_URL = '{base}/api/v1/'")
+        self.stdout.write(f"  IPPANEL_EDGE_BASE_URL = '{base}'")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            stats = state.stats
+            self.stdout.write(self.style.SUCCESS(
+                f"Stopped after {stats['requests']} requests: {stats['sent']} messages to "
+                f"{stats['recipients']} recipients, {stats['errors']} errors, {stats['throttled']} throttled"
+            ))
@@ -0,0 +1,62 @@
+import time
+import signal
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from notifications_sms.models import SMSSettings
+from notifications_sms.rules import claim_requested_run, due_rules, execute, fail_stale_runs, start_run
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the automated SMS notification rules every check_interval_hours and the runs '
+        'requested from the alerts dashboard (runs until stopped unless --once is given)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, default=30,
+                            help='Seconds between checks for due rules and requested runs')
+        parser.add_argument('--once', action='store_true', help='Run what is due and exit')
+
+    def handle(self, *args, **options):
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.stdout.write('Notification scheduler started')
+
+        while self.running:
+            close_old_connections()
+            fail_stale_runs()
+            sms_settings = SMSSettings.get_settings()
+
+            # Requested runs first: someone is waiting for them
+            while self.running:
+                run = claim_requested_run()
+                if run is None:
+                    break
+                self.report(execute(run, sms_settings))
+
+            if sms_settings.provider:
+                for rule in due_rules(sms_settings):
+                    if not self.running:
+                        break
+                    self.report(execute(start_run(rule), sms_settings))
+
+            if options['once']:
+                break
+            time.sleep(options['poll_interval'])
+
+        self.stdout.write(self.style.SUCCESS('Notification scheduler stopped'))
+
+    def report(self, run):
+        duration = (run.finished_at - run.started_at).total_seconds()
+        if run.status == run.FAILED:
+            self.stdout.write(self.style.ERROR(f"{run.get_rule_display()} failed: {run.error}"))
+        else:
+            self.stdout.write(
+                f"{run.get_rule_display()}: {run.candidates} candidate projects, "
+                f"{run.queued} messages queued in {duration:.2f}s"
+            )
+
+    def stop(self, signum, frame):
+        # Finish the current run, then exit
+        self.running = False
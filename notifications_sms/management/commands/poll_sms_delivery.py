@@ -0,0 +1,38 @@
+import time
+import datetime
+from django.core.management.base import BaseCommand
+from notifications_sms.delivery import poll
+
+
+class Command(BaseCommand):
+    help = 'Update SENT SMS logs to DELIVERED or FAILED from the gateway delivery reports'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=int, default=10,
+                            help='Only check messages sent at least this many minutes ago')
+        parser.add_argument('--max-age-hours', type=int, default=72,
+                            help='Stop checking messages older than this')
+        parser.add_argument('--batch-size', type=int, default=500, help='Logs checked per batch')
+        parser.add_argument('--concurrency', type=int, default=8, help='Gateway requests in parallel')
+        parser.add_argument('--loop', action='store_true', help='Keep polling until stopped')
+        parser.add_argument('--interval', type=float, default=60,
+                            help='Seconds between rounds with --loop')
+
+    def handle(self, *args, **options):
+        min_age = datetime.timedelta(minutes=options['min_age'])
+        max_age = datetime.timedelta(hours=options['max_age_hours'])
+        while True:
+            started = time.monotonic()
+            totals = [0, 0, 0, 0]
+            while True:
+                counts = poll(min_age, max_age, max(1, options['batch_size']), options['concurrency'])
+                totals = [total + count for total, count in zip(totals, counts)]
+                if counts[0] < options['batch_size']:
+                    break
+            self.stdout.write(self.style.SUCCESS(
+                f"Checked {totals[0]} messages: {totals[1]} delivered, {totals[2]} failed, "
+                f"{totals[3]} still in transit ({time.monotonic() - started:.2f}s)"
+            ))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,70 @@
+import os
+import time
+import signal
+import socket
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from notifications_sms.models import SMSSettings
+from notifications_sms.outbox import MAX_ATTEMPTS, claim_batch, dispatch_batch
+from notifications_sms.throttle import credit_is_stale
+from notifications_sms.utils import IPPanelSMSSender
+
+
+class Command(BaseCommand):
+    help = 'Send queued SMS messages from the outbox (runs until stopped unless --once is given)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help='Messages claimed per batch')
+        parser.add_argument('--concurrency', type=int, default=8, help='Messages sent in parallel')
+        parser.add_argument('--poll-interval', type=float, default=2,
+                            help='Seconds to wait when the outbox is empty')
+        parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS,
+                            help='Give up on a message after this many failed attempts')
+        parser.add_argument('--once', action='store_true', help='Send what is due and exit')
+
+    def handle(self, *args, **options):
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.stdout.write(f"SMS dispatcher {worker} started")
+
+        totals = [0, 0, 0, 0]
+        while self.running:
+            close_old_connections()
+            provider = SMSSettings.get_settings().provider
+            if provider is None:
+                self.stdout.write(self.style.WARNING('No SMS provider configured, waiting'))
+                if options['once']:
+                    break
+                time.sleep(max(options['poll_interval'], 30))
+                continue
+
+            if credit_is_stale(provider) and not IPPanelSMSSender.is_simulated(provider):
+                result = IPPanelSMSSender.get_credit(provider)
+                if result['status'] == 'OK':
+                    self.stdout.write(f"Credit synced: {result['credit']}")
+
+            started = time.monotonic()
+            items = claim_batch(worker, max(1, options['batch_size']))
+            if items:
+                counts = dispatch_batch(items, provider, IPPanelSMSSender.deliver,
+                                        options['concurrency'], options['max_attempts'])
+                totals = [total + count for total, count in zip(totals, counts)]
+                self.stdout.write(
+                    f"Batch of {len(items)}: {counts[0]} sent, {counts[1]} failed, {counts[2]} to retry, "
+                    f"{counts[3]} held back by rate limits or credit in {time.monotonic() - started:.2f}s"
+                )
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['poll_interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"SMS dispatcher stopped: {totals[0]} sent, {totals[1]} failed, {totals[2]} retried, "
+            f"{totals[3]} held back"
+        ))
+
+    def stop(self, signum, frame):
+        # Finish the current batch, then exit
+        self.running = False
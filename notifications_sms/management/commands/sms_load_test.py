@@ -0,0 +1,255 @@
+import math
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models.signals import post_save
+from notifications_sms import throttle
+from notifications_sms.fake_ippanel import start_in_thread
+from notifications_sms.models import (
+    NotificationLedger, NotificationRuleRun, SMSLog, SMSOutbox, SMSProvider, SMSRateLimit, SMSSettings,
+)
+from notifications_sms.outbox import claim_batch, dispatch_batch, enqueue_sms
+from notifications_sms.utils import IPPanelSMSSender, chunks
+from utils.ippanel import IPPanelClient
+
+
+def percentile(values, percent):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+
+def paced(count, rate):
+    """Yield 0..count-1, spaced to rate per second (as fast as possible if rate is 0)."""
+    started = time.monotonic()
+    for i in range(count):
+        if rate:
+            wait = started + i / rate - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+        yield i
+
+
+class Command(BaseCommand):
+    help = (
+        'Load test SMS sending against a fake IPPanel gateway: direct sends, bulk sends, '
+        'the outbox dispatcher or send_automated_sms. Writes test rows to the database and '
+        'removes them afterwards'
+    )
+
+    # Rows created by this process are the test's own: record them as they are saved
+    TRACKED = (SMSLog, SMSOutbox, NotificationRuleRun)
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', choices=['deliver', 'bulk', 'outbox', 'automated'], default='outbox')
+        parser.add_argument('--messages', type=int, default=1000, help='Messages (or bulk sends) to generate')
+        parser.add_argument('--rate', type=float, default=0,
+                            help='Target messages per second (0 for as fast as possible)')
+        parser.add_argument('--recipients', type=int, default=100, help='Recipients per bulk send')
+        parser.add_argument('--concurrency', type=int, default=8, help='Gateway requests in parallel')
+        parser.add_argument('--batch-size', type=int, default=50, help='Outbox rows claimed per batch')
+        parser.add_argument('--provider-rate', type=float, default=None,
+                            help='Override SMS_PROVIDER_RATE (messages per second) for this run')
+        parser.add_argument('--gateway', default=None,
+                            help='Base URL of a running fake_ippanel_server; by default one is started in-process')
+        parser.add_argument('--latency', type=float, default=50, help='In-process gateway latency in milliseconds')
+        parser.add_argument('--error-rate', type=float, default=0, help='In-process gateway share of 503 answers')
+        parser.add_argument('--rate-limit', type=int, default=0, help='In-process gateway requests per second')
+        parser.add_argument('--keep', action='store_true', help='Keep the rows the test created')
+        parser.add_argument('--force', action='store_true', help='Run even with DEBUG off')
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['force']:
+            raise CommandError('Load tests write to the database; run them on a development setup or use --force')
+
+        server = None
+        gateway = options['gateway']
+        if gateway is None:
+            server = start_in_thread(latency=options['latency'] / 1000, error_rate=options['error_rate'],
+                                     rate_limit=options['rate_limit'])
+            gateway = f"http://127.0.0.1:{server.server_address[1]}"
+        gateway = gateway.rstrip('/')
+        self.stdout.write(f"Gateway: {gateway}")
+
+        # Point both clients at the fake gateway. A fresh API key gets a fresh SDK client and session.
+        settings.IPPANEL_BASE_URL = f"{gateway}/api/v1/"
+        IPPanelClient.BASE_URL = gateway
+        if options['provider_rate'] is not None:
+            throttle.PROVIDER_RATE = options['provider_rate']
+            throttle.PROVIDER_BURST = max(throttle.PROVIDER_BURST, int(options['provider_rate']))
+
+        self.created = {model: [] for model in self.TRACKED}
+        self.created_lock = threading.Lock()
+        for model in self.TRACKED:
+            post_save.connect(self.track, sender=model, dispatch_uid=f'sms_load_test_{model.__name__}')
+        provider = SMSProvider.objects.create(name='Load test', api_key=f"loadtest-{uuid.uuid4().hex}")
+        # Rate limit buckets only this run uses: the throwaway provider's and fresh fake numbers'
+        bucket_keys = {throttle.provider_key(provider)} | {
+            f"recipient:{number}" for number in self.numbers(options['messages'])}
+        for keys in chunks(list(bucket_keys), 1000):
+            bucket_keys -= set(SMSRateLimit.objects.filter(key__in=keys).values_list('key', flat=True))
+        sms_settings = SMSSettings.get_settings()
+        previous_provider = sms_settings.provider_id
+        sms_settings.provider = provider
+        sms_settings.save(update_fields=['provider'])
+
+        try:
+            getattr(self, f"run_{options['scenario']}")(provider, options)
+        finally:
+            sms_settings.provider_id = previous_provider
+            sms_settings.save(update_fields=['provider'])
+            for model in self.TRACKED:
+                post_save.disconnect(sender=model, dispatch_uid=f'sms_load_test_{model.__name__}')
+            if not options['keep']:
+                self.cleanup(provider, bucket_keys)
+            if server:
+                server.shutdown()
+                stats = server.state.stats
+                self.stdout.write(
+                    f"Gateway saw {stats['requests']} requests: {stats['errors']} errors, "
+                    f"{stats['throttled']} throttled"
+                )
+
+    def track(self, sender, instance, created, **kwargs):
+        if created:
+            with self.created_lock:
+                self.created[sender].append(instance.pk)
+
+    def created_ids(self, model):
+        with self.created_lock:
+            return list(self.created[model])
+
+    def cleanup(self, provider, bucket_keys):
+        """Delete the rows the test created, and nothing else."""
+        log_ids = self.created_ids(SMSLog)
+        for ids in chunks(log_ids, 1000):
+            NotificationLedger.objects.filter(log_id__in=ids).delete()
+            SMSLog.objects.filter(id__in=ids).delete()  # with their outbox rows
+        # Bulk sends write their logs with bulk_create, which sends no signal
+        SMSLog.objects.filter(provider=provider).delete()
+        for ids in chunks(self.created_ids(NotificationRuleRun), 1000):
+            # Left in place they would make the scheduler skip the next real run
+            NotificationRuleRun.objects.filter(id__in=ids).delete()
+        for keys in chunks(list(bucket_keys), 1000):
+            SMSRateLimit.objects.filter(key__in=keys).delete()
+        provider.delete()
+
+    def numbers(self, count):
+        # Made-up numbers; they only ever reach the fake gateway
+        return [f"0990{i:07d}" for i in range(count)]
+
+    def report(self, label, count, ok, elapsed, latencies, unit='s'):
+        scale = 1000 if unit == 'ms' else 1
+        self.stdout.write(self.style.SUCCESS(
+            f"{label}: {ok}/{count} sent in {elapsed:.2f}s ({ok / elapsed if elapsed else 0:.1f}/s); "
+            f"latency p50 {percentile(latencies, 50) * scale:.1f}{unit}, "
+            f"p95 {percentile(latencies, 95) * scale:.1f}{unit}, max {max(latencies or [0]) * scale:.1f}{unit}"
+        ))
+
+    def run_paced(self, count, rate, concurrency, call):
+        """Run call(i) count times at rate per second. Returns (ok, elapsed, latencies)."""
+        latencies = []
+        results = []
+
+        def timed(i):
+            started = time.monotonic()
+            try:
+                result = call(i)
+            finally:
+                connection.close()
+            latencies.append(time.monotonic() - started)
+            results.append(result)
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            for i in paced(count, rate):
+                executor.submit(timed, i)
+        return sum(results), time.monotonic() - started, latencies
+
+    def run_deliver(self, provider, options):
+        numbers = self.numbers(options['messages'])
+
+        def send(i):
+            return IPPanelSMSSender.deliver(provider, numbers[i], 'آزمون بار پیامک')['status'] == 'OK'
+
+        ok, elapsed, latencies = self.run_paced(len(numbers), options['rate'], options['concurrency'], send)
+        self.report('Gateway requests', len(numbers), ok, elapsed, latencies, 'ms')
+
+    def run_bulk(self, provider, options):
+        numbers = self.numbers(options['messages'] * options['recipients'])
+
+        def send(i):
+            chunk = numbers[i * options['recipients']:(i + 1) * options['recipients']]
+            return IPPanelSMSSender.send_bulk_sms(chunk, 'آزمون بار پیامک گروهی')['total_sent']
+
+        ok, elapsed, latencies = self.run_paced(options['messages'], options['rate'], options['concurrency'], send)
+        self.report('Bulk sends', len(numbers), ok, elapsed, latencies, 'ms')
+
+    def run_outbox(self, provider, options):
+        numbers = self.numbers(options['messages'])
+        producing = threading.Event()
+        producing.set()
+
+        def produce():
+            try:
+                for i in paced(len(numbers), options['rate']):
+                    enqueue_sms(numbers[i], f'آزمون بار پیامک شماره {i}')
+            finally:
+                producing.clear()
+                connection.close()
+
+        started = time.monotonic()
+        threading.Thread(target=produce, name='sms-load-producer').start()
+        self.drain(provider, options, producing)
+        self.report_outbox(started)
+
+    def run_automated(self, provider, options):
+        started = time.monotonic()
+        call_command('send_automated_sms', force=True, stdout=self.stdout)
+        queued = time.monotonic() - started
+        self.stdout.write(f"send_automated_sms queued {self.outbox_rows().count()} messages in {queued:.2f}s")
+        self.drain(provider, options)
+        self.report_outbox(started)
+
+    def outbox_rows(self):
+        return SMSOutbox.objects.filter(id__in=self.created_ids(SMSOutbox))
+
+    def drain(self, provider, options, producing=None):
+        """Claim and dispatch until the outbox is empty (and the producer is done)."""
+        worker = f"load-test-{uuid.uuid4().hex[:8]}"
+        idle_since = None
+        while True:
+            items = claim_batch(worker, max(1, options['batch_size']), self.outbox_rows())
+            if items:
+                idle_since = None
+                dispatch_batch(items, provider, IPPanelSMSSender.deliver, options['concurrency'])
+                continue
+            if producing is not None and producing.is_set():
+                time.sleep(0.05)
+                continue
+            waiting = self.outbox_rows().filter(status=SMSOutbox.PENDING).exists()
+            if not waiting:
+                break
+            # Rate limited or retrying: wait for them, but not forever
+            idle_since = idle_since or time.monotonic()
+            if time.monotonic() - idle_since > 60:
+                self.stdout.write(self.style.WARNING('Messages still deferred after 60s, stopping'))
+                break
+            time.sleep(0.5)
+
+    def report_outbox(self, started):
+        elapsed = time.monotonic() - started
+        rows = self.outbox_rows()
+        total = rows.count()
+        latencies = [(sent_at - created_at).total_seconds()
+                     for created_at, sent_at in rows.filter(status=SMSOutbox.SENT).values_list('created_at', 'sent_at')]
+        self.report('Outbox (queued to sent)', total, len(latencies), elapsed, latencies)
+        failed = rows.filter(status=SMSOutbox.FAILED).count()
+        if failed:
+            self.stdout.write(self.style.WARNING(f"{failed} messages failed"))
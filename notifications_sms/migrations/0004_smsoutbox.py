@@ -0,0 +1,60 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notifications_sms", "0003_alter_smsprovider_base_url"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SMSOutbox",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("recipient_number", models.CharField(max_length=20, verbose_name="Recipient Number")),
+                ("message", models.TextField(verbose_name="Message Content")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("PENDING", "Pending"),
+                            ("PROCESSING", "Processing"),
+                            ("SENT", "Sent"),
+                            ("FAILED", "Failed"),
+                        ],
+                        default="PENDING",
+                        max_length=20,
+                        verbose_name="Status",
+                    ),
+                ),
+                ("attempts", models.PositiveIntegerField(default=0, verbose_name="Attempts")),
+                (
+                    "available_at",
+                    models.DateTimeField(default=django.utils.timezone.now, verbose_name="Available At"),
+                ),
+                ("locked_at", models.DateTimeField(blank=True, null=True, verbose_name="Locked At")),
+                ("locked_by", models.CharField(blank=True, max_length=100, verbose_name="Locked By")),
+                ("last_error", models.TextField(blank=True, verbose_name="Last Error")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("sent_at", models.DateTimeField(blank=True, null=True, verbose_name="Sent At")),
+                (
+                    "log",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="outbox",
+                        to="notifications_sms.smslog",
+                        verbose_name="SMS Log",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "SMS Outbox Message",
+                "verbose_name_plural": "SMS Outbox",
+                "ordering": ["id"],
+                "indexes": [models.Index(fields=["status", "available_at"], name="smsoutbox_claim_idx")],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notifications_sms", "0004_smsoutbox"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="smsprovider",
+            name="credit",
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=16, null=True, verbose_name="Credit"),
+        ),
+        migrations.AddField(
+            model_name="smsprovider",
+            name="credit_synced_at",
+            field=models.DateTimeField(blank=True, null=True, verbose_name="Credit Synced At"),
+        ),
+        migrations.CreateModel(
+            name="SMSRateLimit",
+            fields=[
+                ("key", models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name="Key")),
+                ("tokens", models.FloatField(verbose_name="Tokens")),
+                ("updated_at", models.DateTimeField(verbose_name="Updated At")),
+            ],
+            options={
+                "verbose_name": "SMS Rate Limit",
+                "verbose_name_plural": "SMS Rate Limits",
+            },
+        ),
+    ]
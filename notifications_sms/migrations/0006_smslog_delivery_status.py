@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notifications_sms", "0005_sms_rate_limit_and_credit"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="smslog",
+            name="status",
+            field=models.CharField(
+                choices=[("SENT", "Sent"), ("DELIVERED", "Delivered"), ("FAILED", "Failed"), ("PENDING", "Pending")],
+                default="PENDING",
+                max_length=20,
+                verbose_name="Status",
+            ),
+        ),
+        migrations.AddField(
+            model_name="smslog",
+            name="delivered_at",
+            field=models.DateTimeField(blank=True, null=True, verbose_name="Delivered At"),
+        ),
+        migrations.AddField(
+            model_name="smslog",
+            name="next_status_check",
+            field=models.DateTimeField(blank=True, null=True, verbose_name="Next Status Check"),
+        ),
+        migrations.AddIndex(
+            model_name="smslog",
+            index=models.Index(fields=["status", "sent_at"], name="smslog_status_sent_idx"),
+        ),
+    ]
@@ -0,0 +1,65 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("creator_project", "0005_project_site_area_project_wall_length"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("notifications_sms", "0006_smslog_delivery_status"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="NotificationLedger",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("kind", models.CharField(max_length=50, verbose_name="Kind")),
+                ("period_key", models.CharField(max_length=20, verbose_name="Period")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "log",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="ledger_entries",
+                        to="notifications_sms.smslog",
+                        verbose_name="SMS Log",
+                    ),
+                ),
+                (
+                    "project",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="sms_notifications",
+                        to="creator_project.project",
+                        verbose_name="Project",
+                    ),
+                ),
+                (
+                    "recipient",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="sms_notification_ledger",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Recipient",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Notification Ledger Entry",
+                "verbose_name_plural": "Notification Ledger",
+                "indexes": [
+                    models.Index(fields=["kind", "created_at"], name="notificationledger_time_idx"),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("kind", "period_key", "project", "recipient"), name="notificationledger_unique"
+                    )
+                ],
+            },
+        ),
+    ]
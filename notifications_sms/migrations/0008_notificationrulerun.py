@@ -0,0 +1,71 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("notifications_sms", "0007_notificationledger"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="NotificationRuleRun",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "rule",
+                    models.CharField(
+                        choices=[
+                            ("PROJECT_OUTDATED", "Outdated Projects"),
+                            ("PROJECT_NOT_EXAMINED", "Not Examined Projects"),
+                        ],
+                        max_length=50,
+                        verbose_name="Rule",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("QUEUED", "Queued"),
+                            ("RUNNING", "Running"),
+                            ("DONE", "Done"),
+                            ("FAILED", "Failed"),
+                        ],
+                        default="QUEUED",
+                        max_length=20,
+                        verbose_name="Status",
+                    ),
+                ),
+                ("candidates", models.PositiveIntegerField(default=0, verbose_name="Candidates")),
+                ("queued", models.PositiveIntegerField(default=0, verbose_name="Messages Queued")),
+                ("error", models.TextField(blank=True, verbose_name="Error")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("started_at", models.DateTimeField(blank=True, null=True, verbose_name="Started At")),
+                ("finished_at", models.DateTimeField(blank=True, null=True, verbose_name="Finished At")),
+                (
+                    "requested_by",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="notification_rule_runs",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Requested By",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Notification Rule Run",
+                "verbose_name_plural": "Notification Rule Runs",
+                "ordering": ["-created_at"],
+                "indexes": [
+                    models.Index(fields=["status", "created_at"], name="rulerun_status_idx"),
+                    models.Index(fields=["rule", "started_at"], name="rulerun_rule_idx"),
+                ],
+            },
+        ),
+    ]
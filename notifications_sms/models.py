@@ -1,7 +1,10 @@
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
+from django.utils import timezone
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from .templating import TYPE_PLACEHOLDERS, clear_cache, placeholder_help, validate_template_content
 
 User = get_user_model()
 
@@ -29,6 +32,10 @@ class SMSProvider(models.Model):
         default='IPPANEL'
     )
     
+    # Locally tracked credit: decremented per part sent, re-read from the gateway periodically
+    credit = models.DecimalField(_('Credit'), max_digits=16, decimal_places=2, null=True, blank=True)
+    credit_synced_at = models.DateTimeField(_('Credit Synced At'), null=True, blank=True)
+    
     def __str__(self):
         return self.name
     
@@ -127,6 +134,18 @@ class SMSTemplate(models.Model):
     def __str__(self):
         return self.name
     
+    def clean(self):
+        super().clean()
+        try:
+            validate_template_content(self.content, self.type)
+        except ValidationError as e:
+            raise ValidationError({'content': e.messages})
+    
+    @property
+    def available_placeholders(self):
+        """[(placeholder, label)] this template is rendered with"""
+        return placeholder_help(self.type) if self.type in TYPE_PLACEHOLDERS else []
+    
     def save(self, *args, **kwargs):
         """Ensure only one default template per type"""
         if self.is_default:
@@ -136,6 +155,7 @@ class SMSTemplate(models.Model):
                 is_default=True
             ).exclude(pk=self.pk).update(is_default=False)
         super().save(*args, **kwargs)
+        clear_cache()
     
     class Meta:
         verbose_name = _('SMS Template')
@@ -144,11 +164,13 @@ class SMSTemplate(models.Model):
 class SMSLog(models.Model):
     """Log of sent SMS messages"""
     SENT = 'SENT'
+    DELIVERED = 'DELIVERED'
     FAILED = 'FAILED'
     PENDING = 'PENDING'
     
     STATUS_CHOICES = (
         (SENT, _('Sent')),
+        (DELIVERED, _('Delivered')),
         (FAILED, _('Failed')),
         (PENDING, _('Pending')),
     )
@@ -189,6 +211,9 @@ class SMSLog(models.Model):
         verbose_name=_('Provider Used')
     )
     sent_at = models.DateTimeField(auto_now_add=True)
+    # Delivery report polling (see poll_sms_delivery)
+    delivered_at = models.DateTimeField(_('Delivered At'), null=True, blank=True)
+    next_status_check = models.DateTimeField(_('Next Status Check'), null=True, blank=True)
     
     def __str__(self):
         return f"{self.recipient_number} - {self.sent_at}"
@@ -197,3 +222,172 @@ class SMSLog(models.Model):
         verbose_name = _('SMS Log')
         verbose_name_plural = _('SMS Logs')
         ordering = ['-sent_at']
+        indexes = [
+            models.Index(fields=['status', 'sent_at'], name='smslog_status_sent_idx'),
+        ]
+
+class SMSOutbox(models.Model):
+    """
+    Messages waiting to be sent. Rows are written in the same transaction
+    as the change that triggers them and sent by the sms_dispatcher command,
+    so web requests never wait on the SMS gateway.
+    """
+    PENDING = 'PENDING'
+    PROCESSING = 'PROCESSING'
+    SENT = 'SENT'
+    FAILED = 'FAILED'
+
+    STATUS_CHOICES = (
+        (PENDING, _('Pending')),
+        (PROCESSING, _('Processing')),
+        (SENT, _('Sent')),
+        (FAILED, _('Failed')),
+    )
+
+    log = models.OneToOneField(
+        SMSLog,
+        on_delete=models.CASCADE,
+        related_name='outbox',
+        verbose_name=_('SMS Log')
+    )
+    recipient_number = models.CharField(_('Recipient Number'), max_length=20)
+    message = models.TextField(_('Message Content'))
+    status = models.CharField(_('Status'), max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(_('Attempts'), default=0)
+    available_at = models.DateTimeField(_('Available At'), default=timezone.now)
+    locked_at = models.DateTimeField(_('Locked At'), null=True, blank=True)
+    locked_by = models.CharField(_('Locked By'), max_length=100, blank=True)
+    last_error = models.TextField(_('Last Error'), blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(_('Sent At'), null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.recipient_number} - {self.status}"
+
+    class Meta:
+        verbose_name = _('SMS Outbox Message')
+        verbose_name_plural = _('SMS Outbox')
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='smsoutbox_claim_idx'),
+        ]
+
+
+class SMSRateLimit(models.Model):
+    """Token bucket shared by all dispatcher processes (see notifications_sms.throttle)"""
+    key = models.CharField(_('Key'), max_length=100, primary_key=True)
+    tokens = models.FloatField(_('Tokens'))
+    updated_at = models.DateTimeField(_('Updated At'))
+
+    def __str__(self):
+        return f"{self.key}: {self.tokens:.1f}"
+
+    class Meta:
+        verbose_name = _('SMS Rate Limit')
+        verbose_name_plural = _('SMS Rate Limits')
+
+class NotificationLedger(models.Model):
+    """
+    One row per automated notification: who was told about which project,
+    for what, in which period. The unique index makes "was this already
+    sent?" an indexed lookup and stops two runs from sending it twice.
+    """
+    PROJECT_OUTDATED = SMSTemplate.PROJECT_OUTDATED
+    PROJECT_NOT_EXAMINED = SMSTemplate.PROJECT_NOT_EXAMINED
+
+    project = models.ForeignKey(
+        'creator_project.Project',
+        on_delete=models.CASCADE,
+        related_name='sms_notifications',
+        verbose_name=_('Project')
+    )
+    recipient = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='sms_notification_ledger',
+        verbose_name=_('Recipient')
+    )
+    kind = models.CharField(_('Kind'), max_length=50)
+    period_key = models.CharField(_('Period'), max_length=20)
+    log = models.ForeignKey(
+        SMSLog,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='ledger_entries',
+        verbose_name=_('SMS Log')
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.kind} {self.period_key} - {self.recipient_id}/{self.project_id}"
+
+    @staticmethod
+    def daily_period(when=None):
+        return timezone.localdate(when).isoformat()
+
+    class Meta:
+        verbose_name = _('Notification Ledger Entry')
+        verbose_name_plural = _('Notification Ledger')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['kind', 'period_key', 'project', 'recipient'],
+                name='notificationledger_unique',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['kind', 'created_at'], name='notificationledger_time_idx'),
+        ]
+
+
+class NotificationRuleRun(models.Model):
+    """
+    One run of an automated notification rule. The notification_scheduler
+    command starts runs when a rule's check interval has passed and picks
+    up runs requested from the alerts dashboard.
+    """
+    QUEUED = 'QUEUED'
+    RUNNING = 'RUNNING'
+    DONE = 'DONE'
+    FAILED = 'FAILED'
+
+    STATUS_CHOICES = (
+        (QUEUED, _('Queued')),
+        (RUNNING, _('Running')),
+        (DONE, _('Done')),
+        (FAILED, _('Failed')),
+    )
+
+    RULE_CHOICES = (
+        (NotificationLedger.PROJECT_OUTDATED, _('Outdated Projects')),
+        (NotificationLedger.PROJECT_NOT_EXAMINED, _('Not Examined Projects')),
+    )
+
+    rule = models.CharField(_('Rule'), max_length=50, choices=RULE_CHOICES)
+    status = models.CharField(_('Status'), max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    requested_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='notification_rule_runs',
+        verbose_name=_('Requested By')
+    )
+    candidates = models.PositiveIntegerField(_('Candidates'), default=0)
+    queued = models.PositiveIntegerField(_('Messages Queued'), default=0)
+    error = models.TextField(_('Error'), blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(_('Started At'), null=True, blank=True)
+    finished_at = models.DateTimeField(_('Finished At'), null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.get_rule_display()} - {self.status}"
+
+    class Meta:
+        verbose_name = _('Notification Rule Run')
+        verbose_name_plural = _('Notification Rule Runs')
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='rulerun_status_idx'),
+            models.Index(fields=['rule', 'started_at'], name='rulerun_rule_idx'),
+        ]
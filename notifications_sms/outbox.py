@@ -0,0 +1,199 @@
+"""
+Transactional SMS outbox.
+
+enqueue_sms() writes a PENDING SMSLog and an SMSOutbox row in the caller's
+transaction: if the approval or review that triggered the message rolls
+back, so does the message, and nothing is sent before the data is
+committed. The sms_dispatcher command claims rows with
+SELECT ... FOR UPDATE SKIP LOCKED, so several dispatchers can run side by
+side without sending a message twice, sends a batch concurrently and
+writes the results back with bulk updates.
+"""
+import logging
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import SMSLog, SMSOutbox
+from . import throttle
+from .utils import SMS_CHUNK_SIZE, chunks
+
+logger = logging.getLogger(__name__)
+
+# A PROCESSING row whose dispatcher died is claimed again after this long
+STALE_LOCK_TIMEOUT = datetime.timedelta(minutes=10)
+MAX_ATTEMPTS = 5
+# When messages held back by the gateway or by low credit are tried again
+THROTTLED_RETRY_DELAY = datetime.timedelta(seconds=30)
+CREDIT_RETRY_DELAY = datetime.timedelta(minutes=5)
+
+
+def enqueue_sms(recipient_number, message, sender_user=None, recipient_user=None, template=None):
+    """Queue an SMS for the dispatcher. Returns the SMSLog, which stays PENDING until it is sent."""
+    with transaction.atomic():
+        log = SMSLog.objects.create(
+            sender=sender_user,
+            recipient_number=recipient_number,
+            recipient_user=recipient_user,
+            message=message,
+            template=template,
+            status=SMSLog.PENDING,
+        )
+        SMSOutbox.objects.create(log=log, recipient_number=recipient_number, message=message)
+    return log
+
+
+def claim_batch(worker, batch_size, queryset=None):
+    """
+    Lock up to batch_size due messages for this worker and mark them
+    PROCESSING. queryset limits the rows that may be claimed.
+    """
+    now = timezone.now()
+    queryset = queryset if queryset is not None else SMSOutbox.objects.all()
+    with transaction.atomic():
+        ids = list(
+            queryset.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=SMSOutbox.PENDING, available_at__lte=now)
+                | Q(status=SMSOutbox.PROCESSING, locked_at__lt=now - STALE_LOCK_TIMEOUT)
+            )
+            .order_by('id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if ids:
+            SMSOutbox.objects.filter(id__in=ids).update(
+                status=SMSOutbox.PROCESSING,
+                locked_at=now,
+                locked_by=worker,
+                attempts=F('attempts') + 1,
+            )
+    return list(SMSOutbox.objects.filter(id__in=ids).order_by('id'))
+
+
+def retry_delay(attempts):
+    """Exponential backoff: 1, 2, 4, 8 ... minutes, at most an hour."""
+    return datetime.timedelta(minutes=min(2 ** (attempts - 1), 60))
+
+
+def dispatch_batch(items, provider, send, concurrency=8, max_attempts=MAX_ATTEMPTS):
+    """
+    Send claimed outbox rows with send(provider, numbers, message) on a
+    thread pool and store the results. Messages over a recipient's rate
+    limit, beyond the provider's remaining credit or refused because the
+    gateway is throttling are put back without using up an attempt.
+    Returns (sent, failed, retried, deferred).
+    """
+    if not items:
+        return 0, 0, 0, 0
+
+    now = timezone.now()
+    deferred = {}
+
+    # Credit first: a message held back for credit must not use up its recipient's tokens
+    to_send = items
+    if provider.credit is not None:
+        budget = provider.credit
+        affordable = []
+        for item in items:
+            cost = throttle.message_cost(item.message)
+            if cost > budget:
+                deferred[item.id] = CREDIT_RETRY_DELAY
+            else:
+                budget -= cost
+                affordable.append(item)
+        if len(affordable) < len(items):
+            logger.warning("SMS credit of %s is too low, holding %d messages back",
+                           provider.name, len(items) - len(affordable))
+        to_send = affordable
+
+    # Per-recipient limits: defer the messages a number has no tokens for
+    limited = throttle.take_recipients([item.recipient_number for item in to_send]) if to_send else {}
+    for item in to_send:
+        if item.recipient_number in limited:
+            allowed, wait = limited[item.recipient_number]
+            if allowed:
+                limited[item.recipient_number] = (allowed - 1, wait)
+            else:
+                deferred[item.id] = datetime.timedelta(seconds=wait)
+    to_send = [item for item in to_send if item.id not in deferred]
+
+    # Identical messages (announcements, reminders) go out as multi-recipient requests
+    groups = {}
+    for item in to_send:
+        groups.setdefault(item.message, []).append(item)
+    batches = [group for message_items in groups.values() for group in chunks(message_items, SMS_CHUNK_SIZE)]
+
+    def send_group(group):
+        # Every failure becomes this group's result, so the other groups' outcomes are still written
+        try:
+            try:
+                # Pace requests so the gateway does not have to throttle us
+                throttle.acquire_provider(provider, len(group))
+            except Exception as e:
+                logger.exception("Could not pace SMS sending, retrying the group later")
+                return {"status": "ERROR", "message": f"Rate limiter failed: {e}", "retryable": True}
+            try:
+                result = send(provider, [item.recipient_number for item in group], group[0].message)
+            except Exception as e:
+                # The gateway may have accepted it: do not send it again
+                logger.exception("SMS send failed")
+                return {"status": "ERROR", "message": str(e)}
+            if result.get('status') == 'OK':
+                try:
+                    throttle.charge(provider, throttle.message_cost(group[0].message, len(group)))
+                except Exception:
+                    # The tracked credit is corrected on the next sync with the gateway
+                    logger.exception("Could not charge sent SMS to %s", provider.name)
+            return result
+        finally:
+            # Pool threads keep their own connection; do not leave it open
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        responses = executor.map(send_group, batches)
+        results = {item.id: result for group, result in zip(batches, responses) for item in group}
+
+    now = timezone.now()
+    logs = []
+    sent = failed = retried = 0
+    for item in items:
+        item.locked_at = None
+        item.locked_by = ''
+        result = results.get(item.id)
+        if result is None or result.get('throttled'):
+            # Not a real attempt: the message itself did not fail
+            item.status = SMSOutbox.PENDING
+            item.attempts -= 1
+            item.available_at = now + deferred.get(item.id, THROTTLED_RETRY_DELAY)
+            if result is not None:
+                item.last_error = str(result.get('message', ''))
+            continue
+
+        log = SMSLog(id=item.log_id, provider=provider)
+        if result.get('status') == 'OK':
+            sent += 1
+            item.status = SMSOutbox.SENT
+            item.sent_at = now
+            item.last_error = ''
+            log.status, log.message_id, log.error_message, log.sent_at = SMSLog.SENT, result.get('message_id'), None, now
+        else:
+            error = str(result.get('message', 'Unknown error'))
+            item.last_error = error
+            log.message_id, log.error_message, log.sent_at = None, error, now
+            if result.get('retryable') and item.attempts < max_attempts:
+                retried += 1
+                item.status = SMSOutbox.PENDING
+                item.available_at = now + retry_delay(item.attempts)
+                log.status = SMSLog.PENDING
+            else:
+                failed += 1
+                item.status = SMSOutbox.FAILED
+                log.status = SMSLog.FAILED
+        logs.append(log)
+
+    with transaction.atomic():
+        SMSOutbox.objects.bulk_update(
+            items, ['status', 'attempts', 'sent_at', 'last_error', 'available_at', 'locked_at', 'locked_by'])
+        SMSLog.objects.bulk_update(logs, ['status', 'message_id', 'error_message', 'provider', 'sent_at'])
+    return sent, failed, retried, len(items) - sent - failed - retried
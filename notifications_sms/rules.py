@@ -0,0 +1,201 @@
+"""
+Automated notification rules and their runs.
+
+Each rule selects its candidates with a few set-based queries: projects
+come from one indexed query per rule, and pairs that were already
+notified in the current period are excluded through the ledger's unique
+index instead of per-project lookups. Messages are queued through the
+outbox, never sent in the run itself.
+
+Runs are recorded as NotificationRuleRun rows. The notification_scheduler
+command starts a run when a rule's check interval has passed and executes
+runs requested from the alerts dashboard, so a web request only inserts a
+row.
+"""
+import logging
+import datetime
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef
+from django.utils import timezone
+from accounts.models import User
+from creator_project.models import Project
+from .ledger import notified_pairs, notify
+from .models import NotificationLedger, NotificationRuleRun, SMSSettings
+from .templating import render_default
+
+logger = logging.getLogger(__name__)
+
+OUTDATED = NotificationLedger.PROJECT_OUTDATED
+NOT_EXAMINED = NotificationLedger.PROJECT_NOT_EXAMINED
+
+# A run still RUNNING after this long was interrupted (the process died)
+STALE_RUN_TIMEOUT = datetime.timedelta(hours=1)
+
+OUTDATED_FALLBACK = (
+    "سلام {user_name}\n"
+    "پروژه '{project_name}' شما {days} روز است که بروزرسانی نشده. "
+    "لطفاً وضعیت پروژه را بروزرسانی کنید.\n"
+    "(ارسال خودکار سیستم)"
+)
+NOT_EXAMINED_FALLBACK = (
+    "سلام جناب {expert_name}\n"
+    "{project_count} پروژه {days} روز است که منتظر بررسی شماست:\n"
+    "{project_list}\n"
+    "لطفاً در اسرع وقت نسبت به بررسی اقدام کنید.\n"
+    "(ارسال خودکار سیستم)"
+)
+
+
+def outdated_projects(sms_settings):
+    """Submitted projects not updated for outdated_project_days whose owner has a phone number."""
+    cutoff = timezone.now() - datetime.timedelta(days=sms_settings.outdated_project_days)
+    return (
+        Project.objects.filter(is_submitted=True, updated_at__lt=cutoff)
+        .exclude(created_by__phone_number__isnull=True)
+        .exclude(created_by__phone_number='')
+        .order_by()
+    )
+
+
+def not_examined_projects(sms_settings):
+    """Submitted projects waiting for expert approval for not_examined_days."""
+    cutoff = timezone.now() - datetime.timedelta(days=sms_settings.not_examined_days)
+    return Project.objects.filter(is_submitted=True, is_expert_approved=False, created_at__lt=cutoff).order_by()
+
+
+def run_outdated(sms_settings):
+    """Remind project owners about their outdated projects. Returns (candidates, queued)."""
+    period_key = NotificationLedger.daily_period()
+    already_notified = NotificationLedger.objects.filter(
+        kind=OUTDATED, period_key=period_key, project=OuterRef('pk'), recipient=OuterRef('created_by'),
+    )
+    projects = list(
+        outdated_projects(sms_settings)
+        .filter(~Exists(already_notified))
+        .select_related('created_by')
+        .order_by('id')
+    )
+
+    queued = 0
+    for project in projects:
+        owner = project.created_by
+        message, template = render_default(
+            OUTDATED, OUTDATED_FALLBACK,
+            project_name=project.name,
+            user_name=owner.get_full_name() or owner.username,
+            days=sms_settings.outdated_project_days,
+        )
+        if notify(OUTDATED, period_key, owner, [project], message, template):
+            queued += 1
+    return len(projects), queued
+
+
+def run_not_examined(sms_settings):
+    """Remind experts about projects waiting for review, one message per expert and province."""
+    period_key = NotificationLedger.daily_period()
+    projects = list(not_examined_projects(sms_settings).only('id', 'name', 'province').order_by('id'))
+    if not projects:
+        return 0, 0
+
+    experts = list(User.objects.filter(role='EXPERT', is_active=True, phone_number__isnull=False)
+                   .exclude(phone_number=''))
+    notified = notified_pairs(NOT_EXAMINED, period_key, [project.id for project in projects])
+
+    by_province = {}
+    for project in projects:
+        by_province.setdefault(project.province, []).append(project)
+
+    queued = 0
+    for province, province_projects in by_province.items():
+        for expert in experts:
+            pending = [project for project in province_projects if (project.id, expert.id) not in notified]
+            if not pending:
+                continue
+            project_list = ', '.join(project.name[:30] for project in pending[:3])
+            if len(pending) > 3:
+                project_list += f" و {len(pending) - 3} پروژه دیگر"
+            message, template = render_default(
+                NOT_EXAMINED, NOT_EXAMINED_FALLBACK,
+                expert_name=expert.get_full_name() or expert.username,
+                project_count=len(pending),
+                project_list=project_list,
+                days=sms_settings.not_examined_days,
+            )
+            if notify(NOT_EXAMINED, period_key, expert, pending, message, template):
+                queued += 1
+    return len(projects), queued
+
+
+# rule: (SMSSettings flag that enables it, function)
+RULES = {
+    OUTDATED: ('auto_send_outdated', run_outdated),
+    NOT_EXAMINED: ('auto_send_not_examined', run_not_examined),
+}
+
+
+def enabled_rules(sms_settings):
+    return [rule for rule, (flag, _) in RULES.items() if getattr(sms_settings, flag)]
+
+
+def due_rules(sms_settings, now=None):
+    """Enabled rules whose last run started at least check_interval_hours ago."""
+    now = now or timezone.now()
+    interval = datetime.timedelta(hours=sms_settings.check_interval_hours)
+    rules = enabled_rules(sms_settings)
+    last_started = dict(
+        NotificationRuleRun.objects.filter(rule__in=rules, started_at__isnull=False)
+        .values('rule').annotate(last=Max('started_at')).values_list('rule', 'last')
+    )
+    return [rule for rule in rules if rule not in last_started or now - last_started[rule] >= interval]
+
+
+def request_run(rule, user=None):
+    """Queue a run of rule for the scheduler unless one is already waiting. Returns (run, created)."""
+    with transaction.atomic():
+        run = NotificationRuleRun.objects.select_for_update().filter(
+            rule=rule, status=NotificationRuleRun.QUEUED).first()
+        if run:
+            return run, False
+        return NotificationRuleRun.objects.create(rule=rule, requested_by=user), True
+
+
+def claim_requested_run():
+    """Take the oldest queued run, or None. Safe with several schedulers running."""
+    with transaction.atomic():
+        run = (NotificationRuleRun.objects.select_for_update(skip_locked=True)
+               .filter(status=NotificationRuleRun.QUEUED).order_by('created_at').first())
+        if run:
+            run.status = NotificationRuleRun.RUNNING
+            run.started_at = timezone.now()
+            run.save(update_fields=['status', 'started_at'])
+    return run
+
+
+def start_run(rule):
+    return NotificationRuleRun.objects.create(
+        rule=rule, status=NotificationRuleRun.RUNNING, started_at=timezone.now())
+
+
+def execute(run, sms_settings=None):
+    """Run the rule of a RUNNING run and record the outcome. Returns the run."""
+    sms_settings = sms_settings or SMSSettings.get_settings()
+    try:
+        if not sms_settings.provider:
+            raise RuntimeError('No SMS provider configured')
+        run.candidates, run.queued = RULES[run.rule][1](sms_settings)
+        run.status = NotificationRuleRun.DONE
+    except Exception as e:
+        logger.exception("Notification rule %s failed", run.rule)
+        run.status = NotificationRuleRun.FAILED
+        run.error = str(e)
+    run.finished_at = timezone.now()
+    run.save(update_fields=['status', 'candidates', 'queued', 'error', 'finished_at'])
+    return run
+
+
+def fail_stale_runs():
+    """Mark runs left RUNNING by a process that died as FAILED."""
+    return NotificationRuleRun.objects.filter(
+        status=NotificationRuleRun.RUNNING,
+        started_at__lt=timezone.now() - STALE_RUN_TIMEOUT,
+    ).update(status=NotificationRuleRun.FAILED, error='Interrupted', finished_at=timezone.now())
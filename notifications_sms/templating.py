@@ -0,0 +1,182 @@
+"""
+Compiled SMS templates.
+
+A template's content is parsed once into literal text and placeholder
+slots; rendering is then a join over the slots, with no string scanning.
+Compiled templates are cached by (id, updated_at), so an edited template
+is recompiled on first use. Default templates are cached per type for a
+short time, so a batch can render thousands of messages without touching
+the database.
+
+Placeholders are written {name}. The older spellings {name of project}
+and {reason of rejection} are aliases of {project_name} and
+{rejection_reason}. A placeholder with no value is left in the message
+as written, as the str.replace chains this replaces did.
+"""
+import re
+import time
+import threading
+from django.core.exceptions import ValidationError
+from django.utils.translation import gettext_lazy as _
+
+PLACEHOLDER = re.compile(r'\{([^{}\n]{1,40})\}')
+
+ALIASES = {
+    'name of project': 'project_name',
+    'reason of rejection': 'rejection_reason',
+}
+
+# Placeholders each template type is rendered with, i.e. what its senders pass.
+# Custom templates are not rendered by the system, so they are not checked.
+TYPE_PLACEHOLDERS = {
+    'PROJECT_OUTDATED': ('user_name', 'project_name', 'days'),
+    'PROJECT_REJECTED': (
+        'first_name', 'last_name', 'full_name', 'role',
+        'project_name', 'project_id', 'rejection_reason', 'rejection_date', 'expert_name',
+    ),
+    'PROJECT_NOT_EXAMINED': ('expert_name', 'project_count', 'project_list', 'days'),
+    'FUNDING_REQUEST_APPROVED': (
+        'first_name', 'last_name', 'full_name', 'role', 'province', 'project_name',
+        'final_amount', 'province_amount', 'approval_date', 'chief_name', 'expert_name',
+    ),
+}
+
+PLACEHOLDERS = set().union(*TYPE_PLACEHOLDERS.values())
+
+# Shown next to each placeholder in the template editor
+PLACEHOLDER_LABELS = {
+    'user_name': 'نام کاربر',
+    'first_name': 'نام',
+    'last_name': 'نام خانوادگی',
+    'full_name': 'نام کامل',
+    'role': 'نقش',
+    'province': 'استان',
+    'project_name': 'نام پروژه',
+    'project_id': 'شناسه پروژه',
+    'days': 'تعداد روز',
+    'rejection_reason': 'دلیل رد',
+    'rejection_date': 'تاریخ رد',
+    'expert_name': 'نام کارشناس',
+    'final_amount': 'مبلغ تایید شده',
+    'province_amount': 'مبلغ درخواستی استان',
+    'approval_date': 'تاریخ تایید',
+    'chief_name': 'نام تایید کننده',
+    'project_count': 'تعداد پروژه‌ها',
+    'project_list': 'فهرست پروژه‌ها',
+}
+
+DEFAULT_TEMPLATE_TTL = 60
+
+_compiled = {}
+_defaults = {}
+_lock = threading.Lock()
+
+
+class CompiledTemplate:
+    """Template content split into literal text and placeholder names."""
+
+    def __init__(self, content):
+        self.content = content
+        self.segments = []
+        position = 0
+        for match in PLACEHOLDER.finditer(content):
+            if match.start() > position:
+                self.segments.append((content[position:match.start()], None))
+            raw = match.group(0)
+            name = ALIASES.get(match.group(1).strip(), match.group(1).strip())
+            self.segments.append((raw, name))
+            position = match.end()
+        if position < len(content):
+            self.segments.append((content[position:], None))
+        self.placeholders = {name for _, name in self.segments if name}
+
+    def render(self, context=None, **values):
+        if context:
+            values = {**context, **values}
+        return ''.join(
+            text if name is None or values.get(name) is None else str(values[name])
+            for text, name in self.segments
+        )
+
+
+def unknown_placeholders(content, template_type=None):
+    allowed = TYPE_PLACEHOLDERS.get(template_type, PLACEHOLDERS)
+    return sorted(CompiledTemplate(content).placeholders - set(allowed))
+
+
+def placeholder_help(template_type=None):
+    """[(placeholder as written, label)] for the template editor, for one type or all types."""
+    names = TYPE_PLACEHOLDERS.get(template_type) or sorted(PLACEHOLDERS)
+    return [('{%s}' % name, PLACEHOLDER_LABELS[name]) for name in names]
+
+
+def validate_template_content(content, template_type=None):
+    """Raise ValidationError if content uses placeholders its template type is not rendered with."""
+    if template_type is not None and template_type not in TYPE_PLACEHOLDERS:
+        return
+    unknown = unknown_placeholders(content, template_type)
+    if unknown:
+        raise ValidationError(
+            _('Unknown placeholders: %(names)s. Available: %(available)s'),
+            params={
+                'names': ', '.join('{%s}' % name for name in unknown),
+                'available': ', '.join(token for token, _label in placeholder_help(template_type)),
+            },
+            code='unknown_placeholder',
+        )
+
+
+def compile_template(template):
+    """The compiled form of an SMSTemplate, cached by (id, updated_at)."""
+    key = (template.pk, template.updated_at)
+    compiled = _compiled.get(key)
+    if compiled is None or compiled.content != template.content:
+        compiled = CompiledTemplate(template.content)
+        with _lock:
+            # Drop versions of this template that were edited since
+            for old_key in [k for k in _compiled if k[0] == template.pk]:
+                del _compiled[old_key]
+            _compiled[key] = compiled
+    return compiled
+
+
+def render(template, context=None, **values):
+    return compile_template(template).render(context, **values)
+
+
+def get_default_template(template_type):
+    """The default SMSTemplate of a type, cached for DEFAULT_TEMPLATE_TTL seconds."""
+    from .models import SMSTemplate
+
+    cached = _defaults.get(template_type)
+    if cached and time.monotonic() - cached[0] < DEFAULT_TEMPLATE_TTL:
+        return cached[1]
+    template = SMSTemplate.objects.filter(type=template_type, is_default=True).first()
+    _defaults[template_type] = (time.monotonic(), template)
+    return template
+
+
+def render_default(template_type, fallback, context=None, **values):
+    """
+    Render the default template of a type, or fallback (a plain string
+    with the same placeholders) when there is none. Returns (message, template).
+    """
+    template = get_default_template(template_type)
+    if template is None:
+        return _compile_fallback(fallback).render(context, **values), None
+    return render(template, context, **values), template
+
+
+_fallbacks = {}
+
+
+def _compile_fallback(content):
+    compiled = _fallbacks.get(content)
+    if compiled is None:
+        compiled = _fallbacks[content] = CompiledTemplate(content)
+    return compiled
+
+
+def clear_cache():
+    """Forget cached default templates (called when a template is saved)."""
+    _defaults.clear()
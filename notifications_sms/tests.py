@@ -1,3 +1,75 @@
-from django.test import TestCase
+from types import SimpleNamespace
+from unittest import mock
+from django.test import SimpleTestCase, TestCase
+from .models import SMSOutbox, SMSProvider, SMSRateLimit
+from .outbox import claim_batch, dispatch_batch, enqueue_sms
+from .utils import IPPanelSMSSender
 
 # Create your tests here.
+
+# Sends run on a thread pool; the provider bucket is patched out so those
+# threads do not need the test transaction's data
+class DispatchBatchTest(TestCase):
+    def setUp(self):
+        self.provider = SMSProvider.objects.create(name='Test', api_key='test-key')
+        enqueue_sms('09120000001', 'first')
+        enqueue_sms('09120000002', 'second')
+        self.items = claim_batch('test-worker', 10)
+
+    def status_of(self, message):
+        return SMSOutbox.objects.get(message=message).status
+
+    def test_failing_group_keeps_the_other_outcomes(self):
+        """Test that a group whose send raises does not abort the batch"""
+        def send(provider, numbers, message):
+            if message == 'second':
+                raise RuntimeError('connection reset')
+            return {'status': 'OK', 'message_id': '42'}
+
+        with mock.patch('notifications_sms.throttle.acquire_provider'), \
+                mock.patch('notifications_sms.throttle.charge'):
+            self.assertEqual(dispatch_batch(self.items, self.provider, send), (1, 1, 0, 0))
+        self.assertEqual(self.status_of('first'), SMSOutbox.SENT)
+        # The gateway may have accepted it, so it is not sent again
+        self.assertEqual(self.status_of('second'), SMSOutbox.FAILED)
+
+    def test_rate_limiter_failure_retries_the_group(self):
+        """Test that a group that never reached the gateway is retried"""
+        send = mock.Mock(return_value={'status': 'OK', 'message_id': '42'})
+        with mock.patch('notifications_sms.throttle.acquire_provider', side_effect=RuntimeError('lock wait timeout')):
+            self.assertEqual(dispatch_batch(self.items, self.provider, send), (0, 0, 2, 0))
+        send.assert_not_called()
+        self.assertEqual(self.status_of('first'), SMSOutbox.PENDING)
+        self.assertFalse(SMSOutbox.objects.filter(status=SMSOutbox.PROCESSING).exists())
+
+    def test_credit_deferral_keeps_recipient_tokens(self):
+        """Test that a message held back for credit does not use up its recipient's rate limit"""
+        self.provider.credit = 1
+        send = mock.Mock(return_value={'status': 'OK', 'message_id': '42'})
+        with mock.patch('notifications_sms.throttle.acquire_provider'), \
+                mock.patch('notifications_sms.throttle.charge'):
+            self.assertEqual(dispatch_batch(self.items, self.provider, send), (1, 0, 0, 1))
+        self.assertEqual(self.status_of('second'), SMSOutbox.PENDING)
+        self.assertFalse(SMSRateLimit.objects.filter(key='recipient:09120000002').exists())
+        self.assertTrue(SMSRateLimit.objects.filter(key='recipient:09120000001').exists())
+
+
+class FetchStatusesTest(SimpleTestCase):
+    def test_all_pages_are_fetched(self):
+        """Test that delivery statuses are read from every page the gateway reports"""
+        def recipient(number, status):
+            return SimpleNamespace(recipient=number, status=status)
+
+        client = mock.Mock()
+        client.fetch_statuses.side_effect = [
+            ([recipient('09120000001', 'delivered'), recipient('09120000002', 'failed')],
+             {'total': 3, 'limit': 2, 'page': 0, 'pages': 2}),
+            ([recipient('09120000003', 'delivered')], {'total': 3, 'limit': 2, 'page': 1, 'pages': 2}),
+        ]
+        with mock.patch('notifications_sms.utils.get_client', return_value=client):
+            statuses = IPPanelSMSSender.fetch_statuses(SimpleNamespace(api_key='key'), 7, page_size=2)
+
+        self.assertEqual(statuses, {
+            '09120000001': 'delivered', '09120000002': 'failed', '09120000003': 'delivered',
+        })
+        self.assertEqual([c.args for c in client.fetch_statuses.call_args_list], [(7, 0, 2), (7, 1, 2)])
@@ -0,0 +1,153 @@
+"""
+Rate limiting and credit accounting for SMS sending.
+
+Rate limits are token buckets stored in SMSRateLimit rows and updated
+under a row lock, so every dispatcher process on every host shares them:
+one bucket for the provider (messages per second) and one per recipient
+(messages per hour, so a bug cannot flood someone's phone).
+
+Credit is tracked locally on the provider: every message sent subtracts
+its parts from SMSProvider.credit, and the real value is re-read from the
+gateway every CREDIT_SYNC_INTERVAL.
+"""
+import time
+import logging
+import datetime
+from collections import Counter
+from decimal import Decimal
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import SMSProvider, SMSRateLimit
+
+logger = logging.getLogger(__name__)
+
+# Provider bucket: sustained messages per second and burst size
+PROVIDER_RATE = getattr(settings, 'SMS_PROVIDER_RATE', 10)
+PROVIDER_BURST = getattr(settings, 'SMS_PROVIDER_BURST', 50)
+# Recipient bucket: messages per hour to one number and burst size
+RECIPIENT_RATE_PER_HOUR = getattr(settings, 'SMS_RECIPIENT_RATE_PER_HOUR', 6)
+RECIPIENT_BURST = getattr(settings, 'SMS_RECIPIENT_BURST', 3)
+# Credit units charged per message part, and how often credit is re-read from the gateway
+SMS_PART_COST = getattr(settings, 'SMS_PART_COST', 1)
+CREDIT_SYNC_INTERVAL = datetime.timedelta(minutes=getattr(settings, 'SMS_CREDIT_SYNC_MINUTES', 15))
+
+
+def _refill(bucket, rate, capacity, now):
+    elapsed = max((now - bucket.updated_at).total_seconds(), 0)
+    return min(capacity, bucket.tokens + elapsed * rate)
+
+
+def _locked_buckets(keys, capacity, now):
+    """Lock (creating if needed) the bucket rows for keys; new buckets start full."""
+    buckets = {b.key: b for b in SMSRateLimit.objects.select_for_update().filter(key__in=keys)}
+    missing = [key for key in keys if key not in buckets]
+    if missing:
+        try:
+            with transaction.atomic():
+                SMSRateLimit.objects.bulk_create(
+                    [SMSRateLimit(key=key, tokens=capacity, updated_at=now) for key in missing])
+        except IntegrityError:
+            # Another dispatcher created them first
+            pass
+        buckets.update((b.key, b) for b in SMSRateLimit.objects.select_for_update().filter(key__in=missing))
+    return buckets
+
+
+def take(key, count, rate, capacity):
+    """
+    Take count tokens from a bucket. Returns 0 if they were taken, otherwise
+    the seconds to wait before trying again. A request larger than the
+    bucket is let through when the bucket is full and leaves it in debt,
+    which paces the requests after it.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        bucket = _locked_buckets([key], capacity, now)[key]
+        tokens = _refill(bucket, rate, capacity, now)
+        needed = min(count, capacity)
+        if tokens < needed:
+            return (needed - tokens) / rate
+        SMSRateLimit.objects.filter(key=key).update(tokens=tokens - count, updated_at=now)
+    return 0
+
+
+def acquire(key, count, rate, capacity, max_wait=None):
+    """Block until count tokens are taken (or max_wait seconds pass). Returns True if taken."""
+    deadline = None if max_wait is None else time.monotonic() + max_wait
+    while True:
+        wait = take(key, count, rate, capacity)
+        if not wait:
+            return True
+        if deadline is not None and time.monotonic() + wait > deadline:
+            return False
+        time.sleep(min(wait, 5))
+
+
+def provider_key(provider):
+    return f"provider:{provider.pk}"
+
+
+def acquire_provider(provider, count):
+    """Pace requests to the provider: wait until count messages may be sent."""
+    return acquire(provider_key(provider), count, PROVIDER_RATE, PROVIDER_BURST)
+
+
+def take_recipients(numbers):
+    """
+    Take one token per message from the bucket of each number, in one
+    transaction. numbers may repeat. Returns {number: (allowed, seconds to
+    wait)} for the numbers that cannot get all their messages now.
+    """
+    now = timezone.now()
+    rate = RECIPIENT_RATE_PER_HOUR / 3600
+    counts = Counter(numbers)
+    keys = {f"recipient:{number}": number for number in counts}
+    limited = {}
+    with transaction.atomic():
+        buckets = _locked_buckets(list(keys), RECIPIENT_BURST, now)
+        for key, bucket in buckets.items():
+            number = keys[key]
+            tokens = _refill(bucket, rate, RECIPIENT_BURST, now)
+            allowed = min(counts[number], int(tokens))
+            tokens -= allowed
+            if allowed < counts[number]:
+                limited[number] = (allowed, (1 - tokens) / rate)
+            bucket.tokens = tokens
+            bucket.updated_at = now
+        SMSRateLimit.objects.bulk_update(list(buckets.values()), ['tokens', 'updated_at'])
+    return limited
+
+
+def message_parts(message):
+    """Number of SMS parts: 160/153 characters for GSM text, 70/67 for Persian (UCS-2)."""
+    if all(ord(char) < 128 for char in message):
+        single, multi = 160, 153
+    else:
+        single, multi = 70, 67
+    length = len(message)
+    if length <= single:
+        return 1
+    return -(-length // multi)
+
+
+def message_cost(message, recipients=1):
+    return message_parts(message) * recipients * SMS_PART_COST
+
+
+def charge(provider, cost):
+    """Subtract sent parts from the locally tracked credit."""
+    SMSProvider.objects.filter(pk=provider.pk, credit__isnull=False).update(credit=F('credit') - cost)
+
+
+def credit_is_stale(provider):
+    return provider.credit_synced_at is None or timezone.now() - provider.credit_synced_at > CREDIT_SYNC_INTERVAL
+
+
+def sync_credit(provider, credit):
+    """Store credit reported by the gateway."""
+    credit = Decimal(str(credit))
+    provider.credit = credit
+    provider.credit_synced_at = timezone.now()
+    SMSProvider.objects.filter(pk=provider.pk).update(credit=credit, credit_synced_at=provider.credit_synced_at)
@@ -1,16 +1,24 @@
 import requests
 import json
+from urllib.parse import urljoin
 import logging
 import time
 import random
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 from .models import SMSProvider, SMSLog, SMSTemplate, SMSSettings
+from .throttle import sync_credit
+from . import templating
+
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from utils.http_session import CircuitOpenError, get_breaker, get_session
 
 # Import IPPanel SDK
 try:
     from ippanel import Client
     from ippanel import HTTPError, Error, ResponseCode
+    from ippanel import BASE_URL, CLIENT_VERSION, HTTPClient, Response
+    from ippanel.errors import parse_errors
     IPPANEL_AVAILABLE = True
 except ImportError:
     IPPANEL_AVAILABLE = False
@@ -18,6 +26,55 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+if IPPANEL_AVAILABLE:
+    class SessionHTTPClient(HTTPClient):
+        """
+        SDK HTTP client that goes through the shared session and circuit
+        breaker of its API key instead of a new connection per request
+        """
+        SUPPORTED_STATUS_CODES = (200, 201, 204, 400, 401, 403, 404, 405, 422, 500)
+
+        def __init__(self, apikey, base_url=None):
+            super().__init__(apikey, base_url or getattr(settings, 'IPPANEL_BASE_URL', BASE_URL), None, CLIENT_VERSION)
+            self.session = get_session(('ippanel', apikey))
+            self.breaker = get_breaker(('ippanel', apikey), 'IPPanel')
+
+        def req(self, method, url, data=None, params=None):
+            headers = {
+                "Content-Type": "application/json",
+                "Accept": "application/json",
+                "apikey": self.apikey,
+                "User-Agent": f"IPPanel/ApiClient/{self.client_version} Python",
+            }
+            try:
+                response = self.breaker.call(
+                    self.session.request,
+                    method,
+                    urljoin(self.base_url, url),
+                    headers=headers,
+                    params=params or {},
+                    data=json.dumps(data) if data is not None else None,
+                )
+                if response.status_code not in self.SUPPORTED_STATUS_CODES:
+                    response.raise_for_status()
+            except (requests.RequestException, CircuitOpenError) as e:
+                raise HTTPError(e)
+
+            parsed_response = Response(json.loads(response.content))
+            errors = parse_errors(parsed_response)
+            if isinstance(errors, Exception):
+                raise errors
+            return parsed_response
+
+_clients = {}
+
+def get_client(api_key):
+    """The SDK client for an API key, shared by all threads"""
+    client = _clients.get(api_key)
+    if client is None:
+        client = _clients[api_key] = Client(api_key, http_client=SessionHTTPClient(api_key))
+    return client
+
 class IPPanelSMSSender:
     """Utility class for sending SMS messages through IPPanel API using the official SDK"""
     
@@ -31,21 +88,22 @@ class IPPanelSMSSender:
         return settings
     
     @classmethod
-    def get_credit(cls):
-        """Get remaining credit from IPPanel"""
-        sms_settings = cls.get_settings()
-        if not sms_settings or not sms_settings.provider:
-            return {"status": "ERROR", "message": "No SMS provider configured"}
-        
-        provider = sms_settings.provider
+    def get_credit(cls, provider=None):
+        """Get remaining credit from IPPanel and store it as the provider's tracked credit"""
+        if provider is None:
+            sms_settings = cls.get_settings()
+            if not sms_settings or not sms_settings.provider:
+                return {"status": "ERROR", "message": "No SMS provider configured"}
+            provider = sms_settings.provider
         
         if not IPPANEL_AVAILABLE:
             return {"status": "ERROR", "message": "IPPanel SDK not installed"}
         
         try:
-            # Create client instance
-            sms = Client(provider.api_key)
+            # Shared client: pooled connections, timeouts, retries
+            sms = get_client(provider.api_key)
             credit = sms.get_credit()
+            sync_credit(provider, credit)
             
             return {
                 "status": "OK",
@@ -115,48 +173,10 @@ class IPPanelSMSSender:
             
             return {"status": "ERROR", "message": "IPPanel SDK not installed"}
         
-        # Check if this is a test/demo provider (by API key)
-        logger.info(f"Checking API key for simulation: '{provider.api_key[:20]}...'")
-        if provider.api_key == 'your-api-key-here' or provider.api_key.startswith('test-'):
-            logger.info("Using simulation mode for SMS sending")
-            # Simulate SMS sending for testing
-            message_id = f"sim_{int(time.time())}_{random.randint(1000, 9999)}"
-            
-            # Log the simulated send
-            log = SMSLog.objects.create(
-                sender=sender_user,
-                recipient_number=recipient_number,
-                recipient_user=recipient_user,
-                message=message,
-                template=template,
-                status='SENT',
-                message_id=message_id,
-                provider=provider
-            )
-            
-            logger.info(f"Simulated SMS sent to {recipient_number}: {message[:50]}...")
-            
-            return {
-                "status": "OK", 
-                "message_id": message_id,
-                "note": "This is a simulated SMS for testing purposes"
-            }
-        
-        logger.info("Using real IPPanel API")
-        print(f"Using real IPPanel API for {recipient_number}")
-        
-        # Format the phone number (remove any + prefix and ensure it starts with proper country code)
-        recipient_number = recipient_number.strip()
-        if recipient_number.startswith('+'):
-            recipient_number = recipient_number[1:]
-        
-        # Ensure number starts with country code (assuming Iran's country code 98)
-        if not recipient_number.startswith('98') and recipient_number.startswith('0'):
-            recipient_number = '98' + recipient_number[1:]
-        
-        # Use sender number from provider settings or default
-        originator = provider.sender_number if provider.sender_number else "+985000404223"
-        
+        # Format the phone number before it is logged, so logs show what was sent
+        if not cls.is_simulated(provider):
+            recipient_number = normalize_number(recipient_number)
+
         # Create log entry before trying to send
         log = SMSLog.objects.create(
             sender=sender_user,
@@ -167,124 +187,201 @@ class IPPanelSMSSender:
             status='PENDING',
             provider=provider
         )
-        
+
+        result = cls.deliver(provider, recipient_number, message)
+        if result["status"] == "OK":
+            log.status = 'SENT'
+            log.message_id = result["message_id"]
+        else:
+            log.status = 'FAILED'
+            log.error_message = result["message"]
+        log.save()
+
+        return result
+
+    @classmethod
+    def is_simulated(cls, provider):
+        """Test/demo providers (by API key) do not call the gateway"""
+        return provider.api_key == 'your-api-key-here' or provider.api_key.startswith('test-')
+
+    @classmethod
+    def deliver(cls, provider, recipient_numbers, message):
+        """
+        Send one message to one number or a list of numbers (a single
+        gateway request) without touching the database. Safe to call from
+        worker threads.
+
+        Returns:
+            dict: {"status": "OK", "message_id": ...} or {"status": "ERROR", "message": ...}
+        """
+        if isinstance(recipient_numbers, str):
+            recipient_numbers = [recipient_numbers]
+
+        if cls.is_simulated(provider):
+            logger.info("Using simulation mode for SMS sending")
+            message_id = f"sim_{int(time.time())}_{random.randint(1000, 9999)}"
+            logger.info(f"Simulated SMS sent to {len(recipient_numbers)} recipients: {message[:50]}...")
+            return {
+                "status": "OK",
+                "message_id": message_id,
+                "note": "This is a simulated SMS for testing purposes"
+            }
+
+        if not IPPANEL_AVAILABLE:
+            return {"status": "ERROR", "message": "IPPanel SDK not installed"}
+
+        recipient_numbers = [normalize_number(number) for number in recipient_numbers]
+
+        # Use sender number from provider settings or default
+        originator = provider.sender_number if provider.sender_number else "+985000404223"
+
         try:
-            # Create client instance
-            sms = Client(provider.api_key)
-            
-            # Log the request details for debugging
-            logger.info(f"Sending SMS to: {recipient_number}")
+            # Shared client: pooled connections, timeouts, retries
+            sms = get_client(provider.api_key)
+
+            logger.info(f"Sending SMS to {len(recipient_numbers)} recipients")
             logger.info(f"Originator: {originator}")
             logger.info(f"Message length: {len(message)}")
-            print(f"Sending SMS to: {recipient_number}")
-            print(f"Originator: {originator}")
-            print(f"Message: {message[:50]}...")
-            
+
             # Send the SMS using IPPanel SDK
             message_id = sms.send(
                 originator,           # originator
-                [recipient_number],   # recipients
+                recipient_numbers,    # recipients
                 message,              # message
                 "SMS sent from Dashboard"  # description
             )
-            
-            # Update log entry
-            log.status = 'SENT'
-            log.message_id = message_id
-            log.save()
-                    
-            logger.info(f"SMS sent successfully to {recipient_number}. Message ID: {message_id}")
-            print(f"SMS sent successfully to {recipient_number}. Message ID: {message_id}")
-            
+
+            logger.info(f"SMS sent successfully to {len(recipient_numbers)} recipients. Message ID: {message_id}")
+
             return {
-                "status": "OK", 
+                "status": "OK",
                 "message_id": message_id,
                 "message": "SMS sent successfully"
             }
-            
+
         except Error as e:
             # IPPanel SMS error
             error_msg = f"IPPanel error: {e.code}, {e.message}"
-            logger.error(error_msg)
-            print(error_msg)
-            
+
             # Handle specific error cases
             if e.code == ResponseCode.ErrUnprocessableEntity.value:
                 error_details = []
                 for field in e.message:
                     error_details.append(f"Field: {field}, Errors: {e.message[field]}")
                 error_msg = f"Validation error: {'; '.join(error_details)}"
-            
-            log.status = 'FAILED'
-            log.error_message = error_msg
-            log.save()
-            
+
+            logger.error(error_msg)
             return {"status": "ERROR", "message": error_msg}
-                
+
         except HTTPError as e:
             # HTTP error like network error, not found, etc.
             error_msg = f"HTTP error: {e}"
             logger.error(error_msg)
-            print(error_msg)
-            
-            log.status = 'FAILED'
-            log.error_message = error_msg
-            log.save()
-            
-            return {"status": "ERROR", "message": error_msg}
-                
+            cause = e.args[0] if e.args else None
+            # Rate limited (429) or circuit open: the message is fine, the gateway is not ready for it
+            throttled = (isinstance(cause, CircuitOpenError)
+                         or getattr(getattr(cause, 'response', None), 'status_code', None) == 429)
+            if throttled or never_sent(cause):
+                return {"status": "ERROR", "message": error_msg, "retryable": True, "throttled": throttled}
+            # Read timeouts, dropped connections and 5xx answers: the gateway may have taken it
+            return {"status": "ERROR", "message": f"{error_msg} (may have been sent, not retried)"}
+
         except json.JSONDecodeError as e:
             # JSON parsing error - likely empty or invalid response
-            error_msg = f"Invalid JSON response from API: {e}"
-            logger.error(error_msg)
-            print(error_msg)
-            
-            log.status = 'FAILED'
-            log.error_message = error_msg
-            log.save()
-            
+            logger.error(f"Invalid JSON response from API: {e}")
             return {"status": "ERROR", "message": "Invalid response from SMS service. Please check your API configuration."}
-            
+
         except Exception as e:
-            # Unexpected error
+            # Unexpected error: we cannot tell whether the gateway took the message, so do not resend it
             error_msg = f"Unexpected error: {e}"
             logger.error(error_msg)
-            print(error_msg)
-            
-            log.status = 'FAILED'
-            log.error_message = error_msg
-            log.save()
-            
             return {"status": "ERROR", "message": error_msg}
 
     @classmethod
-    def send_bulk_sms(cls, recipient_numbers, message, sender_user=None, template=None):
+    def fetch_statuses(cls, provider, message_id, page_size=100):
         """
-        Send SMS to multiple recipients
-        
+        Delivery status of every recipient of a sent message, without
+        touching the database. Raises the SDK's errors.
+
+        Returns:
+            dict: recipient number -> status reported by the gateway
+        """
+        sms = get_client(provider.api_key)
+        statuses = {}
+        page = 0
+        while True:
+            recipients, pagination = sms.fetch_statuses(message_id, page, page_size)
+            for recipient in recipients:
+                statuses[str(recipient.recipient)] = str(recipient.status or '')
+            # meta comes as a plain dict from the API (a PaginationInfo in some SDK versions)
+            if isinstance(pagination, dict):
+                total_pages = pagination.get('pages')
+            else:
+                total_pages = getattr(pagination, 'pages', None)
+            page += 1
+            if len(recipients) < page_size or not total_pages or page >= total_pages:
+                return statuses
+
+    @classmethod
+    def send_bulk_sms(cls, recipient_numbers, message, sender_user=None, template=None, recipient_users=None):
+        """
+        Send the same SMS to multiple recipients in chunked multi-recipient requests
+
         Args:
             recipient_numbers: List of phone numbers
             message: The message content
             sender_user: The user sending the message (optional)
             template: The template used for the message (optional)
-            
+            recipient_users: Dict of phone number -> User, used for the logs (optional)
+
         Returns:
-            dict: Response with status and details
+            dict: Response with status, per-number results and totals
         """
-        successful_sends = []
-        failed_sends = []
-        
-        for number in recipient_numbers:
-            result = cls.send_sms(number, message, sender_user, None, template)
-            if result["status"] == "OK":
-                successful_sends.append(number)
+        recipient_users = recipient_users or {}
+        numbers = list(dict.fromkeys(number.strip() for number in recipient_numbers if number and number.strip()))
+
+        sms_settings = cls.get_settings()
+        provider = sms_settings.provider if sms_settings else None
+        error = None
+        if not provider:
+            error = "No SMS provider configured"
+        elif not IPPANEL_AVAILABLE and not cls.is_simulated(provider):
+            error = "IPPanel SDK not installed"
+        if error:
+            logger.error(error)
+
+        results = {}
+        for chunk in chunks(numbers, SMS_CHUNK_SIZE):
+            if error:
+                result = {"status": "ERROR", "message": error}
             else:
-                failed_sends.append({"number": number, "error": result["message"]})
-        
+                result = cls.deliver(provider, chunk, message)
+            # One log row per number, written once per chunk (MySQL returns no ids from bulk_create)
+            SMSLog.objects.bulk_create([
+                SMSLog(
+                    sender=sender_user,
+                    recipient_number=number if error or cls.is_simulated(provider) else normalize_number(number),
+                    recipient_user=recipient_users.get(number),
+                    message=message,
+                    template=template,
+                    status='SENT' if result["status"] == "OK" else 'FAILED',
+                    message_id=result.get("message_id"),
+                    error_message=None if result["status"] == "OK" else result["message"],
+                    provider=provider,
+                )
+                for number in chunk
+            ])
+            results.update((number, result) for number in chunk)
+
+        successful_sends = [number for number in numbers if results[number]["status"] == "OK"]
+        failed_sends = [{"number": number, "error": results[number]["message"]}
+                        for number in numbers if results[number]["status"] != "OK"]
+
         return {
             "status": "OK" if len(successful_sends) > 0 else "ERROR",
             "successful": successful_sends,
             "failed": failed_sends,
+            "results": results,
             "total_sent": len(successful_sends),
             "total_failed": len(failed_sends)
         }
@@ -292,43 +389,72 @@ class IPPanelSMSSender:
 # Keep compatibility with existing code
 FarazSMSSender = IPPanelSMSSender
 
+# Recipients per gateway request for multi-recipient sends
+SMS_CHUNK_SIZE = getattr(settings, 'SMS_CHUNK_SIZE', 100)
+
+def chunks(items, size):
+    """Split a list into lists of at most size items"""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def never_sent(error):
+    """True if a requests error proves the request never reached the gateway (no connection was made)."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.ConnectionError):
+        return False
+    # A refused or unresolvable connection; "connection aborted" after sending is not one
+    reason = error.args[0] if error.args else None
+    reason = getattr(reason, 'reason', reason)
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+def normalize_number(recipient_number):
+    """Format a phone number for the gateway: no + prefix, Iran's country code 98 instead of a leading 0"""
+    recipient_number = recipient_number.strip()
+    if recipient_number.startswith('+'):
+        recipient_number = recipient_number[1:]
+    if not recipient_number.startswith('98') and recipient_number.startswith('0'):
+        recipient_number = '98' + recipient_number[1:]
+    return recipient_number
+
 def get_default_template(template_type):
-    """Get the default template for a given type"""
-    return SMSTemplate.objects.filter(type=template_type, is_default=True).first()
+    """Get the default template for a given type (cached briefly, see templating)"""
+    return templating.get_default_template(template_type)
 
 def format_project_outdated_message(project_name):
     """Format message for outdated project notification"""
-    template = get_default_template('PROJECT_OUTDATED')
-    if not template:
-        return f"با سلام وعرض ادب خدمت همکار گرامی لطفا به بروزسانی وضعیت پروژه {project_name} اقدام فرمایید"
-    
-    return template.content.replace('{name of project}', project_name)
+    message, _template = templating.render_default(
+        'PROJECT_OUTDATED',
+        "با سلام وعرض ادب خدمت همکار گرامی لطفا به بروزسانی وضعیت پروژه {project_name} اقدام فرمایید",
+        project_name=project_name,
+    )
+    return message
 
 def format_project_rejected_message(rejection_reason):
     """Format message for project rejection notification"""
-    template = get_default_template('PROJECT_REJECTED')
-    if not template:
-        return f"با سلام وعرض ادب خدمت همکار گرامی به دلیل زیر پروژه نیازمند اصلاح است {rejection_reason}"
-    
-    return template.content.replace('{reason of rejection}', rejection_reason)
+    message, _template = templating.render_default(
+        'PROJECT_REJECTED',
+        "با سلام وعرض ادب خدمت همکار گرامی به دلیل زیر پروژه نیازمند اصلاح است {rejection_reason}",
+        rejection_reason=rejection_reason,
+    )
+    return message
 
 def format_project_not_examined_message(project_name):
     """Format message for project not examined notification"""
-    template = get_default_template('PROJECT_NOT_EXAMINED')
-    if not template:
-        return f"با سلام وعرض ادب خدمت همکار گرامی لطفا به وضعیت پروژه {project_name} اقدام فرمایید"
-    
-    return template.content.replace('{name of project}', project_name)
+    message, _template = templating.render_default(
+        'PROJECT_NOT_EXAMINED',
+        "با سلام وعرض ادب خدمت همکار گرامی لطفا به وضعیت پروژه {project_name} اقدام فرمایید",
+        project_name=project_name,
+    )
+    return message
 
 def format_financing_approved_message(project_name, amount=None):
     """Format message for financing approved notification"""
-    template = get_default_template('FINANCING_APPROVED')
-    if not template:
-        if amount:
-            return f"با سلام وعرض ادب خدمت همکار گرامی تامین مالی پروژه {project_name} به مبلغ {amount} تأیید شد"
-        return f"با سلام وعرض ادب خدمت همکار گرامی تامین مالی پروژه {project_name} تأیید شد"
-    
-    content = template.content.replace('{name of project}', project_name)
     if amount:
-        content = content.replace('{amount}', str(amount))
-    return content 
\ No newline at end of file
+        fallback = "با سلام وعرض ادب خدمت همکار گرامی تامین مالی پروژه {project_name} به مبلغ {amount} تأیید شد"
+    else:
+        fallback = "با سلام وعرض ادب خدمت همکار گرامی تامین مالی پروژه {project_name} تأیید شد"
+    message, _template = templating.render_default(
+        'FINANCING_APPROVED', fallback, project_name=project_name, amount=amount or None,
+    )
+    return message
@@ -9,9 +9,12 @@ from django.utils import timezone
 from datetime import timedelta
 from django.views.decorators.csrf import csrf_exempt
 import json
+from django.core.exceptions import ValidationError
 
-from .models import SMSTemplate, SMSSettings, SMSLog, SMSProvider
+from .models import SMSTemplate, SMSSettings, SMSLog, SMSProvider, NotificationRuleRun
+from .rules import NOT_EXAMINED, OUTDATED, not_examined_projects, outdated_projects, request_run
 from .utils import IPPanelSMSSender
+from .templating import placeholder_help, validate_template_content
 from .forms import SMSTemplateForm, SMSSettingsForm, SendSMSForm, BulkSMSForm, SMSProviderForm
 from accounts.models import User
 from creator_project.models import Project
@@ -43,7 +46,7 @@ def sms_dashboard(request):
     recent_logs = SMSLog.objects.all()[:50]
     
     # Stats
-    total_sent = SMSLog.objects.filter(status='SENT').count()
+    total_sent = SMSLog.objects.filter(status__in=['SENT', 'DELIVERED']).count()
     total_failed = SMSLog.objects.filter(status='FAILED').count()
     
     context = {
@@ -67,7 +70,7 @@ def expert_sms_dashboard(request):
     recent_logs = SMSLog.objects.filter(sender=request.user)[:50]
     
     # Stats
-    total_sent = SMSLog.objects.filter(sender=request.user, status='SENT').count()
+    total_sent = SMSLog.objects.filter(sender=request.user, status__in=['SENT', 'DELIVERED']).count()
     total_failed = SMSLog.objects.filter(sender=request.user, status='FAILED').count()
     
     context = {
@@ -268,6 +271,11 @@ def manage_templates(request):
     
     context = {
         'templates': templates,
+        'outdated_placeholders': placeholder_help(SMSTemplate.PROJECT_OUTDATED),
+        'rejected_placeholders': placeholder_help(SMSTemplate.PROJECT_REJECTED),
+        'not_examined_placeholders': placeholder_help(SMSTemplate.PROJECT_NOT_EXAMINED),
+        'funding_placeholders': placeholder_help(SMSTemplate.FUNDING_REQUEST_APPROVED),
+        'all_placeholders': placeholder_help(),
     }
     
     return render(request, 'notifications_sms/templates.html', context)
@@ -322,7 +330,14 @@ def quick_edit_template(request):
         
         # Update template fields
         template.name = request.POST.get('name', template.name)
-        template.content = request.POST.get('content', template.content)
+        content = request.POST.get('content', template.content)
+        if content != template.content:
+            # Only edited content is checked, so old templates can still be renamed or made default
+            try:
+                validate_template_content(content, template.type)
+            except ValidationError as e:
+                return JsonResponse({'success': False, 'error': ' '.join(e.messages)})
+        template.content = content
         
         # Handle is_default checkbox
         is_default = request.POST.get('is_default') == 'on'
@@ -481,7 +496,10 @@ def send_bulk_sms(request):
                 users = users.filter(province=province)
             
             # Get phone numbers
-            phone_numbers = [user.phone_number for user in users if user.phone_number]
+            recipient_users = {}
+            for user in users.exclude(phone_number__isnull=True).exclude(phone_number=''):
+                recipient_users.setdefault(user.phone_number.strip(), user)
+            phone_numbers = list(recipient_users)
             
             if not phone_numbers:
                 messages.error(request, _('No users with phone numbers match the selected criteria.'))
@@ -492,9 +510,18 @@ def send_bulk_sms(request):
                 phone_numbers,
                 message,
                 sender_user=request.user,
-                template=None
+                template=None,
+                recipient_users=recipient_users
             )
             
+            if results['failed']:
+                failed_numbers = [failed['number'] for failed in results['failed']]
+                messages.warning(
+                    request,
+                    _('Sending failed for: %(numbers)s') % {'numbers': ', '.join(failed_numbers[:20])}
+                    + (f' (+{len(failed_numbers) - 20})' if len(failed_numbers) > 20 else '')
+                )
+            
             messages.success(
                 request, 
                 _('Sent %(success)s SMS messages successfully. %(failed)s failed.') % {
@@ -535,20 +562,9 @@ def alerts_dashboard(request):
     
     settings = SMSSettings.get_settings()
     
-    # Get counts for various alerts
-    # 1. Outdated projects
-    outdated_date = timezone.now() - timedelta(days=settings.outdated_project_days)
-    outdated_projects_count = Project.objects.filter(
-        updated_at__lt=outdated_date,
-        status__in=['ONGOING', 'PLANNED']
-    ).count()
-    
-    # 2. Unexamined projects
-    delay_date = timezone.now() - timedelta(days=settings.not_examined_days)
-    unexamined_count = SubProject.objects.filter(
-        assigned_expert__isnull=False,
-        last_expert_check__lt=delay_date
-    ).count()
+    # Get counts for various alerts (same queries the rules use)
+    outdated_projects_count = outdated_projects(settings).count()
+    unexamined_count = not_examined_projects(settings).count()
     
     # Get the templates
     outdated_template = SMSTemplate.objects.filter(
@@ -573,6 +589,7 @@ def alerts_dashboard(request):
         'outdated_template': outdated_template,
         'rejected_template': rejected_template,
         'not_examined_template': not_examined_template,
+        'recent_runs': NotificationRuleRun.objects.select_related('requested_by')[:10],
     }
     
     return render(request, 'notifications_sms/alerts_dashboard.html', context)
@@ -589,14 +606,12 @@ def send_outdated_alerts(request):
         messages.error(request, _('No active SMS provider configured.'))
         return redirect('alerts_dashboard')
     
-    # Use our command to send the alerts
-    from django.core.management import call_command
-    
-    try:
-        call_command('check_projects_and_send_sms')
-        messages.success(request, _('Outdated project alerts sent successfully.'))
-    except Exception as e:
-        messages.error(request, _(f'Error sending alerts: {str(e)}'))
+    # The notification scheduler sends them; the request only queues a run
+    run, created = request_run(OUTDATED, request.user)
+    if created:
+        messages.success(request, _('Outdated project alerts queued; they will be sent shortly.'))
+    else:
+        messages.info(request, _('Outdated project alerts are already queued.'))
     
     return redirect('alerts_dashboard')
 
@@ -612,14 +627,12 @@ def send_unexamined_alerts(request):
         messages.error(request, _('No active SMS provider configured.'))
         return redirect('alerts_dashboard')
     
-    # Use our command to send the alerts
-    from django.core.management import call_command
-    
-    try:
-        call_command('check_projects_and_send_sms')
-        messages.success(request, _('Unexamined project alerts sent successfully.'))
-    except Exception as e:
-        messages.error(request, _(f'Error sending alerts: {str(e)}'))
+    # The notification scheduler sends them; the request only queues a run
+    run, created = request_run(NOT_EXAMINED, request.user)
+    if created:
+        messages.success(request, _('Unexamined project alerts queued; they will be sent shortly.'))
+    else:
+        messages.info(request, _('Unexamined project alerts are already queued.'))
     
     return redirect('alerts_dashboard')
 
@@ -21,6 +21,7 @@ from creator_subproject.models import SubProject, SubProjectUpdateHistory
 from creator_subproject.views import parse_jalali_date
 from creator_review.models import ProjectReview, SubProjectReview
 from creator_program.models import Program
+from creator_project.map_boundaries import get_boundary_levels
 from .models import ProjectReport, SubProjectReport, GeneratedReport, SearchHistory, ProjectFinancialAllocation
 from .forms import ProjectReportForm, SubProjectReportForm
 
@@ -1594,7 +1595,8 @@ def projects_map_view(request):
         'provinces': provinces,
         'program_types': program_types,
         'selected_province': province,
-        'selected_type': program_type
+        'selected_type': program_type,
+        'boundary_levels': get_boundary_levels()
     }
     
     return render(request, 'reporter/projects_map.html', context)
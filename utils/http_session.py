@@ -0,0 +1,164 @@
+"""
+Pooled HTTP sessions and circuit breakers for external gateways.
+
+Every gateway (one per SMS provider API key) gets one shared
+requests.Session, so connections are kept alive and reused instead of
+doing a TLS handshake per message. Requests carry connect/read timeouts
+and failed connections are retried with exponential backoff; 5xx
+answers are retried only for GET, since a proxy error on a send does not
+mean the gateway did not take the message. A circuit breaker per gateway stops calling a gateway that keeps
+failing, so workers fail fast instead of hanging on it.
+"""
+import time
+import logging
+import threading
+import requests
+from http.cookiejar import DefaultCookiePolicy
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (5, 30)
+RETRIES = 3
+BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = (500, 502, 503, 504)
+# Methods whose reads and 5xx answers are retried; sends (POST) are not idempotent
+RETRY_METHODS = frozenset({'GET', 'HEAD'})
+POOL_SIZE = 20
+
+_sessions = {}
+_breakers = {}
+_lock = threading.Lock()
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a gateway whose circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Closed: calls go through. After failure_threshold consecutive failures
+    the circuit opens and calls fail immediately for reset_timeout seconds.
+    Then one trial call is let through (half-open): success closes the
+    circuit, failure opens it again.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=60):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def before_call(self):
+        with self._lock:
+            state = self.state
+            if state == self.OPEN or (state == self.HALF_OPEN and self.trial_running):
+                raise CircuitOpenError(f"{self.name} is unavailable, retrying in "
+                                       f"{self.reset_timeout - (time.monotonic() - self.opened_at):.0f}s")
+            if state == self.HALF_OPEN:
+                self.trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info("Circuit for %s closed", self.name)
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning("Circuit for %s opened after %d failures", self.name, self.failures)
+                self.opened_at = time.monotonic()
+
+    def call(self, func, *args, **kwargs):
+        """Run func through the breaker. Connection errors and 5xx answers count as failures."""
+        self.before_call()
+        try:
+            response = func(*args, **kwargs)
+        except requests.RequestException:
+            self.record_failure()
+            raise
+        if getattr(response, 'status_code', 200) >= 500:
+            self.record_failure()
+        else:
+            self.record_success()
+        return response
+
+
+class TimeoutSession(requests.Session):
+    """Session that applies a default timeout to every request."""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+def build_session(timeout=DEFAULT_TIMEOUT, retries=RETRIES, pool_size=POOL_SIZE):
+    session = TimeoutSession(timeout)
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        # A request whose answer was lost may have been sent: do not send it twice
+        read=0,
+        status=retries,
+        status_forcelist=RETRY_STATUSES,
+        # Connect errors are retried for every method (nothing was sent);
+        # 5xx answers only for idempotent requests
+        allowed_methods=RETRY_METHODS,
+        backoff_factor=BACKOFF_FACTOR,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    # The cookie jar is the only per-request mutable state; gateways are stateless
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    return session
+
+
+def get_session(key):
+    """The shared session for a gateway (e.g. provider API key)."""
+    session = _sessions.get(key)
+    if session is None:
+        with _lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _sessions[key] = build_session()
+    return session
+
+
+def get_breaker(key, name=None):
+    """The circuit breaker for a gateway."""
+    breaker = _breakers.get(key)
+    if breaker is None:
+        with _lock:
+            breaker = _breakers.get(key)
+            if breaker is None:
+                breaker = _breakers[key] = CircuitBreaker(name or 'gateway')
+    return breaker
@@ -1,13 +1,19 @@
-import requests
 import logging
+from django.conf import settings
+from utils.http_session import CircuitOpenError, get_breaker, get_session
 
 logger = logging.getLogger(__name__)
 
 class IPPanelClient:
-    BASE_URL = 'https://edge.ippanel.com/v1'
+    BASE_URL = getattr(settings, 'IPPANEL_EDGE_BASE_URL', 'https://edge.ippanel.com/v1')
+    # Recipients per request when sending one message to many numbers
+    MAX_RECIPIENTS = 100
     
     def __init__(self, api_key=None):
         self.api_key = api_key
+        # Shared per API key: pooled keep-alive connections, timeouts and retries
+        self.session = get_session(('ippanel-edge', api_key))
+        self.breaker = get_breaker(('ippanel-edge', api_key), 'IPPanel')
         
     def send_sms(self, recipient_numbers, message_text, sender_number=None):
         """
@@ -41,18 +47,35 @@ class IPPanelClient:
             if sender_number:
                 payload["sender"] = sender_number
                 
-            response = requests.post(
-                f"{self.BASE_URL}/api/acl/message/sms/send", 
-                json=payload, 
+            response = self.breaker.call(
+                self.session.post,
+                f"{self.BASE_URL}/api/acl/message/sms/send",
+                json=payload,
                 headers=headers
             )
             
             return response.json()
             
+        except CircuitOpenError as e:
+            logger.warning(f"SMS not sent: {str(e)}")
+            return {"error": str(e), "status": False}
         except Exception as e:
             logger.error(f"Error sending SMS: {str(e)}")
             return {"error": str(e), "status": False}
             
+    def send_bulk_sms(self, recipient_numbers, message_text, sender_number=None, chunk_size=None):
+        """
+        Send the same message to many recipients, MAX_RECIPIENTS per request
+
+        Yields:
+            (chunk, response) for each request, chunk being the numbers it was sent to
+        """
+        chunk_size = chunk_size or self.MAX_RECIPIENTS
+        recipient_numbers = list(recipient_numbers)
+        for i in range(0, len(recipient_numbers), chunk_size):
+            chunk = recipient_numbers[i:i + chunk_size]
+            yield chunk, self.send_sms(chunk, message_text, sender_number)
+
     def get_status(self, message_id):
         """
         Check the delivery status of a message
@@ -69,8 +92,9 @@ class IPPanelClient:
                 'Content-Type': 'application/json'
             }
             
-            response = requests.get(
-                f"{self.BASE_URL}/api/report/message/{message_id}", 
+            response = self.breaker.call(
+                self.session.get,
+                f"{self.BASE_URL}/api/report/message/{message_id}",
                 headers=headers
             )
             